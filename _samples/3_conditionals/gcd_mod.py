@@ -0,0 +1,9 @@
+a = int(input())
+b = int(input())
+
+while b != 0:
+    r = a % b
+    a = b
+    b = r
+
+print(a)
@@ -0,0 +1,170 @@
+import argparse
+import ast
+import math
+import tracemalloc
+from io import StringIO
+from time import perf_counter
+from rbs.Compiler import compile
+from rbs.common.PhaseTimer import PhaseTimer
+from rbs.common.Types import OptimizationLevel
+
+
+def process_cli():
+    """Process Command Line Interface options"""
+    parser = argparse.ArgumentParser(
+        description='Time each compile phase on synthetic programs of growing size, flagging the '
+                    'phases that scale worse than linearly')
+    parser.add_argument('--vary', default='functions', choices=['functions', 'globals', 'depth'],
+                        help='what grows from one program to the next')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 200, 400, 800],
+                        help='values taken by what grows')
+    parser.add_argument('--functions', type=int, default=100, help='number of functions')
+    parser.add_argument('--globals', type=int, default=1000, help='number of global variables')
+    parser.add_argument('--depth', type=int, default=3, help='nesting of the loops in functions')
+    parser.add_argument('-O', dest='level', default='2',
+                        choices=[level.value for level in OptimizationLevel])
+    parser.add_argument('--no-memory', default=False, action='store_true',
+                        help="don't measure memory (tracing allocations takes a while)")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='growth exponent above which a phase is flagged')
+    parser.add_argument('--emit', type=int, metavar='SIZE',
+                        help='only print the program generated with SIZE (see --vary)')
+    return parser.parse_args()
+
+
+def synthetic_program(functions: int, globals_count: int, depth: int) -> str:
+    '''
+    A program with the given number of functions, each with loops nested depth deep around an if
+    and a call to the previous function, and globals read from input, initialized statically or
+    computed from one another. Everything depends on input, so nothing is folded away
+    '''
+    lines = []
+    globals_count = max(3, globals_count)
+    for i in range(globals_count):
+        match i % 3:
+            case 0:
+                lines.append(f'g{i} = int(input())')
+            case 1:
+                lines.append(f'g{i} = {i % 100}')
+            case _:
+                lines.append(f'g{i} = g{i - 2} + {i % 7}')
+    lines.append('')
+
+    for f in range(functions):
+        lines += ['', f'def f{f}(p, q):', '    t = p']
+        indent = '    '
+        for level in range(depth):
+            lines += [f'{indent}i{level} = 0', f'{indent}while i{level} < q:']
+            indent += '    '
+        lines += [f'{indent}t = t + p',
+                  f'{indent}if t > 100:',
+                  f'{indent}    t = t - q',
+                  f'{indent}else:',
+                  f'{indent}    t = t + 1']
+        for level in reversed(range(depth)):
+            lines.append(f'{indent}i{level} = i{level} + 1')
+            indent = indent[:-4]
+        if f > 0:
+            lines.append(f'    t = f{f - 1}(t, q)')
+        lines.append('    return t')
+    lines.append('')
+
+    for f in range(functions):
+        # Globals read from input, so the calls can't be evaluated while compiling
+        g = f * 3 % (globals_count - globals_count % 3)
+        lines += [f'g{g} = f{f}(g{g}, 3)', f'print(g{g})']
+    return '\n'.join(lines) + '\n'
+
+
+def program_for(args, size: int) -> str:
+    sizes = {'functions': args.functions, 'globals': args.globals, 'depth': args.depth}
+    sizes[args.vary] = size
+    return synthetic_program(sizes['functions'], sizes['globals'], sizes['depth'])
+
+
+def measure(source: str, level: OptimizationLevel, memory: bool) -> PhaseTimer:
+    '''Times (and optionally traces the memory of) each phase of compiling source'''
+    timer = PhaseTimer()
+    if memory:
+        tracemalloc.start()
+    try:
+        with timer.phase('parsing'):
+            root = ast.parse(source)
+        compile(root, 'synthetic.py', StringIO(), level=level, timer=timer)
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return timer
+
+
+def growth(sizes: list[int], values: list[float]) -> float | None:
+    '''Exponent k of the least squares fit of values ~ size^k (1 is linear)'''
+    points = [(math.log(size), math.log(value)) for size, value in zip(sizes, values) if value > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if spread == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def main():
+    args = process_cli()
+    level = OptimizationLevel(args.level)
+    if args.emit is not None:
+        print(program_for(args, args.emit), end='')
+        return
+
+    sizes = sorted(args.sizes)
+    lines: list[int] = []
+    timings: list[PhaseTimer] = []
+    memory: list[PhaseTimer] = []
+    for size in sizes:
+        source = program_for(args, size)
+        lines.append(source.count('\n'))
+        start = perf_counter()
+        timings.append(measure(source, level, memory=False))
+        if not args.no_memory:
+            memory.append(measure(source, level, memory=True))
+        print(f'{args.vary} {size} ({lines[-1]} lines) in {perf_counter() - start:.1f}s')
+
+    # Growth is measured against the length of the programs, whatever made them longer
+    phases = list(timings[-1].phases)
+    flagged = []
+    print(f'\n{"lines":<16}' + ''.join(f'{count:>10}' for count in lines) + f'{"growth":>9}')
+    for phase in phases:
+        seconds = [timer.phases[phase].seconds if phase in timer.phases else 0.0
+                   for timer in timings]
+        if max(seconds) < 0.001:
+            continue
+        exponent = growth(lines, seconds)
+        print(f'{phase:<16}' + ''.join(f'{s * 1000:>8.1f}ms' for s in seconds) +
+              f'{exponent or 0:>9.2f}')
+        if exponent is not None and exponent > args.threshold:
+            flagged.append((phase, 'time', exponent))
+    totals = [sum(stats.seconds for stats in timer.phases.values()) for timer in timings]
+    print(f'{"total":<16}' + ''.join(f'{s * 1000:>8.1f}ms' for s in totals) +
+          f'{growth(lines, totals) or 0:>9.2f}')
+
+    if memory:
+        print(f'\n{"peak memory":<16}' + ''.join(f'{count:>10}' for count in lines))
+        for phase in phases:
+            peaks = [float(timer.phases[phase].peak_bytes) if phase in timer.phases else 0.0
+                     for timer in memory]
+            if max(peaks) < 64 * 1024:
+                continue
+            exponent = growth(lines, peaks)
+            print(f'{phase:<16}' + ''.join(f'{peak / 2**20:>8.1f}MB' for peak in peaks) +
+                  f'{exponent or 0:>9.2f}')
+            if exponent is not None and exponent > args.threshold:
+                flagged.append((phase, 'memory', exponent))
+
+    for phase, measured, exponent in flagged:
+        print(f'warning: the {measured} of {phase} grows as lines^{exponent:.2f}, '
+              f'worse than linear')
+
+
+if __name__ == '__main__':
+    main()
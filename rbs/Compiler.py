@@ -1,39 +1,186 @@
-from sys import stdout
+import ast
+import json
+import sys
+from functools import partial
 from .visitors.GlobalVariables import GlobalVariableExtraction
 from .visitors.TopLevelProgram import TopLevelProgram
 from .visitors.FunctionDefinition import FunctionDefinition
+from .visitors.FunctionSpecialization import FunctionSpecializer
+from .visitors.PureFunctions import PureFunctionEvaluator, PureCallFolding
+from .visitors.ConstantTables import ConstantTableFolding
+from .visitors.ConstantPropagator import LiteralFolding
+from .visitors.Inlining import HotCallInlining
 from .generators.StaticMemoryAllocation import StaticMemoryAllocation
 from .generators.LocalMemoryAllocation import LocalMemoryAllocation
 from .generators.EntryPoint import EntryPoint
+from .generators.AssemblyWriter import AssemblyWriter
+from .generators.ObjectCode import ObjectCode
+from .generators.MemoryReport import MemoryReport
+from .generators.CycleEstimate import CycleEstimate
+from .generators.Instrumentation import Instrumentation
+from .generators.Division import Division
 from .optimizers.Optimizer import Optimizer
-from .optimizers.passes.Peephole import peephole_double_load, peephole_nops
+from .optimizers.passes.Peephole import peephole_double_load
+from .optimizers.passes.Rules import peephole_rules
+from .optimizers.passes.ValueNumbering import local_value_numbering
+from .optimizers.passes.Outlining import outline_sequences
+from .common.Types import OptimizationLevel
+from .common.CostModel import CostModel
+from .common.CompileCache import CompileCache
+from .common.PhaseTimer import PhaseTimer
+from .common.Types import LabeledInstruction
+from .common.Utils import placeholder_labels, rename_labels
 
 
-def compile(root_node, input_file, output_file=stdout):
-    extractor = GlobalVariableExtraction()
-    extractor.visit(root_node)
-    identifier_labels = extractor.symbol_table
+def optimizer_for(level: OptimizationLevel, costs: CostModel) -> Optimizer:
+    '''The passes run over the generated instructions at each optimization level'''
+    passes = Optimizer(costs=costs)
+    if level == OptimizationLevel.O1:
+        passes.add_group(peephole_double_load, peephole_rules)
+    elif level in (OptimizationLevel.O2, OptimizationLevel.Os):
+        passes.add_group(peephole_double_load, peephole_rules,
+                         partial(local_value_numbering, costs=costs))
+    return passes
 
-    top_level = TopLevelProgram(identifier_labels, 'main')
-    top_level.visit(root_node)
 
-    functions = FunctionDefinition(identifier_labels, top_level.function_labels)
-    functions.visit(root_node)
+def optimize_function(passes: Optimizer, level: OptimizationLevel,
+                      instructions: list[LabeledInstruction],
+                      cache: CompileCache | None) -> list[LabeledInstruction]:
+    '''
+    Optimizes the instructions of a function, or reuses the result from the last time the same
+    instructions were generated (ex. only another function of the program was edited). Labels
+    are shared by the whole program, so code added before the function changes its labels: they
+    are replaced by placeholders in the cache, and the function's own labels put back
+    '''
+    names = placeholder_labels(instructions) if cache is not None else None
+    if cache is None or names is None:
+        return passes.optimize(instructions)
+    canonical = rename_labels(instructions, names)
+    key = cache.key('function', level.value, json.dumps(canonical))
+    cached = cache.get(key)
+    if cached is not None:
+        restored = rename_labels([(label, instr) for label, instr in json.loads(cached)],
+                                 {placeholder: name for name, placeholder in names.items()})
+        if restored is not None:
+            return restored
+    optimized = passes.optimize(instructions)
+    # Optimizations that add labels of their own can't be cached (their names may clash)
+    optimized_canonical = rename_labels(optimized, names)
+    if optimized_canonical is not None:
+        cache.put(key, json.dumps(optimized_canonical))
+    return optimized
 
-    static_mem = StaticMemoryAllocation(output_file, identifier_labels, extractor.results)
-    local_mem = LocalMemoryAllocation(output_file, functions.local_variables.items())
 
-    print(f'; Translating {input_file}', file=output_file)
-    print('; Branching to top level (main) instructions', file=output_file)
-    print('\t\tBR main', file=output_file)
-    static_mem.generate()
-    local_mem.generate()
+def compile(root_node, input_file, output_file=sys.stdout, level=OptimizationLevel.O2,
+            pass_stats=False, memory_report=False, instrument=False, cycle_estimate=False,
+            cache=None, timer=None, object_file=None, profile_generate=False, profile=None):
+    costs = CostModel(level)
+    phase = (timer or PhaseTimer()).phase
+    if level == OptimizationLevel.O0:
+        # No optimizations besides the constants code generation propagates and folds
+        profile = None
+    with phase('folding'):
+        root_node = LiteralFolding().visit(root_node)
+        if profile is not None and not costs.favors_size:
+            # Inlined calls trade size for speed, so only the ones that ran most often are
+            root_node = HotCallInlining(profile).inline(root_node)
+        evaluator = PureFunctionEvaluator(root_node)
+        if level != OptimizationLevel.O0:
+            root_node = PureCallFolding(evaluator).visit(root_node)
+    if level in (OptimizationLevel.O2, OptimizationLevel.Os):
+        with phase('specialization'):
+            # Clones trade size for speed, so only parameters that are always the same are bound
+            max_clones = 0 if costs.favors_size else 4
+            root_node = FunctionSpecializer(max_clones=max_clones).specialize(root_node)
+            # Specialized clones may themselves call pure functions with constant arguments
+            evaluator = PureFunctionEvaluator(root_node)
+            root_node = PureCallFolding(evaluator).visit(root_node)
+    with phase('folding'):
+        root_node = ConstantTableFolding(evaluator.evaluate).visit(root_node)
 
-    passes = Optimizer()
-    passes.add_pass(peephole_double_load)
-    passes.add_pass(peephole_nops)
+    with phase('code generation'):
+        extractor = GlobalVariableExtraction(evaluator.evaluate)
+        identifier_labels = extractor.symbol_table
+        instrumentation = Instrumentation(profiling=profile_generate) \
+            if instrument or profile_generate else None
+        top_level = TopLevelProgram(identifier_labels, 'main', evaluator.evaluate,
+                                    extractor.initial_values, instrumentation, profile)
 
-    ep = EntryPoint(output_file, passes.optimize(top_level.finalize()))
-    fs = EntryPoint(output_file, passes.optimize(functions.finalize()))
-    fs.generate()
-    ep.generate()
+        # A single traversal of the module: each statement declares its globals before the top
+        # level is generated from it, function bodies need every global so they come afterwards
+        function_nodes = []
+        for statement in root_node.body:
+            extractor.visit(statement)
+            top_level.visit(statement)
+            if isinstance(statement, ast.FunctionDef):
+                function_nodes.append(statement)
+
+        functions = FunctionDefinition(identifier_labels, top_level.function_labels,
+                                       evaluator.evaluate, extractor.constants, instrumentation,
+                                       profile)
+        for function_node in function_nodes:
+            functions.visit(function_node)
+
+    object_code = ObjectCode() if object_file is not None else None
+    writer = AssemblyWriter(output_file, object_code)
+    with phase('emission'):
+        static_mem = StaticMemoryAllocation(writer, identifier_labels, extractor.results)
+        local_mem = LocalMemoryAllocation(writer, functions.local_variables.items())
+
+        writer.line(f'; Translating {input_file}')
+        writer.line('; Branching to top level (main) instructions')
+        writer.labeled(None, 'BR main')
+        static_mem.generate()
+        local_mem.generate()
+        if instrumentation is not None:
+            instrumentation.generate(writer)
+        division = Division() if top_level.uses_division or functions.uses_division else None
+        if division is not None:
+            division.generate(writer)
+
+    passes = optimizer_for(level, costs)
+    # Repeated sequences anywhere in the program are shared when optimizing for size, and reports
+    # look at the whole program, otherwise instructions are written out as soon as they're ready
+    whole_program = costs.favors_size or memory_report or cycle_estimate
+    program: list[LabeledInstruction] = []
+
+    def emit(instructions: list[LabeledInstruction]):
+        if whole_program:
+            program.extend(instructions)
+        else:
+            with phase('emission'):
+                EntryPoint(writer, instructions).generate()
+
+    if division is not None:
+        emit(division.routine())
+    if instrumentation is not None:
+        emit(instrumentation.dump_routine())
+    for instructions in functions.function_instructions.values():
+        with phase('optimization'):
+            # Functions are optimized separately, so their results can be cached separately
+            optimized = optimize_function(passes, level, instructions, cache)
+        emit(optimized)
+    with phase('optimization'):
+        optimized = passes.optimize(top_level.finalize())
+    emit(optimized)
+
+    if costs.favors_size:
+        with phase('outlining'):
+            program = outline_sequences(program)
+    if whole_program:
+        with phase('emission'):
+            EntryPoint(writer, program).generate()
+    writer.flush()
+    if object_code is not None:
+        with phase('emission'):
+            object_code.generate(object_file)
+
+    with phase('reports'):
+        if pass_stats:
+            passes.report(sys.stderr)
+        if memory_report:
+            MemoryReport(sys.stderr, extractor.results, functions.local_variables,
+                         top_level.function_labels, program).generate()
+        if cycle_estimate:
+            CycleEstimate(sys.stderr, list(functions.local_variables), top_level.function_labels,
+                          top_level.loops | functions.loops, program).generate()
@@ -0,0 +1,100 @@
+import os
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+
+@lru_cache(maxsize=None)
+def compiler_version() -> str:
+    '''Hash of the compiler's sources (and rewrite tables), so any change invalidates the cache'''
+    digest = sha256()
+    package = Path(__file__).resolve().parent.parent
+    for path in sorted(package.rglob('*')):
+        if path.suffix in ('.py', '.json'):
+            digest.update(str(path.relative_to(package)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def default_cache_directory() -> Path:
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'rbs'
+
+
+class CompileCache:
+    """
+    Compiler output stored on disk under the hash of everything it depends on (content addressed).
+    When the entries grow past max_bytes, the least recently used are evicted
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+        # Bytes used by the entries, only measured once (when first storing something)
+        self.__used: int | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, *parts: str) -> str:
+        digest = sha256(compiler_version().encode())
+        for part in parts:
+            # Length prefixed, so different splits of the same text don't collide
+            digest.update(f'{len(part)}:'.encode())
+            digest.update(part.encode())
+        return digest.hexdigest()
+
+    def __path(self, key: str) -> Path:
+        return self.__directory / key[:2] / key
+
+    def get(self, key: str) -> str | None:
+        path = self.__path(key)
+        try:
+            text = path.read_text()
+            # Reading counts as a use for the eviction order
+            os.utime(path)
+        except OSError:
+            # Missing, or evicted by another process in the meantime
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        path = self.__path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Written to a temporary file first, so readers never see partial entries
+            with NamedTemporaryFile('w', dir=path.parent, delete=False) as f:
+                f.write(text)
+            os.replace(f.name, path)
+        except OSError:
+            # Caching is only an optimization, compiling still works without it
+            return
+        if self.__used is None:
+            self.__used = sum(size for _, size, _ in self.__entries())
+        else:
+            self.__used += len(text)
+        if self.__used > self.__max_bytes:
+            self.__evict()
+
+    def __entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.__directory.glob('*/*'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def __evict(self):
+        '''Removes the least recently used entries, down to 90% of the limit to avoid thrashing'''
+        entries = sorted(self.__entries())
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if used <= 0.9 * self.__max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            used -= size
+        self.__used = used
@@ -0,0 +1,83 @@
+from typing import Iterable
+from .Types import LabeledInstruction, OptimizationLevel
+from .Utils import split_instruction, ascii_bytes
+
+
+# Instructions without an operand specifier only take a single byte
+_unary_mnemonics = {
+    "STOP", "RET", "RETTR", "MOVSPA", "MOVFLGA", "MOVAFLG", "NOTA", "NOTX", "NEGA", "NEGX",
+    "ASLA", "ASLX", "ASRA", "ASRX", "ROLA", "ROLX", "RORA", "RORX", "NOP0", "NOP1",
+}
+
+# Memory reads needed to reach the operand in each addressing mode (pointers need an extra one)
+_operand_accesses = {"i": 0, "d": 1, "n": 2, "s": 1, "sf": 2, "x": 1, "sx": 1, "sfx": 2}
+
+# Traps are handled by the operating system, which runs many instructions of its own
+_trap_cycles = {"DECI": 200, "DECO": 100, "HEXO": 60, "STRO": 80, "NOP": 20}
+
+
+def instruction_size(instruction: str) -> int:
+    '''Number of bytes the instruction (or directive) occupies in memory'''
+    mnemonic, operand, _ = split_instruction(instruction)
+    if mnemonic == "" or mnemonic in (".EQUATE", ".END"):
+        return 0
+    if mnemonic == ".BLOCK":
+        assert operand is not None
+        return int(operand, 0)
+    if mnemonic == ".WORD":
+        return 2
+    if mnemonic == ".BYTE":
+        return 1
+    if mnemonic == ".ASCII":
+        return len(ascii_bytes(instruction))
+    return 1 if mnemonic in _unary_mnemonics else 3
+
+
+def instruction_cycles(instruction: str) -> int:
+    '''
+    Estimated cost of executing the instruction, counted in memory accesses: fetching the
+    instruction itself, then reaching (and possibly writing) its operand
+    '''
+    mnemonic, _, mode = split_instruction(instruction)
+    if mnemonic == "" or mnemonic.startswith("."):
+        return 0
+    cycles = instruction_size(instruction)
+    if mnemonic in _trap_cycles:
+        return cycles + _trap_cycles[mnemonic]
+    if mode is not None and not mnemonic.startswith(("BR", "CALL")):
+        cycles += 2 * _operand_accesses[mode]
+    if mnemonic in ("CALL", "RET"):
+        # Pushing or popping the return address
+        cycles += 2
+    return cycles
+
+
+class CostModel:
+    """Compares instruction sequences by size or speed, depending on the optimization level"""
+
+    def __init__(self, level: OptimizationLevel = OptimizationLevel.O2) -> None:
+        self.__level = level
+
+    @property
+    def level(self): return self.__level
+
+    @property
+    def favors_size(self) -> bool:
+        return self.__level == OptimizationLevel.Os
+
+    def size(self, instructions: Iterable[LabeledInstruction]) -> int:
+        return sum(instruction_size(instr) for _, instr in instructions)
+
+    def cycles(self, instructions: Iterable[LabeledInstruction]) -> int:
+        return sum(instruction_cycles(instr) for _, instr in instructions)
+
+    def cost(self, instructions: Iterable[LabeledInstruction]) -> tuple[int, int]:
+        '''Sortable cost, the criteria that matters most at this level comes first'''
+        instructions = list(instructions)
+        size, cycles = self.size(instructions), self.cycles(instructions)
+        return (size, cycles) if self.favors_size else (cycles, size)
+
+    def is_improvement(self,
+                       before: Iterable[LabeledInstruction],
+                       after: Iterable[LabeledInstruction]) -> bool:
+        return self.cost(after) < self.cost(before)
@@ -1,11 +1,11 @@
 from typing import NoReturn
-from sys import stderr
+import sys
 from ..common.Utils import is_array_ident
 import ast
 
 
 def compile_error(node: ast.AST, msg: str) -> NoReturn:
-    print(f"Error at Ln {node.lineno}, Col {node.col_offset+1}: {msg}", file=stderr)
+    print(f"Error at Ln {node.lineno}, Col {node.col_offset+1}: {msg}", file=sys.stderr)
     # NOTE: Errors could be accumulated and handled gracefully, we don't do this...
     # Currently, the first error encountered will terminate compilation
     exit(1)
@@ -28,10 +28,13 @@ def ensure_args(node: ast.Call, num_args: int):
 
 
 def ensure_condition(node: ast.expr):
-    if not isinstance(node, ast.Compare):
-        compile_error(node, "Conditional must be comparison")
-    if len(node.ops) != 1 or len(node.comparators) != 1:
-        compile_error(node, "Multiple comparison are not supported")
+    if isinstance(node, ast.BoolOp):
+        for value in node.values:
+            ensure_condition(value)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        ensure_condition(node.operand)
+    elif not isinstance(node, ast.Compare):
+        compile_error(node, "Conditional must be comparison (optionally with and, or, not)")
 
 
 def ensure_assign(node: ast.Assign):
@@ -42,8 +45,20 @@ def ensure_assign(node: ast.Assign):
         compile_error(node, f'Unsupported target: {var_name}')
 
 
-def ensure_array(node: ast.expr) -> int:
-    msg = "Only static initialization of arrays is supported (ex. [0] * 25)"
+def ensure_array(node: ast.expr, element_size: int = 2) -> int:
+    msg = "Only static initialization of arrays is supported (ex. [0] * 25 or [1, 4, 9])"
+    if isinstance(node, ast.List):
+        if len(node.elts) == 0:
+            compile_error(node, msg)
+        for elt in node.elts:
+            if not isinstance(elt, ast.Constant) or not isinstance(elt.value, int):
+                compile_error(elt, "Array elements must be known at compile time")
+            if element_size == 1 and not 0 <= elt.value <= 0xFF:
+                compile_error(elt, f"Array element {elt.value} does not fit in a byte")
+            if not -0x8000 <= elt.value <= 0xFFFF:
+                compile_error(elt, f"Array element {elt.value} does not fit in a word")
+        return len(node.elts)
+
     if not isinstance(node, ast.BinOp):
         compile_error(node, msg)
     if not isinstance(node.op, ast.Mult):
@@ -56,7 +71,6 @@ def ensure_array(node: ast.expr) -> int:
     if len(lst) != 1 or not isinstance(lst[0], ast.Constant) or lst[0].value != 0:
         compile_error(lhs, msg)
 
-    # TODO: Allow propagated constants as array sizes
     if not isinstance(rhs, ast.Constant):
         compile_error(rhs, msg)
 
@@ -0,0 +1,37 @@
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import perf_counter
+
+
+@dataclass
+class PhaseStats:
+    seconds: float = 0.0
+    # Peak memory allocated during the phase, only measured while tracemalloc is tracing
+    peak_bytes: int = 0
+
+
+class PhaseTimer:
+    """
+    Time taken by each phase of compilation, and the peak memory it allocated if tracemalloc is
+    tracing. Phases entered more than once (ex. emitting the output) add up
+    """
+
+    def __init__(self) -> None:
+        self.phases: dict[str, PhaseStats] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            start_bytes, _ = tracemalloc.get_traced_memory()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, PhaseStats())
+            stats.seconds += perf_counter() - start
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                stats.peak_bytes = max(stats.peak_bytes, peak - start_bytes)
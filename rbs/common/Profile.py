@@ -0,0 +1,75 @@
+from dataclasses import dataclass, field
+
+
+# What each counter of a profiling build counts, by line (compound statements and assignments
+# calling a function don't share lines, so the lines stay meaningful across recompilations)
+def loop_key(line: int) -> str:
+    return f'loop at line {line}'
+
+
+def loop_entry_key(line: int) -> str:
+    return f'entries to loop at line {line}'
+
+
+def then_key(line: int) -> str:
+    return f'then at line {line}'
+
+
+def else_key(line: int) -> str:
+    return f'else at line {line}'
+
+
+def call_key(line: int) -> str:
+    return f'call at line {line}'
+
+
+# Entries to the code calls are made from: the program itself, or a function
+def run_key() -> str:
+    return 'runs of the program'
+
+
+def function_key(name: str) -> str:
+    return f'calls to {name}'
+
+
+@dataclass
+class Profile:
+    """
+    Execution counts from a run of a program built with --profile-generate, by what was counted.
+    Counters with the same description (ex. within specialized clones of a function) add up
+    """
+
+    counts: dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def parse(cls, text: str) -> 'Profile':
+        '''
+        Reads the tables the program printed before stopping (after its own output). The output
+        of several runs can be saved together, their counts add up
+        '''
+        tables = text.split('profile:\n')[1:]
+        if len(tables) == 0:
+            raise ValueError('No profile found (was the program built with --profile-generate?)')
+        counts: dict[str, int] = {}
+        for line in '\n'.join(tables).splitlines():
+            description, separator, count = line.rpartition(': ')
+            description, count = description.strip(), count.strip()
+            if separator == '' or not count.isdigit():
+                continue
+            counts[description] = counts.get(description, 0) + int(count)
+        return cls(counts)
+
+    def count(self, description: str) -> int:
+        return self.counts.get(description, 0)
+
+    def entries(self, function: str | None) -> int:
+        '''How often the function (with its specialized clones) or the program (None) ran'''
+        if function is None:
+            return self.count(run_key())
+        key = function_key(function)
+        return sum(count for description, count in self.counts.items()
+                   if description == key or description.startswith(key + '('))
+
+    def is_hot(self, description: str, other: str) -> bool:
+        '''Whether the first counter ran more often than the other'''
+        return self.count(description) > self.count(other)
@@ -7,15 +7,24 @@ from dataclasses import dataclass, field
 LabeledInstruction: TypeAlias = tuple[str | None, str]
 
 
+class OptimizationLevel(Enum):
+    O0 = '0'  # Instructions are emitted as generated (code generation still folds constants)
+    O1 = '1'  # Cheap local optimizations
+    O2 = '2'  # Every optimization, favoring speed
+    Os = 's'  # Every optimization that doesn't grow the program, favoring size
+
+
 class InitKind(Enum):
     BLOCK = 1
     EQUATE = 2
     WORD = 3
+    BYTE = 4
 
 
 # The string contains the identifier, and InitKind specifies how the global variable is allocated
-# The int holds the value to follow the InitKind directive (either a value, or number of bytes)
-GlobalVariable: TypeAlias = tuple[str, InitKind, int]
+# The int holds the value to follow the InitKind directive (either a value, or number of bytes),
+# a list holds the values of a statically initialized array (one .WORD or .BYTE each)
+GlobalVariable: TypeAlias = tuple[str, InitKind, int | list[int]]
 
 # The string is the label name, followed by the stack offset then the array size (size=1 is scalar)
 LocalVariable: TypeAlias = tuple[str, int, int]
@@ -30,5 +39,20 @@ class CallFrame:
     def __iter__(self): yield from (self.locals, self.stack_space)
 
 
+@dataclass
+class LoopInfo:
+    line: int
+    # Iterations, if the loop counts with a single variable between bounds known at compile time
+    trip_count: int | None = None
+
+
 # A pass is a function that takes a list of instructions and returns a new (modified) list
 OptimizationPass: TypeAlias = Callable[[list[LabeledInstruction]], list[LabeledInstruction]]
+
+
+@dataclass
+class PassStatistics:
+    runs: int = 0
+    instructions_removed: int = 0
+    bytes_saved: int = 0
+    seconds: float = 0.0
@@ -1,7 +1,8 @@
 import ast
+import re
 from itertools import product
 from string import ascii_uppercase
-from typing import Iterator
+from typing import Iterable, Iterator, Sequence
 
 
 def is_constant_ident(s: str) -> bool:
@@ -12,6 +13,27 @@ def is_array_ident(s: str) -> bool:
     return s[-1] == '_'
 
 
+def is_byte_array_ident(s: str) -> bool:
+    return s.endswith('__')
+
+
+def element_size(ident: str) -> int:
+    '''Bytes taken by each element of an array (or by a scalar)'''
+    return 1 if is_byte_array_ident(ident) else 2
+
+
+def to_word(value: int) -> int:
+    '''Wraps a value around to a signed 16-bit word, like Pep/9 arithmetic does'''
+    return (value + 0x8000) % 0x10000 - 0x8000
+
+
+def array_initializer(node: ast.expr) -> list[int] | None:
+    '''The elements of an array literal (ex. [1, 4, 9]), None if the array is zero initialized'''
+    if not isinstance(node, ast.List):
+        return None
+    return [elt.value for elt in node.elts]  # type: ignore
+
+
 def next_name_generator(n: int) -> Iterator[str]:
     return ("".join(s) for s in product(ascii_uppercase, repeat=n))
 
@@ -23,7 +45,153 @@ def reversed_next_name_generator(n: int) -> Iterator[str]:
 def assign_from_augassign(node: ast.AugAssign):
     return ast.Assign(targets=[node.target], value=ast.BinOp(
             left=node.target,
-            op=ast.Add(),
+            op=node.op,
             right=node.value
         )
     )
+
+
+def assigned_names(statements: Iterable[ast.AST],
+                   memo: dict[ast.AST, frozenset[str]] | None = None) -> set[str]:
+    '''
+    Every identifier assigned to (as a whole) within the statements. Given a memo, the names of
+    each statement are only gathered once, so nested loops don't walk their bodies again
+    '''
+    names: set[str] = set()
+    for statement in statements:
+        names |= _assigned_in(statement, memo)
+    return names
+
+
+def _assigned_in(statement: ast.AST, memo: dict[ast.AST, frozenset[str]] | None) -> frozenset[str]:
+    if memo is not None and statement in memo:
+        return memo[statement]
+    if isinstance(statement, ast.Assign):
+        names = frozenset(target.id for target in statement.targets
+                          if isinstance(target, ast.Name))
+    elif isinstance(statement, ast.AugAssign):
+        names = frozenset([statement.target.id] if isinstance(statement.target, ast.Name) else [])
+    else:
+        # Assignments are statements, so only the bodies of compound statements can hold them
+        found: set[str] = set()
+        for _, value in ast.iter_fields(statement):
+            if isinstance(value, list):
+                for child in value:
+                    if isinstance(child, ast.stmt):
+                        found |= _assigned_in(child, memo)
+        names = frozenset(found)
+    if memo is not None:
+        memo[statement] = names
+    return names
+
+
+# Conditional branches (and friends) observe the status bits set by earlier instructions
+_flag_readers = ("BRLE", "BRLT", "BREQ", "BRNE", "BRGE", "BRGT", "BRV", "BRC",
+                 "ROLA", "ROLX", "RORA", "RORX", "MOVFLGA")
+_flag_writers = ("ADD", "SUB", "CPW")
+
+
+def flags_live(instructions: Sequence[tuple[str | None, str]], index: int) -> bool:
+    '''Could the status bits set at instructions[index] be observed by a later instruction'''
+    for position in range(index + 1, len(instructions)):
+        label, instr = instructions[position]
+        mnemonic, _, _ = split_instruction(instr)
+        if mnemonic in (".END", "RET"):
+            # Callers always compare again before branching, so nothing reads them after a call
+            return False
+        if label is not None or mnemonic == "CALL" or mnemonic.startswith(_flag_readers):
+            return True
+        if mnemonic.startswith(_flag_writers):
+            # Every status bit is overwritten before being read
+            return False
+    return True
+
+
+def split_instruction(instr: str) -> tuple[str, str | None, str | None]:
+    '''Splits a mnemonic into its opcode, operand and addressing mode (ignoring comments)'''
+    code = instr.split(';', 1)[0].split(None, 1)
+    if len(code) == 0:
+        return '', None, None
+    if len(code) == 1:
+        return code[0], None, None
+    operand, _, mode = code[1].partition(',')
+    return code[0], operand.strip(), mode.strip() or None
+
+
+# Characters escaped within .ASCII strings, besides hexadecimal bytes (\xFF)
+_ascii_escapes = {'n': 10, 't': 9, 'b': 8, 'f': 12, 'r': 13, 'v': 11, '0': 0,
+                  '\\': 92, '"': 34, "'": 39}
+
+
+def ascii_bytes(instr: str) -> bytes:
+    '''The bytes of the string given to an .ASCII directive, escape sequences decoded'''
+    text = instr[instr.index('"') + 1:instr.rindex('"')]
+    decoded = bytearray()
+    idx = 0
+    while idx < len(text):
+        if text[idx] != '\\':
+            decoded.append(ord(text[idx]))
+            idx += 1
+        elif text[idx + 1] == 'x':
+            decoded.append(int(text[idx + 2:idx + 4], 16))
+            idx += 4
+        else:
+            decoded.append(_ascii_escapes[text[idx + 1]])
+            idx += 2
+    return bytes(decoded)
+
+
+def split_routines(instructions: Iterable[tuple[str | None, str]],
+                   entries: set[str]) -> dict[str, list[tuple[str | None, str]]]:
+    '''Splits a program at the given entry labels, anything before the first entry is dropped'''
+    routines: dict[str, list[tuple[str | None, str]]] = {}
+    current: list[tuple[str | None, str]] | None = None
+    for label, instr in instructions:
+        if label in entries:
+            current = routines.setdefault(label, [])
+        if current is not None:
+            current.append((label, instr))
+    return routines
+
+
+# Identifiers within instructions, and labels mentioned in comments (ex. #ZZZZZZZY)
+_identifier = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_mentioned = re.compile(r'#([A-Za-z_][A-Za-z0-9_]*)')
+_placeholder = re.compile(r'\$[0-9]+')
+
+
+def placeholder_labels(instructions: Iterable[tuple[str | None, str]]) -> dict[str, str] | None:
+    '''
+    Placeholders ($0, $1, ...) for every label the instructions define, reference or mention, in
+    order of appearance. None if the instructions already contain $, which would be ambiguous
+    '''
+    names: dict[str, str] = {}
+    for label, instr in instructions:
+        if '$' in instr:
+            return None
+        _, operand, _ = split_instruction(instr)
+        found = [label] if label is not None else []
+        if operand is not None and _identifier.fullmatch(operand):
+            found.append(operand)
+        found += _mentioned.findall(instr)
+        for name in found:
+            names.setdefault(name, f'${len(names)}')
+    return names
+
+
+def rename_labels(instructions: Iterable[tuple[str | None, str]],
+                  names: dict[str, str]) -> list[tuple[str | None, str]] | None:
+    '''
+    The instructions with their labels renamed (to or from placeholders), None if one of them has
+    no new name
+    '''
+    pattern = _placeholder if any(name.startswith('$') for name in names) else _identifier
+    renamed: list[tuple[str | None, str]] = []
+    for label, instr in instructions:
+        _, operand, _ = split_instruction(instr)
+        if label is not None and label not in names \
+                or operand is not None and pattern.fullmatch(operand) and operand not in names:
+            return None
+        renamed.append((names[label] if label is not None else None,
+                        pattern.sub(lambda match: names.get(match[0], match[0]), instr)))
+    return renamed
@@ -0,0 +1,54 @@
+from typing import Iterable
+from ..common.Types import LabeledInstruction
+from .ObjectCode import ObjectCode
+
+
+class AssemblyWriter():
+    """
+    Formats the assembly into a buffer that is written to the output in large chunks, rather than
+    with a print() per line (slow for large programs, especially to pipes). Nothing is guaranteed
+    to be written before flush(). Every line but comments is also added to the object code, if any
+    """
+
+    def __init__(self, output, object_code: ObjectCode | None = None,
+                 chunk_size: int = 1 << 16) -> None:
+        self.__output = output
+        self.__object_code = object_code
+        self.__chunk_size = chunk_size
+        self.__buffer: list[str] = []
+        self.__buffered = 0
+
+    def write(self, text: str):
+        self.__buffer.append(text)
+        self.__buffered += len(text)
+        if self.__buffered >= self.__chunk_size:
+            self.flush()
+
+    def line(self, text: str):
+        self.write(text + '\n')
+
+    def labeled(self, label: str | None, text: str):
+        '''A line with a label (or none), aligned like every other'''
+        if self.__object_code is not None:
+            self.__object_code.add([(label, text)])
+        self.write(f'{label + ":":<9}\t{text}\n' if label is not None else f'\t\t{text}\n')
+
+    def continued(self, texts: Iterable[str]):
+        '''Unlabeled lines continuing the one before (ex. the elements of an array)'''
+        texts = list(texts)
+        if self.__object_code is not None:
+            self.__object_code.add((None, text) for text in texts)
+        self.write(''.join(f'{"":<9}\t{text}\n' for text in texts))
+
+    def instructions(self, instructions: Iterable[LabeledInstruction]):
+        if self.__object_code is not None:
+            instructions = list(instructions)
+            self.__object_code.add(instructions)
+        self.write(''.join(f'{label + ":":<9}\t{instr}\n' if label is not None else f'\t\t{instr}\n'
+                           for label, instr in instructions))
+
+    def flush(self):
+        if len(self.__buffer) > 0:
+            self.__output.write(''.join(self.__buffer))
+            self.__buffer.clear()
+            self.__buffered = 0
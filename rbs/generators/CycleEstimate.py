@@ -0,0 +1,145 @@
+from ..common.Types import LabeledInstruction, LoopInfo
+from ..common.SymbolTable import SymbolTable
+from ..common.CostModel import instruction_cycles
+from ..common.Utils import split_instruction, split_routines
+
+
+# A basic block: the index of its first instruction, and one past its last
+_Block = tuple[int, int]
+
+
+def _basic_blocks(routine: list[LabeledInstruction]) -> list[_Block]:
+    '''Blocks start at labels (branch targets) and end after branches'''
+    blocks: list[_Block] = []
+    start = 0
+    for idx, (label, instr) in enumerate(routine):
+        if label is not None and idx > start:
+            blocks.append((start, idx))
+            start = idx
+        mnemonic, _, _ = split_instruction(instr)
+        if mnemonic.startswith("BR") or mnemonic in ("RET", "STOP"):
+            blocks.append((start, idx + 1))
+            start = idx + 1
+    if start < len(routine):
+        blocks.append((start, len(routine)))
+    return blocks
+
+
+def _back_edges(routine: list[LabeledInstruction]) -> dict[str, int]:
+    '''Loops by the label of their first instruction, with the index of their last'''
+    positions: dict[str, int] = {}
+    loops: dict[str, int] = {}
+    for idx, (label, instr) in enumerate(routine):
+        if label is not None:
+            positions[label] = idx
+        mnemonic, operand, _ = split_instruction(instr)
+        if mnemonic.startswith("BR") and operand in positions:
+            loops[operand] = idx
+    # Outer loops first
+    return dict(sorted(loops.items(), key=lambda loop: positions[loop[0]]))
+
+
+class CycleEstimate():
+    """
+    Estimates the cycles (see CostModel) taken by every function and loop without running the
+    program. Basic blocks are weighted by the trip counts of the loops around them, either known
+    at compile time or assumed, and calls add the estimate of the callee. Both branches of an if
+    are counted, so it errs on the high side
+    """
+
+    def __init__(self,
+                 output,
+                 function_names: list[str],
+                 function_labels: SymbolTable,
+                 loops: dict[str, LoopInfo],
+                 program: list[LabeledInstruction],
+                 entry_point: str = 'main',
+                 default_trips: int = 10) -> None:
+        self.__output = output
+        self.__loops = loops
+        self.__entry_point = entry_point
+        self.__default_trips = default_trips
+        self.__labels = [entry_point] + [function_labels[name] for name in function_names]
+        self.__names = {function_labels[name]: name for name in function_names}
+        self.__names[entry_point] = entry_point
+
+        # Subroutines (ex. outlined sequences) are only reported as part of their callers
+        calls = [split_instruction(instr) for _, instr in program]
+        entries = {entry_point} | {str(operand) for mnemonic, operand, _ in calls
+                                   if mnemonic == "CALL"}
+        self.__routines = split_routines(program, entries)
+        self.__totals: dict[str, int] = {}
+        self.__recursive: set[str] = set()
+        self.__active: list[str] = []
+
+    def __trips(self, label: str) -> int:
+        info = self.__loops.get(label)
+        if info is None or info.trip_count is None:
+            return self.__default_trips
+        return info.trip_count
+
+    def __weights(self, routine: list[LabeledInstruction]) -> list[int]:
+        '''How many times each instruction runs per call, based on the loops around it'''
+        weights = [1] * len(routine)
+        positions = {label: idx for idx, (label, _) in enumerate(routine) if label is not None}
+        for label, end in _back_edges(routine).items():
+            for idx in range(positions[label], end + 1):
+                weights[idx] *= self.__trips(label)
+        return weights
+
+    def __block_cycles(self, routine: list[LabeledInstruction], block: _Block) -> int:
+        cycles = 0
+        for _, instr in routine[block[0]:block[1]]:
+            cycles += instruction_cycles(instr)
+            mnemonic, operand, _ = split_instruction(instr)
+            if mnemonic == "CALL" and operand is not None:
+                cycles += self.__total(operand)
+        return cycles
+
+    def __total(self, label: str) -> int:
+        '''Cycles per call of a routine, including its callees'''
+        if label in self.__totals:
+            return self.__totals[label]
+        if label in self.__active:
+            # Recursive calls only count the call itself
+            self.__recursive.update(self.__active[self.__active.index(label):])
+            return 0
+        routine = self.__routines.get(label, [])
+        self.__active.append(label)
+        weights = self.__weights(routine)
+        total = sum(self.__block_cycles(routine, block) * weights[block[0]]
+                    for block in _basic_blocks(routine))
+        self.__active.pop()
+        self.__totals[label] = total
+        return total
+
+    def __loop_cycles(self, routine: list[LabeledInstruction],
+                      label: str, end: int) -> tuple[int, int]:
+        '''Cycles per call of the routine spent in the loop, and those per iteration'''
+        weights = self.__weights(routine)
+        start = next(idx for idx, (lbl, _) in enumerate(routine) if lbl == label)
+        total = sum(self.__block_cycles(routine, block) * weights[block[0]]
+                    for block in _basic_blocks(routine) if start <= block[0] <= end)
+        return total, total // max(weights[start], 1)
+
+    def generate(self):
+        out = self.__output
+        print('Cycle estimate (per call, including callees)', file=out)
+        for label in self.__labels:
+            if label not in self.__routines:
+                continue
+            total = self.__total(label)
+            recursion = ' plus recursive calls' if label in self.__recursive else ''
+            print(f'  {self.__names[label]:<22}{total:>10}{recursion}', file=out)
+
+            routine = self.__routines[label]
+            for loop, end in _back_edges(routine).items():
+                info = self.__loops.get(loop)
+                if info is None:
+                    # Loops emitted for a single statement (ex. a variable shift)
+                    continue
+                trips = self.__trips(loop)
+                known = '' if info.trip_count is not None else ', assumed'
+                loop_total, iteration = self.__loop_cycles(routine, loop, end)
+                print(f'    {f"loop at line {info.line}":<20}{loop_total:>10} '
+                      f'({trips} iterations{known}, {iteration} each)', file=out)
@@ -0,0 +1,90 @@
+from ..common.Types import LabeledInstruction
+from .AssemblyWriter import AssemblyWriter
+
+
+class Division():
+    """
+    Signed floor division (// and %) as a shared subroutine, emitted once if any division needs it.
+    The dividend is passed in A and the divisor in X, the quotient is returned in A and the
+    remainder is left in a static word. Magnitudes are divided in 16 shift-subtract steps, then the
+    signs are fixed to round towards minus infinity like Python does. Dividing by zero gives
+    meaningless values
+    """
+
+    label = 'DIVIDE'
+    remainder = 'DIVR'
+
+    @classmethod
+    def call(cls, remainder: bool) -> list[str]:
+        '''Instructions dividing A by X, leaving the quotient (or the remainder) in A'''
+        if remainder:
+            return [f'CALL {cls.label}', f'LDWA {cls.remainder},d']
+        return [f'CALL {cls.label}']
+
+    def routine(self) -> list[LabeledInstruction]:
+        r = self.remainder
+        return [
+            (self.label, 'STWX DIVB,d ; divisor'),
+            (None, 'STWA DIVA,d ; dividend'),
+            # Divide the magnitudes (as unsigned words, so -32768 fits)
+            (None, 'CPWA 0,i'),
+            (None, 'BRGE DIV1'),
+            (None, 'NEGA'),
+            ('DIV1', 'STWA DIVQ,d'),
+            (None, 'LDWA DIVB,d'),
+            (None, 'BRGE DIV2'),
+            (None, 'NEGA'),
+            ('DIV2', 'STWA DIVD,d'),
+            (None, 'LDWA 0,i'),
+            (None, f'STWA {r},d'),
+            (None, 'LDWX 16,i'),
+            # Shift the next bit of the dividend into the remainder, the quotient takes its place
+            ('DIV3', 'LDWA DIVQ,d'),
+            (None, 'ASLA'),
+            (None, 'STWA DIVQ,d'),
+            (None, f'LDWA {r},d'),
+            (None, 'ROLA'),
+            (None, f'STWA {r},d'),
+            # Subtract the divisor if it fits (no borrow)
+            (None, 'SUBA DIVD,d'),
+            (None, 'BRC DIV4'),
+            (None, 'BR DIV5'),
+            ('DIV4', f'STWA {r},d'),
+            (None, 'LDWA DIVQ,d'),
+            (None, 'ORA 1,i'),
+            (None, 'STWA DIVQ,d'),
+            ('DIV5', 'SUBX 1,i'),
+            (None, 'BRNE DIV3'),
+            # The remainder takes the sign of the dividend, then the quotient is negated if
+            # the signs differ
+            (None, 'LDWA DIVA,d'),
+            (None, 'BRGE DIV6'),
+            (None, f'LDWA {r},d'),
+            (None, 'NEGA'),
+            (None, f'STWA {r},d'),
+            (None, 'LDWA DIVB,d'),
+            (None, 'BRLT DIV8'),
+            (None, 'BR DIV7'),
+            ('DIV6', 'LDWA DIVB,d'),
+            (None, 'BRGE DIV8'),
+            ('DIV7', 'LDWA DIVQ,d'),
+            (None, 'NEGA'),
+            (None, 'STWA DIVQ,d'),
+            # Round towards minus infinity, the remainder then takes the sign of the divisor
+            (None, f'LDWA {r},d'),
+            (None, 'BREQ DIV8'),
+            (None, 'ADDA DIVB,d'),
+            (None, f'STWA {r},d'),
+            (None, 'LDWA DIVQ,d'),
+            (None, 'SUBA 1,i'),
+            (None, 'STWA DIVQ,d'),
+            ('DIV8', 'LDWA DIVQ,d'),
+            (None, 'RET'),
+        ]
+
+    def generate(self, output: AssemblyWriter):
+        output.line('; Division routine')
+        for label, description in (('DIVA', 'dividend'), ('DIVB', 'divisor'),
+                                   ('DIVD', 'divisor magnitude'), ('DIVQ', 'quotient'),
+                                   (self.remainder, 'remainder')):
+            output.labeled(label, f'{".WORD 0":<14}; {description}')
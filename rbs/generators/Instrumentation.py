@@ -0,0 +1,87 @@
+from ..common.Types import LabeledInstruction
+from .AssemblyWriter import AssemblyWriter
+
+
+class Instrumentation():
+    """
+    Counters incremented by instrumented programs (function calls and loop iterations), and the
+    subroutine printing them as a table before the program stops. When profiling (for
+    --profile-use), the arms of ifs, loop entries and call sites are counted too
+    """
+
+    # DECO prints signed words, counts above 32767 go through this routine instead
+    print_label = 'UDECO'
+
+    def __init__(self, dump_label: str = 'PROFILE', profiling: bool = False) -> None:
+        self.__counters: list[tuple[str, str]] = []
+        self.__dump_label = dump_label
+        self.__profiling = profiling
+
+    @property
+    def profiling(self) -> bool: return self.__profiling
+
+    def counter(self, description: str) -> str:
+        '''Allocates a new counter (a .WORD cell), returning its label'''
+        label = f'C{len(self.__counters) + 1:07}'
+        self.__counters.append((label, description))
+        return label
+
+    def increment(self, counter: str) -> list[str]:
+        return [f'LDWA {counter},d', 'ADDA 1,i', f'STWA {counter},d']
+
+    def dump(self) -> list[str]:
+        '''Instructions printing the table, to run before stopping'''
+        return [f'CALL {self.__dump_label}']
+
+    def dump_routine(self) -> list[LabeledInstruction]:
+        instructions: list[LabeledInstruction] = [
+            (self.__dump_label, 'STRO S0000000,d ; table header')]
+        for idx, (counter, _) in enumerate(self.__counters, 1):
+            instructions.append((None, f'STRO S{idx:07},d'))
+            instructions.append((None, f'LDWA {counter},d'))
+            instructions.append((None, f'CALL {self.print_label}'))
+            instructions.append((None, 'STRO S9999999,d ; newline'))
+        instructions.append((None, 'RET'))
+        return instructions + self.__print_routine()
+
+    def __print_routine(self) -> list[LabeledInstruction]:
+        '''Prints A as an unsigned decimal word, one digit at a time'''
+        instructions: list[LabeledInstruction] = [
+            (self.print_label, 'STWA UDECV,d ; value left to print'),
+            (None, 'LDWA 0,i'),
+            (None, 'STWA UDECS,d ; leading zeros are skipped until a digit is printed')]
+        for n, power in enumerate((10000, 1000, 100, 10)):
+            # Subtracting the power of ten while there's no borrow compares it as unsigned
+            instructions += [
+                (f'UDEC{n}0', 'LDWA 0,i'),
+                (None, 'STWA UDECD,d ; digit'),
+                (None, 'LDWA UDECV,d'),
+                (f'UDEC{n}1', f'SUBA {power},i'),
+                (None, f'BRC UDEC{n}2'),
+                (None, f'BR UDEC{n}3'),
+                (f'UDEC{n}2', 'STWA UDECV,d'),
+                (None, 'LDWA UDECD,d'),
+                (None, 'ADDA 1,i'),
+                (None, 'STWA UDECD,d'),
+                (None, 'LDWA UDECV,d'),
+                (None, f'BR UDEC{n}1'),
+                (f'UDEC{n}3', 'LDWA UDECD,d'),
+                (None, 'ORA UDECS,d'),
+                (None, f'BREQ UDEC{n + 1}0'),
+                (None, 'STWA UDECS,d'),
+                (None, 'DECO UDECD,d'),
+            ]
+        # The units are printed even if they're the only digit
+        instructions += [('UDEC40', 'DECO UDECV,d'), (None, 'RET')]
+        return instructions
+
+    def generate(self, output: AssemblyWriter):
+        output.line('; Instrumentation counters')
+        output.labeled('S0000000', '.ASCII "profile:\\n\\x00"')
+        output.labeled('S9999999', '.ASCII "\\n\\x00"')
+        for idx, (counter, description) in enumerate(self.__counters, 1):
+            output.labeled(counter, f'{".WORD 0":<14}; {description}')
+            output.labeled(f'S{idx:07}', f'.ASCII "{description}: \\x00"')
+        for label, description in (('UDECV', 'value to print unsigned'), ('UDECD', 'digit'),
+                                   ('UDECS', 'digits printed')):
+            output.labeled(label, f'{".WORD 0":<14}; {description}')
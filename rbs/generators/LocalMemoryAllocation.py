@@ -1,20 +1,23 @@
 from typing import Iterable
 from ..common.Types import CallFrame
+from ..common.Utils import element_size
+from .AssemblyWriter import AssemblyWriter
 
 
 class LocalMemoryAllocation():
 
     def __init__(self,
-                 output,
+                 output: AssemblyWriter,
                  func_defns: Iterable[tuple[str, CallFrame]]) -> None:
         self.__output = output
         self.__func_defns = func_defns
 
     def generate(self):
         for name, (vars, stack_space) in self.__func_defns:
-            print(f'; Allocating Local memory for {name}', file=self.__output)
+            self.__output.line(f'; Allocating Local memory for {name}')
             for var, (label, offset, arr_size) in vars.items():
-                constant = stack_space - offset - arr_size * 2
-                allocation = f'{str(label+":"):<9}\t{f".EQUATE {constant}":<14}'
-                tag = f'; local var {var} #2d{"" if arr_size <= 1 else f"{arr_size}a"}'
-                print(allocation+tag, file=self.__output)
+                size = element_size(var)
+                constant = stack_space - offset - arr_size * size
+                is_array = arr_size > 1 or size == 1
+                tag = f'; local var {var} #{size}d{f"{arr_size}a" if is_array else ""}'
+                self.__output.labeled(label, f'{f".EQUATE {constant}":<14}{tag}')
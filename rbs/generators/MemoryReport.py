@@ -0,0 +1,139 @@
+from typing import Iterable
+from ..common.Types import CallFrame, GlobalVariable, InitKind, LabeledInstruction
+from ..common.SymbolTable import SymbolTable
+from ..common.CostModel import instruction_size
+from ..common.Utils import split_instruction, split_routines, element_size, \
+    is_byte_array_ident
+
+
+# The stack grows down from here (the operating system occupies the memory above)
+_stack_top = 0xFB8F
+# Every CALL pushes the return address
+_return_address = 2
+
+
+class MemoryReport():
+
+    def __init__(self,
+                 output,
+                 global_vars: Iterable[GlobalVariable],
+                 func_defns: dict[str, CallFrame],
+                 function_labels: SymbolTable,
+                 program: list[LabeledInstruction],
+                 entry_point: str = 'main',
+                 largest: int = 5) -> None:
+        self.__output = output
+        self.__global_vars = list(global_vars)
+        self.__func_defns = func_defns
+        self.__program = program
+        self.__entry_point = entry_point
+        self.__largest = largest
+        # Report functions by name rather than label
+        self.__names = {function_labels[name]: name for name in func_defns}
+        self.__names[entry_point] = entry_point
+
+    def __name(self, label: str) -> str:
+        return self.__names.get(label, label)
+
+    def __call_graph(self) -> dict[str, list[str]]:
+        '''The routines called by each routine (the entry point, functions and subroutines)'''
+        calls = [(mnemonic, operand) for mnemonic, operand, _ in
+                 (split_instruction(instr) for _, instr in self.__program)]
+        entries = {self.__entry_point} | {str(operand) for mnemonic, operand in calls
+                                          if mnemonic == "CALL"}
+        graph: dict[str, list[str]] = {}
+        for entry, routine in split_routines(self.__program, entries).items():
+            graph[entry] = []
+            for _, instr in routine:
+                mnemonic, operand, _ = split_instruction(instr)
+                if mnemonic == "CALL" and operand is not None:
+                    graph[entry].append(operand)
+        return graph
+
+    def __frame(self, label: str) -> int:
+        name = self.__name(label)
+        return self.__func_defns[name].stack_space if name in self.__func_defns else 0
+
+    def __stack_depth(self, graph: dict[str, list[str]]) -> tuple[int, list[str], set[str]]:
+        '''Deepest stack usage from the entry point, the path reaching it, and recursive routines'''
+        depths: dict[str, tuple[int, list[str]]] = {}
+        recursive: set[str] = set()
+        active: list[str] = []
+
+        def visit(label: str) -> tuple[int, list[str]]:
+            if label in depths:
+                return depths[label]
+            active.append(label)
+            deepest: tuple[int, list[str]] = (0, [])
+            for callee in graph.get(label, []):
+                if callee in active:
+                    # Each recursive call needs another frame, bounded only by the input
+                    recursive.update(active[active.index(callee):])
+                    continue
+                depth, path = visit(callee)
+                depth += _return_address + self.__frame(callee)
+                if depth > deepest[0]:
+                    deepest = (depth, [callee, *path])
+            active.pop()
+            depths[label] = deepest
+            return deepest
+
+        depth, path = visit(self.__entry_point)
+        return depth, [self.__entry_point, *path], recursive
+
+    def __arrays(self) -> list[tuple[int, str, str]]:
+        arrays = []
+        for ident, kind, value in self.__global_vars:
+            if isinstance(value, list):
+                arrays.append((element_size(ident) * len(value), ident, 'global'))
+            elif kind == InitKind.BLOCK and (value > 2 or is_byte_array_ident(ident)):
+                arrays.append((value, ident, 'global'))
+        for func, (local_vars, _) in self.__func_defns.items():
+            for ident, (_, _, arr_size) in local_vars.items():
+                if arr_size > 1 or is_byte_array_ident(ident):
+                    arrays.append((element_size(ident) * arr_size, ident, f'local to {func}'))
+        return sorted(arrays, reverse=True)[:self.__largest]
+
+    def generate(self):
+        code = sum(instruction_size(instr) for _, instr in self.__program)
+        data = 0
+        for ident, kind, value in self.__global_vars:
+            if isinstance(value, list):
+                data += element_size(ident) * len(value)
+            elif kind == InitKind.BLOCK:
+                data += value
+            elif kind == InitKind.WORD:
+                data += 2
+
+        graph = self.__call_graph()
+        depth, path, recursive = self.__stack_depth(graph)
+        # The program is loaded at address 0 (after the initial BR main)
+        free = _stack_top - (3 + code + data)
+
+        out = self.__output
+        print('Memory report', file=out)
+        print(f'  {"Code":<20}{code:>6} bytes', file=out)
+        print(f'  {"Static data":<20}{data:>6} bytes', file=out)
+        if recursive:
+            names = ", ".join(sorted(self.__name(label) for label in recursive))
+            print(f'  {"Stack (worst case)":<20}unbounded, recursion through {names}', file=out)
+            print(f'  {"Stack (one level)":<20}{depth:>6} bytes', file=out)
+        else:
+            print(f'  {"Stack (worst case)":<20}{depth:>6} bytes', file=out)
+        print(f'  {"Deepest calls":<20}{" -> ".join(map(self.__name, path))}', file=out)
+        print(f'  {"Free for the stack":<20}{free - depth:>6} bytes', file=out)
+
+        print('  Frames', file=out)
+        for label, callees in graph.items():
+            if label == self.__entry_point:
+                continue
+            calls = sorted({self.__name(callee) for callee in callees})
+            print(f'    {self.__name(label):<18}{self.__frame(label):>6} bytes '
+                  f'(+{_return_address} return address)'
+                  f'{", calls " + ", ".join(calls) if calls else ""}', file=out)
+
+        arrays = self.__arrays()
+        if arrays:
+            print('  Largest arrays', file=out)
+            for size, ident, where in arrays:
+                print(f'    {ident:<18}{size:>6} bytes, {where}', file=out)
@@ -0,0 +1,112 @@
+from typing import Iterable
+from ..common.Types import LabeledInstruction
+from ..common.CostModel import instruction_size
+from ..common.Utils import split_instruction, ascii_bytes
+
+
+# Instructions without an operand specifier
+_unary_opcodes = {
+    "STOP": 0x00, "RET": 0x01, "RETTR": 0x02, "MOVSPA": 0x03, "MOVFLGA": 0x04, "MOVAFLG": 0x05,
+    "NOTA": 0x06, "NOTX": 0x07, "NEGA": 0x08, "NEGX": 0x09, "ASLA": 0x0A, "ASLX": 0x0B,
+    "ASRA": 0x0C, "ASRX": 0x0D, "ROLA": 0x0E, "ROLX": 0x0F, "RORA": 0x10, "RORX": 0x11,
+    "NOP0": 0x26, "NOP1": 0x27,
+}
+
+# Branches only address immediately (i) or indexed (x), in the last bit of the instruction
+_branch_opcodes = {
+    "BR": 0x12, "BRLE": 0x14, "BRLT": 0x16, "BREQ": 0x18, "BRNE": 0x1A, "BRGE": 0x1C,
+    "BRGT": 0x1E, "BRV": 0x20, "BRC": 0x22, "CALL": 0x24,
+}
+_branch_modes = {"i": 0, "x": 1}
+
+# Any other instruction takes its addressing mode in the last three bits
+_general_opcodes = {
+    "NOP": 0x28, "DECI": 0x30, "DECO": 0x38, "HEXO": 0x40, "STRO": 0x48, "ADDSP": 0x50,
+    "SUBSP": 0x58, "ADDA": 0x60, "ADDX": 0x68, "SUBA": 0x70, "SUBX": 0x78, "ANDA": 0x80,
+    "ANDX": 0x88, "ORA": 0x90, "ORX": 0x98, "CPWA": 0xA0, "CPWX": 0xA8, "CPBA": 0xB0,
+    "CPBX": 0xB8, "LDWA": 0xC0, "LDWX": 0xC8, "LDBA": 0xD0, "LDBX": 0xD8, "STWA": 0xE0,
+    "STWX": 0xE8, "STBA": 0xF0, "STBX": 0xF8,
+}
+_general_modes = {"i": 0, "d": 1, "n": 2, "s": 3, "sf": 4, "x": 5, "sx": 6, "sfx": 7}
+
+# Bytes per line of the object file
+_line_length = 16
+
+
+class ObjectCode():
+    """
+    Assembles the program into a Pep/9 object file (hexadecimal bytes, terminated by zz), the
+    same pep9term asm would produce from the assembly. Lines are added in the order they are
+    written, labels (and .EQUATEs) are resolved once all of them are known
+    """
+
+    def __init__(self) -> None:
+        self.__lines: list[LabeledInstruction] = []
+
+    def add(self, instructions: Iterable[LabeledInstruction]):
+        self.__lines.extend(instructions)
+
+    def __symbols(self) -> dict[str, int]:
+        symbols: dict[str, int] = {}
+        address = 0
+        for label, instr in self.__lines:
+            mnemonic, operand, _ = split_instruction(instr)
+            if label is not None:
+                # Labels on .END stand for the address just past the program
+                symbols[label] = self.__value(operand, symbols) if mnemonic == ".EQUATE" \
+                    else address
+            if mnemonic == ".END":
+                break
+            address += instruction_size(instr)
+        return symbols
+
+    @staticmethod
+    def __value(operand: str | None, symbols: dict[str, int]) -> int:
+        assert operand is not None, "Missing operand"
+        if operand[0] == "'":
+            # Character literal
+            return ascii_bytes(f'"{operand[1:-1]}"')[0]
+        if operand[0].isdigit() or operand[0] == '-':
+            return int(operand, 0) & 0xFFFF
+        if operand not in symbols:
+            raise ValueError(f'Undefined symbol "{operand}"')
+        return symbols[operand]
+
+    def assemble(self) -> bytes:
+        symbols = self.__symbols()
+        code = bytearray()
+        for _, instr in self.__lines:
+            mnemonic, operand, mode = split_instruction(instr)
+            if mnemonic in ("", ".EQUATE"):
+                continue
+            if mnemonic == ".END":
+                break
+            if mnemonic == ".ASCII":
+                code += ascii_bytes(instr)
+            elif mnemonic == ".BLOCK":
+                code += bytes(self.__value(operand, symbols))
+            elif mnemonic == ".BYTE":
+                code.append(self.__value(operand, symbols) & 0xFF)
+            elif mnemonic == ".WORD":
+                code += self.__value(operand, symbols).to_bytes(2, 'big')
+            elif mnemonic in _unary_opcodes:
+                code.append(_unary_opcodes[mnemonic])
+            elif mnemonic in _branch_opcodes:
+                code.append(_branch_opcodes[mnemonic] | _branch_modes[mode or "i"])
+                code += self.__value(operand, symbols).to_bytes(2, 'big')
+            elif mnemonic in _general_opcodes and mode is not None:
+                code.append(_general_opcodes[mnemonic] | _general_modes[mode])
+                code += self.__value(operand, symbols).to_bytes(2, 'big')
+            else:
+                raise ValueError(f'Cannot assemble "{instr}"')
+        return bytes(code)
+
+    def generate(self, output):
+        code = self.assemble()
+        lines = [' '.join(f'{byte:02X}' for byte in code[start:start + _line_length])
+                 for start in range(0, len(code), _line_length)]
+        if len(lines) > 0 and len(code) % _line_length != 0:
+            lines[-1] += ' zz'
+        else:
+            lines.append('zz')
+        output.write('\n'.join(lines) + '\n')
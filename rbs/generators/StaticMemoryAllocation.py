@@ -1,12 +1,14 @@
 from typing import Iterable
 from ..common.Types import GlobalVariable, InitKind
 from ..common.SymbolTable import SymbolTable
+from ..common.Utils import element_size
+from .AssemblyWriter import AssemblyWriter
 
 
 class StaticMemoryAllocation():
 
     def __init__(self,
-                 output,
+                 output: AssemblyWriter,
                  symbol_table: SymbolTable,
                  global_vars: Iterable[GlobalVariable]) -> None:
         self.__output = output
@@ -14,17 +16,26 @@ class StaticMemoryAllocation():
         self.__global_vars = global_vars
 
     def generate(self):
-        print('; Allocating Global (static) memory', file=self.__output)
+        out = self.__output
+        out.line('; Allocating Global (static) memory')
         for ident, kind, size in self.__global_vars:
-            label_name = self.__symbol_table[ident]
-            label = f'{str(label_name+":"):<9}\t'
+            label = self.__symbol_table[ident]
             tag_arr_size = ""
+            elt_size = element_size(ident)
             match kind:
                 case InitKind.BLOCK:
-                    print(f'{label}{f".BLOCK {size}":<14}', end='', file=self.__output)
-                    tag_arr_size = f'{"" if size/2 <= 1 else f"{int(size/2)}a"}'
+                    directive = f".BLOCK {size}"
+                    is_array = size > 2 or elt_size == 1
+                    tag_arr_size = f'{f"{size // elt_size}a" if is_array else ""}'
                 case InitKind.EQUATE:
-                    print(f'{label}{f".EQUATE {size}":<14}', end='', file=self.__output)
+                    directive = f".EQUATE {size}"
+                case InitKind.WORD | InitKind.BYTE if isinstance(size, list):
+                    # Statically initialized array, one word (or byte) per element
+                    directive = f".{kind.name} {size[0]}"
+                    tag_arr_size = f'{len(size)}a'
                 case InitKind.WORD:
-                    print(f'{label}{f".WORD {size}":<14}', end='', file=self.__output)
-            print(f'; global variable {ident} #2d{tag_arr_size}', file=self.__output)
+                    directive = f".WORD {size}"
+            tag = f'; global variable {ident} #{elt_size}d{tag_arr_size}'
+            out.labeled(label, f'{directive:<14}{tag}')
+            if isinstance(size, list):
+                out.continued(f'.{kind.name} {value}' for value in size[1:])
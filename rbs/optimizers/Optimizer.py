@@ -1,14 +1,64 @@
-from ..common.Types import LabeledInstruction, OptimizationPass
-from functools import reduce
+from ..common.Types import LabeledInstruction, OptimizationPass, PassStatistics
+from ..common.CostModel import CostModel
+from functools import partial
+from time import perf_counter
+
+
+def pass_name(pass_func: OptimizationPass) -> str:
+    while isinstance(pass_func, partial):
+        pass_func = pass_func.func
+    return getattr(pass_func, '__name__', repr(pass_func))
 
 
 class Optimizer:
+    """
+    Runs groups of passes in order, repeating each group until none of its passes changes the
+    instructions anymore (or the iteration cap is reached)
+    """
 
-    def __init__(self) -> None:
-        self.__passes: list[OptimizationPass] = []
+    def __init__(self, max_iterations: int = 8, costs: CostModel | None = None) -> None:
+        self.__groups: list[list[OptimizationPass]] = []
+        self.__max_iterations = max_iterations
+        self.__costs = costs if costs is not None else CostModel()
+        self.__statistics: dict[str, PassStatistics] = {}
 
     def add_pass(self, pass_func: OptimizationPass):
-        self.__passes.append(pass_func)
+        self.add_group(pass_func)
+
+    def add_group(self, *pass_funcs: OptimizationPass):
+        '''Passes that may expose opportunities for each other, iterated to a fixed point'''
+        self.__groups.append(list(pass_funcs))
+        for pass_func in pass_funcs:
+            self.__statistics.setdefault(pass_name(pass_func), PassStatistics())
 
     def optimize(self, instructions: list[LabeledInstruction]) -> list[LabeledInstruction]:
-        return reduce(lambda instr, func: func(instr), self.__passes, instructions)
+        for group in self.__groups:
+            for _ in range(self.__max_iterations):
+                before = instructions
+                for pass_func in group:
+                    instructions = self.__run(pass_func, instructions)
+                if instructions == before:
+                    break
+        return instructions
+
+    def __run(self, pass_func: OptimizationPass,
+              instructions: list[LabeledInstruction]) -> list[LabeledInstruction]:
+        start = perf_counter()
+        optimized = pass_func(instructions)
+        elapsed = perf_counter() - start
+
+        statistics = self.__statistics[pass_name(pass_func)]
+        statistics.runs += 1
+        statistics.seconds += elapsed
+        statistics.instructions_removed += len(instructions) - len(optimized)
+        statistics.bytes_saved += self.__costs.size(instructions) - self.__costs.size(optimized)
+        return optimized
+
+    def report(self, output):
+        print(f'{"pass":<24}{"runs":>6}{"removed":>10}{"bytes":>8}{"time (ms)":>12}', file=output)
+        for name, stats in self.__statistics.items():
+            print(f'{name:<24}{stats.runs:>6}{stats.instructions_removed:>10}'
+                  f'{stats.bytes_saved:>8}{1000 * stats.seconds:>12.3f}', file=output)
+
+    @property
+    def statistics(self): return self.__statistics
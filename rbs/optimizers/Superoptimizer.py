@@ -0,0 +1,279 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import product
+from random import Random
+from typing import Iterable, Iterator, TypeAlias
+from ..common.CostModel import CostModel
+from ..common.Types import LabeledInstruction
+from ..common.Utils import split_instruction
+
+
+# Register and memory operations whose effects on A, X, memory and the status bits are modelled
+_loads = {"LDWA", "LDWX"}
+_stores = {"STWA", "STWX"}
+_binary = {"ADDA", "ADDX", "SUBA", "SUBX", "ANDA", "ANDX", "ORA", "ORX", "CPWA", "CPWX"}
+_unary = {"NOTA", "NOTX", "NEGA", "NEGX", "ASLA", "ASLX", "ASRA", "ASRX"}
+_modelled_modes = {"i", "d", "s"}
+
+# Values that tend to expose overflow, carry and sign bugs
+_edge_values = [0, 1, 2, 0x7FFF, 0x8000, 0x8001, 0xFFFF, 0xFFFE, 0x00FF, 0x0100]
+
+# A normalized instruction: mnemonic and operand, where memory operands and immediates are
+# replaced by variables ($a, $b, ...) so equivalent sequences from different places are counted
+# together. The operand keeps its addressing mode (ex. "$a,s" or "$b,i")
+Sequence: TypeAlias = tuple[str, ...]
+
+
+@dataclass
+class State:
+    """The part of the machine a sequence can observe or change"""
+    registers: dict[str, int]
+    flags: dict[str, int]
+    memory: dict[str, int] = field(default_factory=dict)
+    immediates: dict[str, int] = field(default_factory=dict)
+
+    def copy(self) -> 'State':
+        return State(dict(self.registers), dict(self.flags), dict(self.memory),
+                     dict(self.immediates))
+
+
+def _set_nz(state: State, value: int):
+    state.flags["N"] = value >> 15
+    state.flags["Z"] = int(value == 0)
+
+
+def _add(state: State, lhs: int, rhs: int, carry: int = 0) -> int:
+    total = lhs + rhs + carry
+    result = total & 0xFFFF
+    state.flags["C"] = int(total > 0xFFFF)
+    state.flags["V"] = int(((lhs ^ result) & (rhs ^ result) & 0x8000) != 0)
+    _set_nz(state, result)
+    return result
+
+
+def execute(sequence: Iterable[str], state: State) -> State:
+    '''Runs a normalized sequence on a copy of state, following the Pep/9 semantics'''
+    state = state.copy()
+    for instruction in sequence:
+        mnemonic, operand, mode = split_instruction(instruction)
+        reg = mnemonic[-1]
+        value = state.registers.get(reg, 0)
+
+        def operand_value() -> int:
+            assert operand is not None
+            if mode != "i":
+                return state.memory[operand]
+            if operand.startswith("$"):
+                return state.immediates[operand]
+            return int(operand, 0) & 0xFFFF
+
+        if mnemonic in _loads:
+            value = operand_value()
+            _set_nz(state, value)
+        elif mnemonic in _stores:
+            assert operand is not None
+            state.memory[operand] = value
+            continue
+        elif mnemonic.startswith("ADD"):
+            value = _add(state, value, operand_value())
+        elif mnemonic.startswith(("SUB", "CPW")):
+            result = _add(state, value, ~operand_value() & 0xFFFF, 1)
+            if mnemonic.startswith("CPW"):
+                # Comparing corrects the sign for overflow, and leaves the register as is
+                state.flags["N"] ^= state.flags["V"]
+                continue
+            value = result
+        elif mnemonic.startswith("AND"):
+            value &= operand_value()
+            _set_nz(state, value)
+        elif mnemonic.startswith("OR"):
+            value |= operand_value()
+            _set_nz(state, value)
+        elif mnemonic.startswith("NOT"):
+            value = ~value & 0xFFFF
+            _set_nz(state, value)
+        elif mnemonic.startswith("NEG"):
+            state.flags["V"] = int(value == 0x8000)
+            value = -value & 0xFFFF
+            _set_nz(state, value)
+        elif mnemonic.startswith("ASL"):
+            state.flags["C"] = value >> 15
+            result = (value << 1) & 0xFFFF
+            state.flags["V"] = int((value >> 15) != (result >> 15))
+            value = result
+            _set_nz(state, value)
+        elif mnemonic.startswith("ASR"):
+            state.flags["C"] = value & 1
+            value = (value >> 1) | (value & 0x8000)
+            _set_nz(state, value)
+        else:
+            raise ValueError(f"Unmodelled instruction {instruction}")
+        state.registers[reg] = value
+    return state
+
+
+def is_modelled(instruction: str) -> bool:
+    mnemonic, _, mode = split_instruction(instruction)
+    if mnemonic.startswith("CPW"):
+        # Only sets the status bits for the branch that always follows
+        return False
+    if mnemonic in _unary:
+        return True
+    return mnemonic in _loads | _stores | _binary and mode in _modelled_modes \
+        and not (mnemonic in _stores and mode == "i")
+
+
+def normalize(window: list[str]) -> Sequence:
+    '''
+    Replaces memory operands and immediates by variables, in order of appearance. Numbers become
+    variables too, so rewrites are only kept if they hold whatever the number is
+    '''
+    names: dict[tuple[str, str], str] = {}
+    normalized = []
+    for instruction in window:
+        mnemonic, operand, mode = split_instruction(instruction)
+        if operand is None:
+            normalized.append(mnemonic)
+            continue
+        assert mode is not None
+        operand = names.setdefault((operand, mode), f"${chr(ord('a') + len(names))}")
+        normalized.append(f"{mnemonic} {operand},{mode}")
+    return tuple(normalized)
+
+
+def extract_sequences(instructions: list[LabeledInstruction], min_length: int = 2,
+                      max_length: int = 4) -> Counter[Sequence]:
+    '''Counts the normalized straight-line windows of modelled instructions'''
+    counts: Counter[Sequence] = Counter()
+    for start in range(len(instructions)):
+        window: list[str] = []
+        for label, instr in instructions[start:start + max_length]:
+            if (label is not None and len(window) > 0) or not is_modelled(instr):
+                break
+            window.append(instr)
+            if len(window) >= min_length:
+                counts[normalize(window)] += 1
+    return counts
+
+
+def _operands(sequence: Sequence) -> tuple[list[str], list[str]]:
+    '''The memory cells and immediates used by a normalized sequence'''
+    cells: list[str] = []
+    immediates: list[str] = []
+    for instruction in sequence:
+        _, operand, mode = split_instruction(instruction)
+        if operand is None:
+            continue
+        target = immediates if mode == "i" else cells
+        if f"{operand},{mode}" not in target:
+            target.append(f"{operand},{mode}")
+    return cells, immediates
+
+
+class Superoptimizer:
+    """
+    Searches for the cheapest sequence equivalent to a given one, by enumerating every sequence
+    of fewer instructions built from the same operands, and testing them on random and edge case
+    machine states
+    """
+
+    def __init__(self, tests: int = 400, seed: int = 3, max_length: int = 2) -> None:
+        self.__tests = tests
+        self.__random = Random(seed)
+        self.__max_length = max_length
+        self.__costs = CostModel()
+
+    def __states(self, sequence: Sequence) -> list[State]:
+        cells, immediates = _operands(sequence)
+        names = ["A", "X", *cells, *immediates]
+
+        def values() -> Iterator[list[int]]:
+            # Every edge value in every position, then random values
+            for value in _edge_values:
+                for position in range(len(names)):
+                    row = [self.__random.getrandbits(16) for _ in names]
+                    row[position] = value
+                    yield row
+            for _ in range(self.__tests):
+                yield [self.__random.choice(_edge_values) if self.__random.random() < 0.2
+                       else self.__random.getrandbits(16) for _ in names]
+
+        states = []
+        for row in values():
+            assigned = dict(zip(names, row))
+            flags = {flag: self.__random.getrandbits(1) for flag in "NZVC"}
+            states.append(State({"A": assigned["A"], "X": assigned["X"]}, flags,
+                                {cell.split(",")[0]: assigned[cell] for cell in cells},
+                                {imm.split(",")[0]: assigned[imm] for imm in immediates}))
+        return states
+
+    def __alphabet(self, sequence: Sequence) -> list[str]:
+        cells, immediates = _operands(sequence)
+        numbers = ["0,i", "1,i", "-1,i"]
+        operands = cells + immediates + [number for number in numbers if number not in immediates]
+        alphabet = sorted(_unary)
+        for mnemonic in sorted(_loads | _binary - {"CPWA", "CPWX"}):
+            alphabet += [f"{mnemonic} {operand}" for operand in operands]
+        for mnemonic in sorted(_stores):
+            alphabet += [f"{mnemonic} {cell}" for cell in cells]
+        return alphabet
+
+    def __cost(self, sequence: Iterable[str]) -> tuple[int, int]:
+        instructions = [(None, instr) for instr in sequence]
+        return self.__costs.size(instructions), self.__costs.cycles(instructions)
+
+    def __is_cheaper(self, candidate: Sequence, original: Sequence) -> bool:
+        # Never trade size for speed or the other way around, so it helps at every level
+        (size, cycles), (old_size, old_cycles) = self.__cost(candidate), self.__cost(original)
+        return size <= old_size and cycles <= old_cycles \
+            and (size, cycles) != (old_size, old_cycles)
+
+    @staticmethod
+    def __equivalent(lhs: State, rhs: State) -> bool:
+        '''Same registers and memory, the status bits are compared separately'''
+        return lhs.registers == rhs.registers and lhs.memory == rhs.memory
+
+    def optimize(self, sequence: Sequence) -> tuple[Sequence, bool] | None:
+        '''
+        The cheapest equivalent sequence found, and whether it also leaves the status bits as the
+        original would (None if nothing cheaper is equivalent)
+        '''
+        states = self.__states(sequence)
+        expected = [execute(sequence, state) for state in states]
+        # A few states reject nearly every candidate, the rest only run for likely matches
+        quick = list(zip(states[:8], expected[:8]))
+
+        best: tuple[Sequence, bool] | None = None
+        best_cost = self.__cost(sequence)
+        alphabet = self.__alphabet(sequence)
+        for length in range(min(len(sequence), self.__max_length + 1)):
+            for candidate in product(alphabet, repeat=length):
+                cost = self.__cost(candidate)
+                if not self.__is_cheaper(candidate, sequence) or cost > best_cost:
+                    continue
+                if not all(self.__equivalent(execute(candidate, state), result)
+                           for state, result in quick):
+                    continue
+                results = [execute(candidate, state) for state in states]
+                if not all(self.__equivalent(actual, result)
+                           for actual, result in zip(results, expected)):
+                    continue
+                preserves_flags = all(actual.flags == result.flags
+                                      for actual, result in zip(results, expected))
+                if cost < best_cost or (preserves_flags and best is not None and not best[1]):
+                    best, best_cost = (candidate, preserves_flags), cost
+        return best
+
+
+def rewrite_entry(sequence: Sequence, replacement: Sequence, preserves_flags: bool,
+                  count: int) -> dict:
+    '''A rewrite table entry, in the format loaded by the peephole rule engine'''
+    cells, _ = _operands(sequence)
+    return {
+        "pattern": list(sequence),
+        "replacement": list(replacement),
+        "preserves_flags": preserves_flags,
+        # Distinct variables were verified as distinct memory locations
+        "cells": cells,
+        "count": count,
+    }
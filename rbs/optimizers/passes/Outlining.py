@@ -0,0 +1,87 @@
+from ...common.Types import LabeledInstruction
+from ...common.CostModel import instruction_size
+from ...common.Utils import split_instruction
+
+
+# Instructions that change the flow of control or the stack can't be moved into a subroutine
+_unmovable = ("BR", "CALL", "RET", "STOP", "ADDSP", "SUBSP", "MOVSPA", "NOP")
+
+# Size of the CALL replacing every occurrence, and of the RET ending the subroutine
+_call_size = 3
+_ret_size = 1
+
+
+def _is_movable(instruction: LabeledInstruction) -> bool:
+    mnemonic, _, mode = split_instruction(instruction[1])
+    if mnemonic == "" or mnemonic.startswith(".") or mnemonic.startswith(_unmovable):
+        return False
+    # The return address is on top of the stack within the subroutine, so stack relative
+    # operands would refer to the wrong memory
+    return mode is None or not mode.startswith("s")
+
+
+def _code(instruction: LabeledInstruction) -> str:
+    return instruction[1].split(';', 1)[0].strip()
+
+
+def _savings(occurrences: int, size: int) -> int:
+    return occurrences * size - occurrences * _call_size - size - _ret_size
+
+
+def outline_sequences(instructions: list[LabeledInstruction],
+                      max_length: int = 16) -> list[LabeledInstruction]:
+    '''
+    Moves repeated instruction sequences into shared subroutines (placed at the start), when the
+    bytes saved outweigh a CALL for every occurrence and the RET. Only straight-line code that
+    doesn't use the stack is moved, the status bits and registers pass through CALL and RET as is.
+    '''
+    instructions = list(instructions)
+    subroutines: list[list[LabeledInstruction]] = []
+    report: list[str] = []
+    total_saved = 0
+
+    while True:
+        # Every window of movable instructions, only the first of which may be labeled
+        starts: dict[tuple[str, ...], list[int]] = {}
+        for start in range(len(instructions)):
+            window: list[str] = []
+            for instruction in instructions[start:start + max_length]:
+                if (len(window) > 0 and instruction[0] is not None) or not _is_movable(instruction):
+                    break
+                window.append(_code(instruction))
+                if len(window) >= 2:
+                    starts.setdefault(tuple(window), []).append(start)
+
+        best: tuple[int, int, tuple[str, ...], list[int]] | None = None
+        for window_key, positions in starts.items():
+            # Occurrences can't overlap
+            chosen: list[int] = []
+            for position in positions:
+                if len(chosen) == 0 or position >= chosen[-1] + len(window_key):
+                    chosen.append(position)
+            size = sum(instruction_size(instr) for instr in window_key)
+            saved = _savings(len(chosen), size)
+            if saved > 0 and (best is None or (saved, len(window_key)) > best[:2]):
+                best = (saved, len(window_key), window_key, chosen)
+
+        if best is None:
+            break
+
+        saved, length, window_key, chosen = best
+        name = f"O{len(subroutines) + 1:07}"
+        first = chosen[0]
+        body = [(None, instr) for _, instr in instructions[first:first + length]]
+        subroutines.append([(name, body[0][1]), *body[1:], (None, "RET")])
+        for position in reversed(chosen):
+            instructions[position:position + length] = [(instructions[position][0], f"CALL {name}")]
+        report.append(f"; {name}: {length} instructions used {len(chosen)} times, "
+                      f"saves {saved} bytes")
+        total_saved += saved
+
+    if len(subroutines) == 0:
+        return instructions
+
+    header = [(None, f"; Outlined {len(subroutines)} repeated sequences, "
+                     f"saving {total_saved} bytes"),
+              *((None, line) for line in report)]
+    return header + [instr for subroutine in subroutines for instr in subroutine] + instructions
@@ -1,18 +1,20 @@
 from ...common.Types import LabeledInstruction
+from ...common.Utils import split_instruction
 
 
 def peephole_double_load(instructions: list[LabeledInstruction]) -> list[LabeledInstruction]:
-    def extract_from_instruction(instr: str) -> tuple[str, str]:
-        _, operand = instr.split(' ')
-        var, mode = operand.split(',')
-        return var, mode
-
-    var_in_acc = None
-    var_in_idx = None
+    # Registers remember the (operand, mode) they were loaded from, indexed loads also remember
+    # what the index register held at the time
+    var_in_acc: tuple | None = None
+    var_in_idx: tuple | None = None
     did_asl_idx = False
+    skip_next = False
     new_instructions = []
 
-    for instruction in instructions:
+    for i, instruction in enumerate(instructions):
+        if skip_next:
+            skip_next = False
+            continue
         label, instr = instruction
 
         if label is not None or instr.startswith("CALL"):
@@ -21,49 +23,76 @@ def peephole_double_load(instructions: list[LabeledInstruction]) -> list[Labeled
             var_in_idx = None
             did_asl_idx = False
 
-        if instr.startswith("LDWA"):
-            var, mode = extract_from_instruction(instr)
+        mnemonic, operand, mode = split_instruction(instr)
 
+        if mnemonic == "LDWA":
+            assert mode is not None
             if not mode.endswith('x'):
-                if var_in_acc == var:
-                    # Same variable, skip
-                    continue
-                var_in_acc = var
-            else:
+                key: tuple | None = (operand, mode)
+            elif var_in_idx is not None:
                 # Indexing
-                assert var_in_idx is not None
-                if var_in_acc is not None and var_in_acc + var_in_idx == var:
-                    # Same variable, skip
-                    continue
-                assert var_in_idx is not None
-                var_in_acc = var + var_in_idx
-
-        elif instr.startswith("LDWX"):
-            # Assuming that the index register will never be addressed by indexing
-            var, _ = extract_from_instruction(instr)
-            if var_in_idx == var:
+                key = (operand, mode, var_in_idx, did_asl_idx)
+            else:
+                key = None
+            if key is not None and var_in_acc == key:
                 # Same variable, skip
                 continue
+            var_in_acc = key
+
+        elif mnemonic == "LDWX":
+            # Assuming that the index register will never be addressed by indexing
+            key = (operand, mode)
+            if var_in_idx == key:
+                if not did_asl_idx:
+                    # Same variable, skip
+                    continue
+                next_instruction = instructions[i + 1] if i + 1 < len(instructions) else None
+                if next_instruction == (None, "ASLX"):
+                    # Skip ASLX when reusing the shifted value in idx register
+                    skip_next = True
+                    continue
             # Did change
-            var_in_idx = var
+            var_in_idx = key
+            did_asl_idx = False
+
+        elif mnemonic in ("STWA", "STWX", "STBA", "STBX", "DECI"):
+            assert mode is not None
+            stored = (operand, mode)
+            if mode.endswith('x'):
+                # Any element of the array may have changed
+                if var_in_acc is not None and var_in_acc[0] == operand:
+                    var_in_acc = None
+                if mnemonic == "STWA" and var_in_idx is not None:
+                    var_in_acc = (operand, mode, var_in_idx, did_asl_idx)
+            else:
+                if var_in_idx == stored:
+                    var_in_idx = None
+                    did_asl_idx = False
+                if var_in_acc is not None and stored in (var_in_acc, *var_in_acc[2:3]):
+                    # Either the variable itself or the index it was loaded with changed
+                    var_in_acc = None
+                if mnemonic == "STWA" and var_in_acc is None:
+                    var_in_acc = stored
+
+        elif mnemonic in ("ADDSP", "SUBSP"):
+            # Stack relative operands no longer refer to the same memory
+            var_in_acc = None
+            var_in_idx = None
+            did_asl_idx = False
 
         # These instructions change what is in the register, forget the saved variable
-        elif any(instr.startswith(s) for s in
-                 ("NOT", "NEG", "ASL", "ASR", "ROL", "ROR", "ADD", "SUB", "AND", "OR")):
+        elif any(mnemonic.startswith(s) for s in
+                 ("NOT", "NEG", "ASL", "ASR", "ROL", "ROR", "ADD", "SUB", "AND", "OR", "LDB")):
 
-            reg = instr[2 if instr.startswith("OR") else 3]
+            reg = mnemonic[-1]
 
             if reg == 'A':
                 var_in_acc = None
+            elif var_in_idx is not None and mnemonic == "ASLX" and not did_asl_idx:
+                did_asl_idx = True
             else:
-                if var_in_idx is not None and instr.startswith("ASL"):
-                    # Skip ASLX when reusing value in idx register
-                    if did_asl_idx:
-                        continue
-                    did_asl_idx = True
-                else:
-                    var_in_idx = None
-                    did_asl_idx = False
+                var_in_idx = None
+                did_asl_idx = False
 
         # Every other instruction remains
         new_instructions.append(instruction)
@@ -71,29 +100,4 @@ def peephole_double_load(instructions: list[LabeledInstruction]) -> list[Labeled
     return new_instructions
 
 
-def peephole_nops(instructions: list[LabeledInstruction]) -> list[LabeledInstruction]:
-    if len(instructions) == 0:
-        return instructions
-
-    new_instructions = []
-    skip_next = False
-    for curr_instruction, next_instruction in zip(instructions, instructions[1:]):
-        if skip_next:
-            skip_next = False
-            continue
-        curr_label, curr_instr = curr_instruction
-        next_label, next_instr = next_instruction
-        # TODO: Collapse consecutive labels with NOP
-        if curr_instr.startswith('NOP1') and next_label is None:
-            new_instructions.append((curr_label, next_instr))
-            skip_next = True
-        else:
-            new_instructions.append(curr_instruction)
-
-    if not skip_next:
-        new_instructions.append(next_instruction)
-
-    return new_instructions
-
-
 # TODO: Passes for augmented assignments, consecutive comparisons, ...
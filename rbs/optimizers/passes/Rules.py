@@ -0,0 +1,247 @@
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, TypeAlias
+from ...common.Types import LabeledInstruction
+from ...common.Utils import split_instruction, flags_live
+
+
+# Values bound to the variables ($name) of a pattern, wildcards (*) are bound as *0, *1, ...
+Bindings: TypeAlias = dict[str, str]
+
+# A parsed template: label, mnemonic, operand and addressing mode (None when absent)
+_Template: TypeAlias = tuple[str | None, str, str | None, str | None]
+
+_inverse_branches = {
+    "BRLT": "BRGE", "BRGE": "BRLT", "BRLE": "BRGT", "BRGT": "BRLE", "BREQ": "BRNE", "BRNE": "BREQ",
+}
+
+
+def _parse(template: str) -> _Template:
+    '''Templates look like instructions, ex. "$l: LDWA $a,$m", or "*" for any instruction'''
+    label = None
+    if ":" in template:
+        label, template = (part.strip() for part in template.split(":", 1))
+    if template == "*":
+        return label, "*", None, None
+    mnemonic, operand, mode = split_instruction(template)
+    return label, mnemonic, operand, mode
+
+
+def _bind(pattern: str | None, value: str | None, bindings: Bindings) -> bool:
+    if pattern is None or not pattern.startswith("$"):
+        return pattern == value
+    if value is None:
+        return False
+    return bindings.setdefault(pattern, value) == value
+
+
+def _substitute(template: str | None, bindings: Bindings) -> str | None:
+    if template is None or not template.startswith("$"):
+        return template
+    return bindings[template]
+
+
+@dataclass
+class Rule:
+    """
+    Rewrites a sequence of instructions matching pattern into replacement. Only the first
+    instruction of a match may be labeled (unless the pattern binds the label with "$l: ..."),
+    its label is carried over to the first instruction of the replacement
+    """
+    name: str
+    pattern: list[str]
+    replacement: list[str]
+    # Extra conditions on the bindings, it may also bind new variables for the replacement
+    guard: Callable[[Bindings], bool] | None = None
+    # Does the replacement leave the status bits as the pattern would have
+    preserves_flags: bool = True
+    _pattern: list[_Template] = field(init=False, repr=False)
+    _replacement: list[_Template] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._pattern = [_parse(template) for template in self.pattern]
+        self._replacement = [_parse(template) for template in self.replacement]
+
+    @property
+    def binds_first_label(self) -> bool:
+        return self._pattern[0][0] is not None
+
+    @property
+    def opcode(self) -> str | None:
+        '''The mnemonic every match starts with, None if it could be anything'''
+        mnemonic = self._pattern[0][1]
+        return None if mnemonic == "*" or mnemonic.startswith("$") else mnemonic
+
+    def match(self, instructions: list[LabeledInstruction], start: int) -> Bindings | None:
+        if start + len(self._pattern) > len(instructions):
+            return None
+        bindings: Bindings = {}
+        wildcards = 0
+        for offset, (t_label, t_mnemonic, t_operand, t_mode) in enumerate(self._pattern):
+            label, instr = instructions[start + offset]
+            if t_label is not None:
+                if not _bind(t_label, label, bindings):
+                    return None
+            elif label is not None and offset > 0:
+                # Something branches into the middle of the sequence
+                return None
+            if t_mnemonic == "*":
+                bindings[f"*{wildcards}"] = instr
+                wildcards += 1
+                continue
+            mnemonic, operand, mode = split_instruction(instr)
+            if not (_bind(t_mnemonic, mnemonic, bindings) and _bind(t_operand, operand, bindings)
+                    and _bind(t_mode, mode, bindings)):
+                return None
+        if self.guard is not None and not self.guard(bindings):
+            return None
+        return bindings
+
+    def rewrite(self, bindings: Bindings, label: str | None) -> list[LabeledInstruction]:
+        replacement: list[LabeledInstruction] = []
+        wildcards = 0
+        for t_label, t_mnemonic, t_operand, t_mode in self._replacement:
+            if t_mnemonic == "*":
+                instr = bindings[f"*{wildcards}"]
+                wildcards += 1
+            else:
+                instr = str(_substitute(t_mnemonic, bindings))
+                operand = _substitute(t_operand, bindings)
+                if operand is not None:
+                    mode = _substitute(t_mode, bindings)
+                    instr += f" {operand}" if mode is None else f" {operand},{mode}"
+            new_label = _substitute(t_label, bindings)
+            if len(replacement) == 0 and new_label is None:
+                new_label = label
+            replacement.append((new_label, instr))
+        return replacement
+
+
+class RuleEngine:
+    """Applies a set of rules in a single pass, looking rules up by the opcode they start with"""
+
+    def __init__(self, rules: list[Rule]) -> None:
+        self.__by_opcode: dict[str | None, list[Rule]] = {}
+        for rule in rules:
+            self.__by_opcode.setdefault(rule.opcode, []).append(rule)
+        self.__longest = max((len(rule.pattern) for rule in rules), default=1)
+
+    def __call__(self, instructions: list[LabeledInstruction]) -> list[LabeledInstruction]:
+        instructions = list(instructions)
+        index = 0
+        while index < len(instructions):
+            mnemonic, _, _ = split_instruction(instructions[index][1])
+            candidates = self.__by_opcode.get(mnemonic, []) + self.__by_opcode.get(None, [])
+            for rule in candidates:
+                if self.__apply(rule, instructions, index):
+                    # The rewrite may complete a pattern that started a little earlier
+                    index = max(0, index - self.__longest + 1)
+                    break
+            else:
+                index += 1
+        return instructions
+
+    def __apply(self, rule: Rule, instructions: list[LabeledInstruction], index: int) -> bool:
+        bindings = rule.match(instructions, index)
+        if bindings is None:
+            return False
+        end = index + len(rule.pattern)
+        if not rule.preserves_flags and flags_live(instructions, end - 1):
+            return False
+
+        label = None if rule.binds_first_label else instructions[index][0]
+        replacement = rule.rewrite(bindings, label)
+        if label is not None and replacement[:1] and replacement[0][0] != label:
+            # The replacement binds its own label, there's nowhere to put this one
+            return False
+        if label is not None and len(replacement) == 0:
+            # Everything is removed, so the label moves to the next instruction
+            if end >= len(instructions) or instructions[end][0] is not None:
+                return False
+            replacement = [(label, instructions[end][1])]
+            end += 1
+
+        instructions[index:end] = replacement
+        return True
+
+
+def _is_zero(name: str) -> Callable[[Bindings], bool]:
+    return lambda bindings: _number(bindings[name]) == 0
+
+
+def _number(operand: str) -> int | None:
+    try:
+        return int(operand, 0)
+    except ValueError:
+        return None
+
+
+def _invert_branch(bindings: Bindings) -> bool:
+    if bindings["$br"] not in _inverse_branches:
+        return False
+    bindings["$inv"] = _inverse_branches[bindings["$br"]]
+    return True
+
+
+default_rules = [
+    # A labeled NOP1 only marks a position, the label can be put on the next instruction
+    Rule("merge_nop_label", ["$l: NOP1", "*"], ["$l: *"]),
+    Rule("remove_nop", ["NOP1"], []),
+    # Storing a value back where it was just loaded from
+    Rule("load_store", ["LDWA $a,$m", "STWA $a,$m"], ["LDWA $a,$m"]),
+    Rule("load_store_x", ["LDWX $a,$m", "STWX $a,$m"], ["LDWX $a,$m"]),
+    # Loading a value that was just stored (only the status bits would differ)
+    Rule("store_load", ["STWA $a,$m", "LDWA $a,$m"], ["STWA $a,$m"], preserves_flags=False),
+    Rule("store_store", ["STWA $a,$m", "STWA $a,$m"], ["STWA $a,$m"]),
+    # The first value loaded is never used
+    Rule("dead_load", ["LDWA $a,$m", "LDWA $b,$n"], ["LDWA $b,$n"]),
+    Rule("dead_load_x", ["LDWX $a,$m", "LDWX $b,$n"], ["LDWX $b,$n"],
+         guard=lambda bindings: not bindings["$n"].endswith("x")),
+    # Arithmetic identities (which only set the status bits)
+    Rule("add_zero", ["ADDA $n,i"], [], guard=_is_zero("$n"), preserves_flags=False),
+    Rule("sub_zero", ["SUBA $n,i"], [], guard=_is_zero("$n"), preserves_flags=False),
+    Rule("add_zero_x", ["ADDX $n,i"], [], guard=_is_zero("$n"), preserves_flags=False),
+    Rule("sub_zero_x", ["SUBX $n,i"], [], guard=_is_zero("$n"), preserves_flags=False),
+    Rule("or_zero", ["ORA $n,i"], [], guard=_is_zero("$n"), preserves_flags=False),
+    Rule("and_ones", ["ANDA $n,i"], [], preserves_flags=False,
+         guard=lambda bindings: _number(bindings["$n"]) in (-1, 0xFFFF)),
+    Rule("empty_frame", ["SUBSP $n,i"], [], guard=_is_zero("$n"), preserves_flags=False),
+    Rule("empty_frame_pop", ["ADDSP $n,i"], [], guard=_is_zero("$n"), preserves_flags=False),
+    # Jumping to the next instruction
+    Rule("branch_to_next", ["BR $l", "$l: *"], ["$l: *"]),
+    # Jumping over an unconditional branch
+    Rule("branch_over_branch", ["$br $l", "BR $m", "$l: *"], ["$inv $m", "$l: *"],
+         guard=_invert_branch),
+]
+
+# Rewrites found by the superoptimizer (see superoptimizer.py), loaded when the module is imported
+rewrite_table = Path(__file__).with_name('rewrites.json')
+
+
+def _distinct_cells(cells: list[str]) -> Callable[[Bindings], bool]:
+    '''Rewrites were verified with each memory variable referring to a different location'''
+    def guard(bindings: Bindings) -> bool:
+        locations = [(bindings[operand], mode)
+                     for operand, mode in (cell.split(",") for cell in cells)]
+        return len(set(locations)) == len(locations)
+    return guard
+
+
+def load_rewrites(path: Path) -> list[Rule]:
+    if not path.exists():
+        return []
+    with open(path) as f:
+        entries = json.load(f)
+    return [Rule(f"rewrite_{idx}", entry["pattern"], entry["replacement"],
+                 guard=_distinct_cells(entry["cells"]) if len(entry["cells"]) > 1 else None,
+                 preserves_flags=entry["preserves_flags"])
+            for idx, entry in enumerate(entries)]
+
+
+_default_engine = RuleEngine(default_rules + load_rewrites(rewrite_table))
+
+
+def peephole_rules(instructions: list[LabeledInstruction]) -> list[LabeledInstruction]:
+    '''Applies the default peephole rules'''
+    return _default_engine(instructions)
@@ -0,0 +1,192 @@
+from ...common.Types import LabeledInstruction
+from ...common.Utils import split_instruction, flags_live
+from ...common.CostModel import CostModel
+from itertools import count
+
+
+# Instructions computing a new register value from the register and (optionally) an operand
+_binary_ops = {"ADD", "SUB", "AND", "OR"}
+_unary_ops = {"NOT", "NEG", "ASL", "ASR"}
+_commutative_ops = {"ADD", "AND", "OR"}
+
+# Instructions after which the next instruction is only reachable through a label
+_block_enders = ("BR", "RET", "STOP")
+
+
+def local_value_numbering(instructions: list[LabeledInstruction],
+                          costs: CostModel | None = None) -> list[LabeledInstruction]:
+    '''
+    Numbers the values held by registers and memory over each (extended) basic block, so loads of
+    a value that is already in a register, stores of a value already in memory, and sequences
+    recomputing a value that was stored away are removed or replaced by a single load (when the
+    cost model agrees it is cheaper).
+    Array elements are keyed by their base and the value number of the index register.
+    '''
+    costs = costs if costs is not None else CostModel()
+    value_numbers = count()
+    expressions: dict[tuple, int] = {}
+    memory: dict[tuple, int] = {}
+    holders: dict[int, set[tuple]] = {}
+    registers: dict[str, int] = {}
+    # Where the computation currently in each register started (in new_instructions), and what
+    # the register held before it
+    sequence_start: dict[str, int | None] = {}
+    sequence_before: dict[str, int] = {}
+
+    def reset():
+        expressions.clear()
+        memory.clear()
+        holders.clear()
+        for reg in "AX":
+            registers[reg] = next(value_numbers)
+            sequence_start[reg] = None
+
+    def location(operand: str, mode: str) -> tuple | None:
+        if mode in ("d", "s"):
+            return (operand, mode)
+        if mode in ("x", "sx"):
+            return (operand, mode, registers["X"])
+        # Indirect modes could refer to anything
+        return None
+
+    def value_of(operand: str, mode: str) -> int:
+        if mode == "i":
+            key = ("i", operand)
+            if key not in expressions:
+                expressions[key] = next(value_numbers)
+            return expressions[key]
+        loc = location(operand, mode)
+        if loc is None:
+            return next(value_numbers)
+        if loc not in memory:
+            store(loc, next(value_numbers))
+        return memory[loc]
+
+    def store(loc: tuple, value: int):
+        if loc in memory:
+            holders[memory[loc]].discard(loc)
+        memory[loc] = value
+        holders.setdefault(value, set()).add(loc)
+
+    def forget(predicate):
+        for loc in [loc for loc in memory if predicate(loc)]:
+            holders[memory.pop(loc)].discard(loc)
+
+    def holder_of(value: int) -> tuple | None:
+        # Prefer direct operands, indexed ones are only valid while X holds the same index
+        for loc in sorted(holders.get(value, ()), key=len):
+            if len(loc) == 2 or loc[2] == registers["X"]:
+                return loc
+        return None
+
+    reset()
+    new_instructions: list[LabeledInstruction] = []
+
+    for index, instruction in enumerate(instructions):
+        label, instr = instruction
+        mnemonic, operand, mode = split_instruction(instr)
+
+        if label is not None:
+            # Branched to from somewhere else, nothing is known
+            reset()
+
+        if mnemonic == "" or mnemonic.startswith("NOP"):
+            # Comments and padding carry no values, but do split up computations
+            new_instructions.append(instruction)
+            sequence_start["A"] = sequence_start["X"] = None
+            continue
+
+        reg = mnemonic[-1]
+        op = mnemonic[:-1]
+
+        if mnemonic in ("LDWA", "LDWX"):
+            assert operand is not None and mode is not None
+            value = value_of(operand, mode)
+            if registers[reg] == value and label is None and not flags_live(instructions, index):
+                continue
+            sequence_before[reg] = registers[reg]
+            registers[reg] = value
+            sequence_start[reg] = len(new_instructions)
+            sequence_start["X" if reg == "A" else "A"] = None
+            new_instructions.append(instruction)
+            continue
+
+        if reg in "AX" and (op in _binary_ops or op in _unary_ops):
+            if op in _binary_ops:
+                assert operand is not None and mode is not None
+                operands = [registers[reg], value_of(operand, mode)]
+                if op in _commutative_ops:
+                    operands.sort()
+                key: tuple = (op, *operands)
+            else:
+                key = (op, registers[reg])
+            if key not in expressions:
+                expressions[key] = next(value_numbers)
+            registers[reg] = expressions[key]
+            sequence_start["X" if reg == "A" else "A"] = None
+            new_instructions.append(instruction)
+
+            start = sequence_start[reg]
+            if start is None or flags_live(instructions, index):
+                continue
+            first_label, _ = new_instructions[start]
+            if sequence_before[reg] == registers[reg] and first_label is None:
+                # Recomputed the value the register already held
+                del new_instructions[start:]
+                sequence_start[reg] = None
+            elif (holder := holder_of(registers[reg])) is not None:
+                # This value was already computed and stored away, load it instead
+                load = (first_label, f"LDW{reg} {holder[0]},{holder[1]}")
+                if costs.is_improvement(new_instructions[start:], [load]):
+                    del new_instructions[start:]
+                    new_instructions.append(load)
+            continue
+
+        if mnemonic in ("STWA", "STWX"):
+            assert operand is not None and mode is not None
+            loc = location(operand, mode)
+            if loc is not None and memory.get(loc) == registers[reg] and label is None:
+                # Memory already holds this value
+                continue
+            if loc is None:
+                forget(lambda _: True)
+            else:
+                if len(loc) == 3:
+                    # Another element of the same array could have been at this index
+                    forget(lambda other: other[:2] == loc[:2])
+                store(loc, registers[reg])
+            sequence_start["A"] = sequence_start["X"] = None
+            new_instructions.append(instruction)
+            continue
+
+        new_instructions.append(instruction)
+        sequence_start["A"] = sequence_start["X"] = None
+
+        if mnemonic == "DECI":
+            assert operand is not None and mode is not None
+            loc = location(operand, mode)
+            if loc is None:
+                forget(lambda _: True)
+            else:
+                if len(loc) == 3:
+                    forget(lambda other: other[:2] == loc[:2])
+                store(loc, next(value_numbers))
+        elif mnemonic in ("DECO", "CPWA", "CPWX", "STRO", "HEXO", "CPBA", "CPBX"):
+            # Only reads memory and registers
+            pass
+        elif mnemonic in ("ADDSP", "SUBSP"):
+            # Stack relative operands no longer refer to the same memory
+            forget(lambda loc: loc[1].startswith("s"))
+        elif mnemonic.startswith(("LDB", "ROL", "ROR")) and reg in "AX":
+            registers[reg] = next(value_numbers)
+        elif mnemonic.startswith(("BR", "CALL")) and mnemonic not in _block_enders:
+            if mnemonic == "CALL":
+                reset()
+        elif mnemonic in _block_enders or mnemonic.startswith("."):
+            # Only reachable through a label from here on
+            reset()
+        else:
+            # Unknown effects, assume the worst
+            reset()
+
+    return new_instructions
@@ -1,13 +1,63 @@
 import ast
+from typing import Callable, Iterable
 from ..common.Errors import compile_error
+from ..common.Utils import to_word, assigned_names, assign_from_augassign
+
+
+# Compile-time semantics of the supported binary operators
+binary_operators: dict[type, Callable[[int, int], int]] = {
+    ast.Add: lambda lhs, rhs: lhs + rhs,
+    ast.Sub: lambda lhs, rhs: lhs - rhs,
+    ast.BitAnd: lambda lhs, rhs: lhs & rhs,
+    ast.BitOr: lambda lhs, rhs: lhs | rhs,
+    ast.LShift: lambda lhs, rhs: lhs << rhs,
+    ast.RShift: lambda lhs, rhs: lhs >> rhs,
+    ast.FloorDiv: lambda lhs, rhs: lhs // rhs,
+    ast.Mod: lambda lhs, rhs: lhs % rhs,
+}
+
+
+def is_defined(op: ast.operator, rhs: int) -> bool:
+    '''Negative shift counts and division by zero are errors in Python, left to run time'''
+    if isinstance(op, (ast.LShift, ast.RShift)):
+        return rhs >= 0
+    if isinstance(op, (ast.FloorDiv, ast.Mod)):
+        return rhs != 0
+    return True
+
+
+# Compile-time semantics of the supported unary operators
+unary_operators: dict[type, Callable[[int], int]] = {
+    ast.USub: lambda operand: -operand,
+    ast.UAdd: lambda operand: operand,
+    ast.Invert: lambda operand: ~operand,
+}
+
+# Compile-time semantics of the supported comparisons
+comparison_operators: dict[type, Callable[[int, int], bool]] = {
+    ast.Lt: lambda lhs, rhs: lhs < rhs,
+    ast.LtE: lambda lhs, rhs: lhs <= rhs,
+    ast.Gt: lambda lhs, rhs: lhs > rhs,
+    ast.GtE: lambda lhs, rhs: lhs >= rhs,
+    ast.Eq: lambda lhs, rhs: lhs == rhs,
+    ast.NotEq: lambda lhs, rhs: lhs != rhs,
+}
+
+# Evaluates a call to a user function with constant arguments, None if that isn't possible
+CallEvaluator = Callable[[str, list[int]], int | None]
 
 
 class ConstantPropagator:
 
-    def __init__(self) -> None:
-        self.__propagated_constants: dict[str, int] = {}
+    def __init__(self,
+                 evaluator: CallEvaluator | None = None,
+                 constants: dict[str, int] | None = None) -> None:
+        self.__evaluator = evaluator
+        self.__propagated_constants: dict[str, int] = dict(constants) if constants else {}
         self.__reassigned_idents: set[str] = set()
         self.__seen_idents: set[str] = set()
+        # Names assigned within each statement, for loops nested in one another
+        self.__assigned: dict[ast.AST, frozenset[str]] = {}
 
     def try_propagate_constant(self, node: ast.AST) -> tuple[bool, bool, int]:
         '''
@@ -17,7 +67,7 @@ class ConstantPropagator:
             int: If possible, the value of the propogated constant
         '''
         if isinstance(node, ast.BinOp):
-            if not isinstance(node.op, (ast.Add, ast.Sub)):
+            if type(node.op) not in binary_operators:
                 return False, False, 0
 
             ok1, reassigned1, lhs = self.try_propagate_constant(node.left)
@@ -27,10 +77,17 @@ class ConstantPropagator:
             if not ok:
                 return False, reassigned, 0
 
-            if isinstance(node.op, ast.Add):
-                return True, reassigned, lhs + rhs
-            else:
-                return True, reassigned, lhs - rhs
+            if not is_defined(node.op, rhs):
+                return False, reassigned, 0
+            return True, reassigned, to_word(binary_operators[type(node.op)](lhs, rhs))
+
+        elif isinstance(node, ast.UnaryOp):
+            if type(node.op) not in unary_operators:
+                return False, False, 0
+            ok, reassigned, operand = self.try_propagate_constant(node.operand)
+            if not ok:
+                return False, reassigned, 0
+            return True, reassigned, to_word(unary_operators[type(node.op)](operand))
 
         elif isinstance(node, ast.Constant):
             if not isinstance(node.value, int):
@@ -44,12 +101,115 @@ class ConstantPropagator:
             return True, reassigned, self.__propagated_constants[node.id]
 
         elif isinstance(node, ast.Call):
-            # Can't evaluate a function call
+            if self.__evaluator is None or not isinstance(node.func, ast.Name) \
+                    or len(node.keywords) != 0:
+                # Can't evaluate a function call
+                return False, False, 0
+
+            args = [self.try_propagate_constant(arg) for arg in node.args]
+            reassigned = any(arg_reassigned for _, arg_reassigned, _ in args)
+            if not all(ok for ok, _, _ in args):
+                return False, reassigned, 0
+            result = self.__evaluator(node.func.id, [value for _, _, value in args])
+            if result is None:
+                return False, reassigned, 0
+            return True, reassigned, result
+
+        elif isinstance(node, (ast.Subscript, ast.List)):
+            # Arrays (and their elements) are not propagated
             return False, False, 0
 
         else:
             compile_error(node, f"Unsupported type {type(node).__name__} in expression")
 
+    def try_propagate_condition(self, node: ast.expr) -> bool | None:
+        '''The outcome of a condition, if it is known at compile time'''
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            outcome = self.try_propagate_condition(node.operand)
+            return None if outcome is None else not outcome
+
+        if isinstance(node, ast.BoolOp):
+            # Known if any operand decides the outcome, or if every operand is known
+            decides = isinstance(node.op, ast.Or)
+            outcomes = [self.try_propagate_condition(value) for value in node.values]
+            if decides in outcomes:
+                return decides
+            return None if None in outcomes else not decides
+
+        if not isinstance(node, ast.Compare) \
+                or any(type(op) not in comparison_operators for op in node.ops):
+            return None
+        operands = [self.try_propagate_constant(operand)
+                    for operand in [node.left, *node.comparators]]
+        if not all(ok for ok, _, _ in operands):
+            return None
+        values = [value for _, _, value in operands]
+        return all(comparison_operators[type(op)](lhs, rhs)
+                   for lhs, op, rhs in zip(values, node.ops, values[1:]))
+
+    def try_propagate_trip_count(self, node: ast.While, max_trips: int = 0x10000) -> int | None:
+        '''
+        Number of iterations of a loop counting with a single variable by a constant step (ex.
+        while i < _N: ... i += 1), if known at compile time. The constants must be those from
+        before the loop
+        '''
+        test = node.test
+        if not isinstance(test, ast.Compare) or len(test.ops) != 1 \
+                or type(test.ops[0]) not in comparison_operators \
+                or not isinstance(test.left, ast.Name):
+            return None
+        counter, bound = test.left.id, test.comparators[0]
+
+        # The counter must be updated exactly once per iteration, and nothing else it depends on
+        steps = [stmt for stmt in node.body if counter in self.assigned_names([stmt])]
+        if len(steps) != 1 or not isinstance(steps[0], (ast.Assign, ast.AugAssign)):
+            return None
+        update = steps[0] if isinstance(steps[0], ast.Assign) else assign_from_augassign(steps[0])
+        value = update.value
+        if not isinstance(value, ast.BinOp) or not isinstance(value.op, (ast.Add, ast.Sub)) \
+                or not isinstance(value.left, ast.Name) or value.left.id != counter:
+            return None
+        assigned = self.assigned_names(node.body)
+        if any(isinstance(name, ast.Name) and name.id in assigned
+               for name in [*ast.walk(bound), *ast.walk(value.right)]):
+            return None
+
+        known = [self.try_propagate_constant(operand)
+                 for operand in (test.left, bound, value.right)]
+        if not all(ok for ok, _, _ in known):
+            return None
+        current, limit, step = (value for _, _, value in known)
+        if isinstance(value.op, ast.Sub):
+            step = -step
+
+        trips = 0
+        while comparison_operators[type(test.ops[0])](current, limit):
+            trips += 1
+            if trips > max_trips:
+                return None
+            current = to_word(current + step)
+        return trips
+
+    def assigned_names(self, statements: Iterable[ast.AST]) -> set[str]:
+        return assigned_names(statements, self.__assigned)
+
+    def forget(self, identifiers: Iterable[str]):
+        '''The identifiers could have any value from now on (ex. assigned in a loop)'''
+        for identifier in identifiers:
+            self.__propagated_constants.pop(identifier, None)
+
+    def snapshot(self) -> dict[str, int]:
+        return self.__propagated_constants.copy()
+
+    def merge(self, snapshot: dict[str, int]):
+        '''Only keep the constants that have the same value in snapshot (ex. after an if/else)'''
+        for identifier, value in list(self.__propagated_constants.items()):
+            if snapshot.get(identifier) != value:
+                self.__propagated_constants.pop(identifier)
+
+    def restore(self, snapshot: dict[str, int]):
+        self.__propagated_constants = snapshot.copy()
+
     def add_assign(self, identifier: str, node: ast.expr):
         is_constexpr, used_reassigned, const_val = self.try_propagate_constant(node)
 
@@ -73,3 +233,15 @@ class ConstantPropagator:
 
     @property
     def seen_idents(self): return self.__seen_idents
+
+
+class LiteralFolding(ast.NodeTransformer):
+    """Folds unary operators applied to literals (ex. -1 or ~0) into a single constant"""
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        self.generic_visit(node)
+        if isinstance(node.operand, ast.Constant) and isinstance(node.operand.value, int) \
+                and type(node.op) in unary_operators:
+            value = to_word(unary_operators[type(node.op)](node.operand.value))
+            return ast.copy_location(ast.Constant(value=value), node)
+        return node
@@ -0,0 +1,91 @@
+import ast
+from ..common.Errors import compile_error
+from ..common.Utils import is_constant_ident, is_array_ident
+from .ConstantPropagator import ConstantPropagator, CallEvaluator
+
+
+class ConstantTableFolding(ast.NodeTransformer):
+    """
+    Evaluates the initializers of arrays at compile time, so list literals (ex. [1, 2 * _N, f(3)])
+    and comprehensions over a constant range (ex. [f(i) for i in range(_N) if i > 0])
+    become lists of constants that can be emitted as static data
+    """
+
+    def __init__(self, evaluator: CallEvaluator | None = None, max_elements: int = 4096) -> None:
+        super().__init__()
+        self.__evaluator = evaluator
+        self.__max_elements = max_elements
+        self.__constants = ConstantPropagator(evaluator)
+        self.__in_function = False
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        # Module constants are the only names known within functions
+        self.__in_function = True
+        self.generic_visit(node)
+        self.__in_function = False
+        return node
+
+    def visit_Assign(self, node: ast.Assign):
+        target = node.targets[0]
+        if isinstance(target, ast.Name) and is_constant_ident(target.id) \
+                and not self.__in_function:
+            self.__constants.add_assign(target.id, node.value)
+        elif isinstance(target, ast.Name) and is_array_ident(target.id):
+            node.value = self.__fold(node.value)
+        return node
+
+    def __fold(self, node: ast.expr) -> ast.expr:
+        if isinstance(node, ast.List):
+            values = [self.__constant(elt, self.__constants) for elt in node.elts]
+        elif isinstance(node, ast.ListComp):
+            values = self.__comprehension(node)
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult) \
+                and isinstance(node.left, ast.List):
+            # Zero initialized arrays only need their size to be known, ex. [0] * _N
+            size = self.__constant(node.right, self.__constants, "Array size")
+            node.right = ast.copy_location(ast.Constant(value=size), node.right)
+            return node
+        else:
+            return node
+        if len(values) > self.__max_elements:
+            compile_error(node, f"Array initializer has more than {self.__max_elements} elements")
+        elts: list[ast.expr] = [ast.copy_location(ast.Constant(value=v), node) for v in values]
+        return ast.copy_location(ast.List(elts=elts, ctx=ast.Load()), node)
+
+    def __comprehension(self, node: ast.ListComp) -> list[int]:
+        if len(node.generators) != 1:
+            compile_error(node, "Only comprehensions with a single for clause are supported")
+        generator = node.generators[0]
+        if not isinstance(generator.target, ast.Name) or generator.is_async:
+            compile_error(generator.target, "Comprehension must iterate with a single name")
+        iterable = generator.iter
+        if not isinstance(iterable, ast.Call) or not isinstance(iterable.func, ast.Name) \
+                or iterable.func.id != 'range' or not 1 <= len(iterable.args) <= 3:
+            compile_error(iterable, "Comprehension must iterate over range(...)")
+
+        bounds = [self.__constant(arg, self.__constants, "Range") for arg in iterable.args]
+        indices = range(*bounds)
+        if len(indices) > self.__max_elements:
+            compile_error(node, f"Array initializer has more than {self.__max_elements} elements")
+
+        values: list[int] = []
+        for index in indices:
+            # Evaluate the element with the loop variable bound, on top of the module constants
+            scope = ConstantPropagator(self.__evaluator, self.__constants.propagated_constants)
+            scope.add_assign(generator.target.id, ast.Constant(value=index))
+            if all(self.__condition(test, scope) for test in generator.ifs):
+                values.append(self.__constant(node.elt, scope))
+        return values
+
+    def __condition(self, node: ast.expr, scope: ConstantPropagator) -> bool:
+        result = scope.try_propagate_condition(node)
+        if result is None:
+            compile_error(node, "Comprehension condition must be known at compile time")
+        return result
+
+    def __constant(self, node: ast.expr, scope: ConstantPropagator,
+                   what: str = "Array elements") -> int:
+        is_constexpr, _, value = scope.try_propagate_constant(node)
+        if not is_constexpr:
+            compile_error(node, f"{what} must be known at compile time")
+        return value
@@ -0,0 +1,26 @@
+import ast
+from typing import Any, Callable
+
+
+class DispatchVisitor(ast.NodeVisitor):
+    """
+    A NodeVisitor whose handlers (visit_<NodeType> methods) are found once per class, in a table
+    from node types to handlers, rather than looked up by name for every node visited
+    """
+
+    _handlers: dict[type, Callable[[Any, Any], Any]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._handlers = {}
+        for name in dir(cls):
+            node_type = getattr(ast, name[len('visit_'):], None) if name.startswith('visit_') \
+                else None
+            if isinstance(node_type, type) and issubclass(node_type, ast.AST):
+                cls._handlers[node_type] = getattr(cls, name)
+
+    def visit(self, node: ast.AST):
+        handler = self._handlers.get(type(node))
+        if handler is None:
+            return self.generic_visit(node)
+        return handler(self, node)
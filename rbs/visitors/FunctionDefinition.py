@@ -1,25 +1,36 @@
 import ast
 from ..common.Errors import compile_error, ensure_assign, ensure_array
 from ..common.SymbolTable import SymbolTable
-from ..common.Utils import is_constant_ident, is_array_ident, assign_from_augassign
-from ..common.Types import CallFrame, LocalVariable
-# from .ConstantPropagator import ConstantPropagator
+from ..common.Utils import is_constant_ident, is_array_ident, assign_from_augassign, \
+    array_initializer, element_size, is_byte_array_ident
+from ..common.Types import CallFrame, LocalVariable, LabeledInstruction
+from .ConstantPropagator import CallEvaluator
+from ..generators.Instrumentation import Instrumentation
+from ..common.Profile import Profile, function_key
 from .ProceduralInstructions import ProceduralInstructions
 from collections import defaultdict
+from itertools import chain
 
 
 class FunctionDefinition(ProceduralInstructions):
 
     def __init__(self,
                  global_symbols: SymbolTable,
-                 function_labels: SymbolTable) -> None:
-        super().__init__(global_symbols, function_labels)
+                 function_labels: SymbolTable,
+                 evaluator: CallEvaluator | None = None,
+                 constants: dict[str, int] | None = None,
+                 instrumentation: Instrumentation | None = None,
+                 profile: Profile | None = None) -> None:
+        super().__init__(global_symbols, function_labels, evaluator, constants, instrumentation,
+                         profile)
         self.__current_func: str | None = None
         self.__function_returned = False
         self.__local_variables: dict[str, CallFrame] = defaultdict(CallFrame)
         self.__global_variables = global_symbols
         self.__global_names = set(self.__global_variables)
         self.__function_labels = function_labels
+        # Where the instructions of each function start and end
+        self.__bodies: dict[str, tuple[int, int]] = {}
 
     def visit(self, node: ast.AST):
         # Do not visit anything that is not a function or within a function
@@ -35,7 +46,7 @@ class FunctionDefinition(ProceduralInstructions):
 
         var_defn: LocalVariable = (label, self.__stack_space, size)
         self.__local_variables[self.__current_func].locals[ident] = var_defn
-        self.__stack_space += 2 * size
+        self.__stack_space += element_size(ident) * size
         self.__local_variables[self.__current_func].stack_space = self.__stack_space
 
     def __try_allocate_vars(self, node: ast.AST):
@@ -45,7 +56,7 @@ class FunctionDefinition(ProceduralInstructions):
                 self.__try_allocate_vars(stmt)
             return
         elif isinstance(node, ast.If):
-            for stmt in node.body + node.orelse:
+            for stmt in chain(node.body, node.orelse):
                 self.__try_allocate_vars(stmt)
             return
         elif isinstance(node, (ast.AugAssign, ast.Assign)):
@@ -55,7 +66,8 @@ class FunctionDefinition(ProceduralInstructions):
             ensure_assign(node)
             target = node.targets[0]
             if isinstance(target, ast.Name):
-                arr_size = 1 if not is_array_ident(target.id) else ensure_array(node.value)
+                arr_size = 1 if not is_array_ident(target.id) \
+                    else ensure_array(node.value, element_size(target.id))
                 self.__allocate_var(target.id, arr_size)
                 return
             elif isinstance(target, ast.Subscript):
@@ -82,9 +94,12 @@ class FunctionDefinition(ProceduralInstructions):
 
         self.__stack_space = 0
         self.__current_func = node.name
+        start = len(self._instructions)
         self.__function_returned = False
-        self._variable_names = self.__global_names.copy()
-        # self.__constant_propagator = ConstantPropagator()
+        # Globals are looked up in a shared set, rather than copied for every function
+        self._variable_names = set()
+        self._outer_names = self.__global_names
+        self._reset_constant_propagation()
         func_label = self.__function_labels.lookup_or_create(self.__current_func)
 
         for arg in node.args.args:
@@ -104,6 +119,8 @@ class FunctionDefinition(ProceduralInstructions):
         self.__locals = f'{" ".join("#"+name for name in locals)}'
         instruction = f'SUBSP {self.__stack_space},i ; push {self.__locals}'
         self._record_instruction(instruction, label=func_label)
+        if self._instrumentation is not None:
+            self._record_increment(function_key(self.__current_func))
 
         # Emit body
         for stmt in node.body:
@@ -114,23 +131,36 @@ class FunctionDefinition(ProceduralInstructions):
             self._record_instruction(f'ADDSP {self.__stack_space},i ; pop {self.__locals}')
             self._record_instruction('RET')
 
+        self.__bodies[node.name] = (start, len(self._instructions))
         self.__current_func = None
 
     def visit_Assign(self, node: ast.Assign):
         ident, target, subscript = super().visit_Assign(node)
 
-        # TODO: Propagte constants
         if is_array_ident(ident):
-            if ident in self._variable_names:
+            if self._is_declared(ident):
                 # Don't allow reassignment
                 if subscript is None:
                     compile_error(node, "Cannot use array as integer type")
             else:
                 self._variable_names.add(ident)
+                values = array_initializer(node.value)
+                if values is not None:
+                    self.__initialize_array(ident, values)
                 return
 
         self._assign_store(node, ident, target, subscript)
 
+    def __initialize_array(self, ident: str, values: list[int]):
+        '''Store the elements of a local array literal, since the stack isn't initialized'''
+        assert self.__current_func is not None
+        ident_label, _, _ = self.__local_variables[self.__current_func].locals[ident]
+        size = element_size(ident)
+        for index, value in enumerate(values):
+            self._record_instruction(f'LDWA {value},i')
+            self._record_instruction(f'LDWX {size * index},i')
+            self._record_instruction(f'{"STBA" if size == 1 else "STWA"} {ident_label},sx')
+
     def _access_memory(self, node: ast.expr, instruction: str, label=None):
         super()._access_memory(node, instruction, label)
         if self.__current_func is None:
@@ -148,6 +178,9 @@ class FunctionDefinition(ProceduralInstructions):
 
             if ident in curr_func:
                 # Local variable
+                if isinstance(node, ast.Subscript) and is_byte_array_ident(ident):
+                    self._access_byte(node, instruction, f'{curr_func[ident][0]},sx', label)
+                    return
                 if isinstance(node, ast.Subscript):
                     addr_mode = 'sx'
                     self._access_memory(node.slice, 'LDWX')
@@ -159,6 +192,10 @@ class FunctionDefinition(ProceduralInstructions):
 
             elif ident in self.__global_variables:
                 # Global variable
+                if isinstance(node, ast.Subscript) and is_byte_array_ident(ident):
+                    assert self._ident_labels is not None
+                    self._access_byte(node, instruction, f'{self._ident_labels[ident]},x', label)
+                    return
                 if isinstance(node, ast.Subscript):
                     addr_mode = 'x'
                     self._access_memory(node.slice, 'LDWX')
@@ -179,3 +216,7 @@ class FunctionDefinition(ProceduralInstructions):
 
     @property
     def local_variables(self): return self.__local_variables
+
+    @property
+    def function_instructions(self) -> dict[str, list[LabeledInstruction]]:
+        return {name: self._instructions[start:end] for name, (start, end) in self.__bodies.items()}
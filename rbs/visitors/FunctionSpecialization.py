@@ -0,0 +1,169 @@
+import ast
+import copy
+from collections import Counter, defaultdict
+from ..common.Utils import is_constant_ident, assigned_names
+from .ConstantPropagator import ConstantPropagator
+
+
+class FunctionSpecializer(ast.NodeTransformer):
+    """
+    Interprocedural constant propagation: parameters that receive the same constant at every call
+    site are removed and replaced by that constant, and small functions get specialized clones for
+    constant arguments that are passed repeatedly (or from within a loop)
+    """
+
+    def __init__(self, max_statements: int = 12, max_clones: int = 4) -> None:
+        super().__init__()
+        self.__max_statements = max_statements
+        self.__max_clones = max_clones
+        self.__constants = ConstantPropagator()
+        self.__functions: dict[str, ast.FunctionDef] = {}
+        # Every call to a user function (by callee), with the function it appears in and whether
+        # in a loop
+        self.__call_sites: dict[str, list[tuple[ast.Call, str | None, bool]]] = defaultdict(list)
+        self.__current_func: str | None = None
+        self.__loop_depth = 0
+
+    def specialize(self, root: ast.Module) -> ast.Module:
+        self.visit(root)
+
+        for func in list(self.__functions.values()):
+            self.__propagate_uniform(func)
+        for func in list(self.__functions.values()):
+            self.__clone_hot(root, func)
+
+        return ast.fix_missing_locations(root)
+
+    def visit_Assign(self, node: ast.Assign):
+        target = node.targets[0]
+        if self.__current_func is None and isinstance(target, ast.Name) \
+                and is_constant_ident(target.id):
+            self.__constants.add_assign(target.id, node.value)
+        return self.generic_visit(node)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self.__functions[node.name] = node
+        self.__current_func = node.name
+        self.generic_visit(node)
+        self.__current_func = None
+        return node
+
+    def visit_While(self, node: ast.While):
+        self.__loop_depth += 1
+        self.generic_visit(node)
+        self.__loop_depth -= 1
+        return node
+
+    def visit_Call(self, node: ast.Call):
+        if isinstance(node.func, ast.Name) and node.func.id in self.__functions:
+            self.__call_sites[node.func.id].append((node, self.__current_func,
+                                                    self.__loop_depth > 0))
+        return self.generic_visit(node)
+
+    def __constant_argument(self, arg: ast.expr) -> int | None:
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, int):
+            return arg.value
+        if isinstance(arg, ast.Name) and is_constant_ident(arg.id):
+            return self.__constants.propagated_constants.get(arg.id)
+        return None
+
+    def __calls_to(self, name: str) -> list[tuple[ast.Call, str | None, bool]]:
+        # Calls redirected to a clone no longer call name
+        return [site for site in self.__call_sites.get(name, [])
+                if isinstance(site[0].func, ast.Name) and site[0].func.id == name]
+
+    def __propagate_uniform(self, func: ast.FunctionDef):
+        '''Remove parameters that receive the same constant at every call site'''
+        sites = self.__calls_to(func.name)
+        if len(sites) == 0 or any(len(call.args) != len(func.args.args) for call, _, _ in sites):
+            return
+
+        uniform: dict[int, int] = {}
+        for idx in range(len(func.args.args)):
+            values = {self.__constant_argument(call.args[idx]) for call, _, _ in sites}
+            if len(values) == 1 and None not in values:
+                uniform[idx] = values.pop()  # type: ignore
+
+        if len(uniform) > 0:
+            self.__bind_parameters(func, uniform)
+            for call, _, _ in sites:
+                call.args = [arg for idx, arg in enumerate(call.args) if idx not in uniform]
+
+    def __clone_hot(self, root: ast.Module, func: ast.FunctionDef):
+        '''Clone small functions for the constant arguments they are called with most'''
+        if sum(isinstance(n, ast.stmt) for n in ast.walk(func)) > self.__max_statements:
+            return
+
+        keys: dict[int, tuple[tuple[int, int], ...]] = {}
+        heat: Counter[tuple[tuple[int, int], ...]] = Counter()
+        for call, caller, in_loop in self.__calls_to(func.name):
+            if caller == func.name or len(call.args) != len(func.args.args):
+                # The clone is defined after the original, so recursive calls can't reach it
+                continue
+            args = ((idx, self.__constant_argument(arg)) for idx, arg in enumerate(call.args))
+            key = tuple((idx, value) for idx, value in args if value is not None)
+            if len(key) > 0:
+                keys[id(call)] = key
+                heat[key] += 2 if in_loop else 1
+
+        hot = [key for key, count in heat.most_common(self.__max_clones) if count > 1]
+        if len(hot) == 0:
+            return
+        position = root.body.index(func) + 1
+        for key in hot:
+            params = ", ".join(f"{func.args.args[idx].arg}={value}" for idx, value in key)
+            clone = copy.deepcopy(func)
+            clone.name = f"{func.name}({params})"
+            self.__bind_parameters(clone, dict(key))
+            root.body.insert(position, clone)
+            position += 1
+            self.__functions[clone.name] = clone
+
+            for call, _, _ in self.__calls_to(func.name):
+                if keys.get(id(call)) == key:
+                    call.func = ast.copy_location(ast.Name(id=clone.name, ctx=ast.Load()),
+                                                  call.func)
+                    call.args = [arg for idx, arg in enumerate(call.args) if idx not in dict(key)]
+
+    def __bind_parameters(self, func: ast.FunctionDef, values: dict[int, int]):
+        '''Turn the given parameters of func into constants'''
+        assigned = assigned_names(func.body)
+
+        substitutions: dict[str, int] = {}
+        initializers: list[ast.stmt] = []
+        for idx, value in values.items():
+            arg = func.args.args[idx]
+            if arg.arg in assigned:
+                # The parameter is modified, so it becomes a local initialized to the constant
+                initializers.append(ast.copy_location(ast.Assign(
+                    targets=[ast.Name(id=arg.arg, ctx=ast.Store())],
+                    value=ast.Constant(value=value)), arg))
+            else:
+                substitutions[arg.arg] = value
+
+        func.args.args = [arg for idx, arg in enumerate(func.args.args) if idx not in values]
+        func.body = initializers + func.body
+        if len(substitutions) > 0:
+            _ParameterSubstitution(substitutions).visit(func)
+
+
+class _ParameterSubstitution(ast.NodeTransformer):
+    """Replaces reads of the given names by constants, folding expressions that become constant"""
+
+    def __init__(self, substitutions: dict[str, int]) -> None:
+        super().__init__()
+        self.__substitutions = substitutions
+        self.__constants = ConstantPropagator()
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load) and node.id in self.__substitutions:
+            return ast.copy_location(ast.Constant(value=self.__substitutions[node.id]), node)
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp):
+        self.generic_visit(node)
+        if isinstance(node.left, ast.Constant) and isinstance(node.right, ast.Constant):
+            is_constexpr, _, value = self.__constants.try_propagate_constant(node)
+            if is_constexpr:
+                return ast.copy_location(ast.Constant(value=value), node)
+        return node
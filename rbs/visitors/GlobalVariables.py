@@ -1,18 +1,22 @@
 import ast
 from ..common.Errors import compile_error, ensure_assign, ensure_array
 from ..common.Types import GlobalVariable, InitKind
-from ..common.Utils import is_constant_ident, is_array_ident, next_name_generator
+from ..common.Utils import is_constant_ident, is_array_ident, next_name_generator, \
+    array_initializer, element_size, is_byte_array_ident
 from ..common.SymbolTable import SymbolTable
-from .ConstantPropagator import ConstantPropagator
+from .ConstantPropagator import ConstantPropagator, CallEvaluator
+from .DispatchVisitor import DispatchVisitor
 
 
-class GlobalVariableExtraction(ast.NodeVisitor):
+class GlobalVariableExtraction(DispatchVisitor):
     """We extract all the left hand side of the global (top-level) assignments"""
 
-    def __init__(self) -> None:
+    def __init__(self, evaluator: CallEvaluator | None = None) -> None:
         super().__init__()
         self.__results: list[GlobalVariable] = list()
-        self.__constant_propagator = ConstantPropagator()
+        # Updated as variables are found, so the top level can be generated in the same traversal
+        self.__initial_values: dict[str, int] = {}
+        self.__constant_propagator = ConstantPropagator(evaluator)
         self.__ident_label_generator = SymbolTable(next_name_generator(8))
 
     def visit(self, node: ast.AST):
@@ -42,12 +46,27 @@ class GlobalVariableExtraction(ast.NodeVisitor):
         elif first_seen_now:
             if is_constexpr:
                 self.__results.append((ident, InitKind.WORD, const_val))
+                self.__initial_values[ident] = const_val
             else:
-                arr_size = 1 if not is_array_ident(ident) else ensure_array(node.value)
-                self.__results.append((ident, InitKind.BLOCK, 2 * arr_size))
+                size = element_size(ident)
+                arr_size = 1 if not is_array_ident(ident) else ensure_array(node.value, size)
+                values = array_initializer(node.value)
+                if values is not None:
+                    kind = InitKind.BYTE if is_byte_array_ident(ident) else InitKind.WORD
+                    self.__results.append((ident, kind, values))
+                else:
+                    self.__results.append((ident, InitKind.BLOCK, size * arr_size))
 
     @property
     def results(self): return self.__results
 
+    @property
+    def constants(self) -> dict[str, int]:
+        return {ident: value for ident, kind, value in self.__results
+                if kind == InitKind.EQUATE and isinstance(value, int)}
+
+    @property
+    def initial_values(self) -> dict[str, int]: return self.__initial_values
+
     @property
     def symbol_table(self): return self.__ident_label_generator
@@ -0,0 +1,169 @@
+import ast
+import copy
+from ..common.Utils import is_array_ident, is_constant_ident, assigned_names
+from ..common.Profile import Profile, call_key
+
+
+class HotCallInlining(ast.NodeTransformer):
+    """
+    Replaces the calls that ran most often in a profiling run (and more often than the code making
+    them was entered, ex. within a loop) by the body of the function they call, with its parameters
+    and locals renamed so they can't clash with the caller's. Only small functions returning (if
+    at all) at the very end are inlined, into statements assigning or discarding the value of the
+    call
+    """
+
+    def __init__(self, profile: Profile, max_statements: int = 12, min_share: float = 0.1) -> None:
+        super().__init__()
+        self.__profile = profile
+        self.__max_statements = max_statements
+        # Call sites running less often than this share of the hottest one are left alone
+        self.__min_share = min_share
+        self.__functions: dict[str, ast.FunctionDef] = {}
+        self.__names: set[str] = set()
+        self.__inlined = 0
+        # Names the statement being transformed may not redefine: the locals of the function it
+        # is in, or the globals not assigned yet at the top level
+        self.__caller_locals: set[str] | None = None
+        self.__caller: str | None = None
+        self.__declared: set[str] = set()
+        self.__hottest = 0
+
+    def inline(self, root: ast.Module) -> ast.Module:
+        self.__functions = {node.name: node for node in root.body
+                            if isinstance(node, ast.FunctionDef)}
+        for node in ast.walk(root):
+            if isinstance(node, ast.Name):
+                self.__names.add(node.id)
+            elif isinstance(node, ast.arg):
+                self.__names.add(node.arg)
+        self.__names |= self.__functions.keys()
+        self.__hottest = max((self.__profile.count(call_key(node.lineno)) for node in ast.walk(root)
+                              if isinstance(node, ast.Call)), default=0)
+        if self.__hottest < 2:
+            return root
+
+        body = []
+        for statement in root.body:
+            transformed = self.visit(statement)
+            body += transformed if isinstance(transformed, list) else [transformed]
+            if isinstance(statement, ast.FunctionDef):
+                self.__declared.add(statement.name)
+            else:
+                self.__declared |= assigned_names([statement])
+        root.body = body
+        return ast.fix_missing_locations(root)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self.__caller_locals = {arg.arg for arg in node.args.args} | assigned_names(node.body)
+        self.__caller = node.name
+        self.generic_visit(node)
+        self.__caller_locals = None
+        self.__caller = None
+        return node
+
+    def visit_Assign(self, node: ast.Assign):
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and isinstance(node.value, ast.Call):
+            inlined = self.__inline(node, node.value, node.targets[0])
+            if inlined is not None:
+                return inlined
+        return node
+
+    def visit_Expr(self, node: ast.Expr):
+        if isinstance(node.value, ast.Call):
+            inlined = self.__inline(node, node.value, None)
+            if inlined is not None:
+                return inlined
+        return node
+
+    def __is_hot(self, call: ast.Call) -> bool:
+        count = self.__profile.count(call_key(call.lineno))
+        return count > self.__profile.entries(self.__caller) \
+            and count >= self.__hottest * self.__min_share
+
+    def __inlinable(self, call: ast.Call, target: ast.Name | None) -> ast.FunctionDef | None:
+        '''The function called, if the call can be replaced by its body'''
+        if not isinstance(call.func, ast.Name) or call.func.id not in self.__functions \
+                or not self.__is_hot(call):
+            return None
+        func = self.__functions[call.func.id]
+        if len(call.args) != len(func.args.args) or len(call.keywords) > 0 \
+                or any(not isinstance(arg, (ast.Name, ast.Constant)) for arg in call.args):
+            return None
+
+        statements = [node for node in ast.walk(func) if isinstance(node, ast.stmt)]
+        if len(statements) - 1 > self.__max_statements:
+            return None
+        returns = [node for node in statements if isinstance(node, ast.Return)]
+        if len(returns) > 1 or (len(returns) == 1 and returns[0] is not func.body[-1]):
+            return None
+        if target is not None and (len(returns) == 0 or returns[0].value is None):
+            return None
+
+        calls = {node.func.id for node in ast.walk(func)
+                 if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)}
+        if func.name in calls:
+            return None
+        local_names = {arg.arg for arg in func.args.args} | assigned_names(func.body)
+        if any(is_array_ident(name) or is_constant_ident(name) for name in local_names):
+            return None
+        # Names the body reads from elsewhere must mean the same thing where it's inlined
+        outer_names = {node.id for node in ast.walk(func)
+                       if isinstance(node, ast.Name) and node.id not in local_names} - calls
+        if self.__caller_locals is not None:
+            if len(outer_names & self.__caller_locals) > 0:
+                return None
+        elif not (outer_names | (calls & self.__functions.keys())) <= self.__declared:
+            return None
+        return func
+
+    def __inline(self, node: ast.stmt, call: ast.Call,
+                 target: ast.Name | None) -> list[ast.stmt] | None:
+        func = self.__inlinable(call, target)
+        if func is None:
+            return None
+
+        # Every name of the inlined body gets the same suffix, unused anywhere else
+        local_names = {arg.arg for arg in func.args.args} | assigned_names(func.body)
+        self.__inlined += 1
+        while any(f'{name}_{func.name}{self.__inlined}' in self.__names for name in local_names):
+            self.__inlined += 1
+        renames = {name: f'{name}_{func.name}{self.__inlined}' for name in local_names}
+        self.__names |= set(renames.values())
+        if self.__caller_locals is not None:
+            self.__caller_locals |= set(renames.values())
+
+        inlined: list[ast.stmt] = [
+            ast.copy_location(ast.Assign(targets=[ast.Name(id=renames[param.arg], ctx=ast.Store())],
+                                         value=copy.deepcopy(arg)), node)
+            for param, arg in zip(func.args.args, call.args)]
+        body = [_Renaming(renames).visit(copy.deepcopy(statement)) for statement in func.body]
+        if len(body) > 0 and isinstance(body[-1], ast.Return):
+            result = body.pop().value
+            if target is not None:
+                assert result is not None
+                inlined_target = ast.Name(id=target.id, ctx=ast.Store())
+                body.append(ast.copy_location(
+                    ast.Assign(targets=[inlined_target], value=result), node))
+            elif result is not None and any(isinstance(n, ast.Call) for n in ast.walk(result)):
+                # The value is discarded, but not the calls computing it
+                body.append(ast.copy_location(ast.Expr(value=result), node))
+        return inlined + body
+
+
+class _Renaming(ast.NodeTransformer):
+    """Renames the given identifiers (not the functions called)"""
+
+    def __init__(self, renames: dict[str, str]) -> None:
+        super().__init__()
+        self.__renames = renames
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in self.__renames:
+            node.id = self.__renames[node.id]
+        return node
+
+    def visit_Call(self, node: ast.Call):
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
@@ -1,16 +1,26 @@
 import ast
 from ..common.Errors import compile_error, ensure_args, ensure_condition, ensure_assign
-from ..common.Types import LabeledInstruction
-from ..common.Utils import reversed_next_name_generator, assign_from_augassign
+from ..common.Types import LabeledInstruction, LoopInfo
+from ..common.Utils import reversed_next_name_generator, assign_from_augassign, assigned_names
 from ..common.SymbolTable import SymbolTable
+from ..common.Profile import Profile, loop_key, loop_entry_key, then_key, else_key, call_key
+from ..generators.Instrumentation import Instrumentation
+from ..generators.Division import Division
+from .ConstantPropagator import ConstantPropagator, CallEvaluator
+from .DispatchVisitor import DispatchVisitor
 from abc import ABC, abstractmethod
+from collections.abc import Set as AbstractSet
 
 
-class ProceduralInstructions(ABC, ast.NodeVisitor):
+class ProceduralInstructions(ABC, DispatchVisitor):
 
     def __init__(self,
                  symbol_table: SymbolTable | None,
-                 label_table: SymbolTable | None = None) -> None:
+                 label_table: SymbolTable | None = None,
+                 evaluator: CallEvaluator | None = None,
+                 constants: dict[str, int] | None = None,
+                 instrumentation: Instrumentation | None = None,
+                 profile: Profile | None = None) -> None:
         super().__init__()
         self._instructions: list[LabeledInstruction] = list()
         self._should_save = True
@@ -23,6 +33,20 @@ class ProceduralInstructions(ABC, ast.NodeVisitor):
         # Branch labels and functions share the same generator so they never overlap
         self._function_definitions: dict[str, int] = {}
         self._variable_names: set[str] = set()
+        # Names declared in an enclosing scope (ex. globals within functions)
+        self._outer_names: AbstractSet[str] = frozenset()
+        # Values known at compile time, used to decide conditions statically
+        self.__evaluator = evaluator
+        self.__constants = constants
+        self._constant_propagator = ConstantPropagator(evaluator, constants)
+        # Counts function calls and loop iterations at run time, if enabled
+        self._instrumentation = instrumentation
+        # Counts from a profiling run, deciding the layout of branches and loops
+        self.__profile = profile
+        # Loops by the label of their test, for estimating their cost
+        self.__loops: dict[str, LoopInfo] = {}
+        # Whether the division routine is called
+        self.__uses_division = False
 
     supported_nodes = (
         ast.Module,
@@ -32,6 +56,7 @@ class ProceduralInstructions(ABC, ast.NodeVisitor):
         ast.AugAssign,
         ast.Assign,
         ast.BinOp,
+        ast.UnaryOp,
         ast.Call,
         ast.If,
         ast.While,
@@ -50,20 +75,94 @@ class ProceduralInstructions(ABC, ast.NodeVisitor):
     def visit_Name(self, node: ast.Name):
         self._access_memory(node, 'LDWA')
 
+    # Map from binary operators to the instruction applying them to the accumulator
+    __binary_instructions = {
+        ast.Add:    'ADDA',
+        ast.Sub:    'SUBA',
+        ast.BitAnd: 'ANDA',
+        ast.BitOr:  'ORA',
+    }
+
+    # Map from unary operators to the instruction applying them to the accumulator
+    __unary_instructions = {
+        ast.USub:   'NEGA',
+        ast.Invert: 'NOTA',
+    }
+
     def visit_BinOp(self, node: ast.BinOp):
         self._access_memory(node.left, 'LDWA')
-        if isinstance(node.op, ast.Add):
-            self._access_memory(node.right, 'ADDA')
-        elif isinstance(node.op, ast.Sub):
-            self._access_memory(node.right, 'SUBA')
+        op_typ = type(node.op)
+        if op_typ in self.__binary_instructions:
+            self._access_memory(node.right, self.__binary_instructions[op_typ])
+        elif op_typ in (ast.LShift, ast.RShift):
+            self.__shift(node, 'ASLA' if op_typ is ast.LShift else 'ASRA')
+        elif op_typ in (ast.FloorDiv, ast.Mod):
+            self.__divide(node)
+        else:
+            compile_error(node, f'Unsupported binary operator: {op_typ.__name__}')
+
+    def __shift(self, node: ast.BinOp, instruction: str):
+        '''Shift the accumulator, unrolled if the count is known at compile time'''
+        is_constexpr, _, count = self._constant_propagator.try_propagate_constant(node.right)
+        if is_constexpr:
+            if count < 0:
+                compile_error(node.right, "Negative shift count")
+            if count >= 16 and instruction == 'ASLA':
+                # Every bit is shifted out
+                self._record_instruction('LDWA 0,i')
+                return
+            # Shifting right more than 15 times can't change the (sign extended) value
+            for _ in range(min(count, 15)):
+                self._record_instruction(instruction)
+            return
+
+        # Count down the index register, negative counts don't shift at all
+        test_label = self._new_label()
+        end_label = self._new_label()
+        self._access_memory(node.right, 'LDWX')
+        self._record_instruction('CPWX 0,i', label=test_label)
+        self._record_instruction(f'BRLE {end_label}')
+        self._record_instruction(instruction)
+        self._record_instruction('SUBX 1,i')
+        self._record_instruction(f'BR {test_label}')
+        self._record_instruction('NOP1', label=end_label)
+
+    def __divide(self, node: ast.BinOp):
+        '''Divide the accumulator, with a shift or a mask if the divisor is a power of two'''
+        is_constexpr, _, divisor = self._constant_propagator.try_propagate_constant(node.right)
+        if is_constexpr and divisor == 0:
+            compile_error(node.right, "Division by zero")
+        if is_constexpr and divisor > 0 and divisor & (divisor - 1) == 0:
+            # Shifting right and masking also round towards minus infinity
+            if isinstance(node.op, ast.FloorDiv):
+                for _ in range(divisor.bit_length() - 1):
+                    self._record_instruction('ASRA')
+            else:
+                self._record_instruction(f'ANDA {divisor - 1},i')
+            return
+
+        self._access_memory(node.right, 'LDWX')
+        for instruction in Division.call(isinstance(node.op, ast.Mod)):
+            self._record_instruction(instruction)
+        self.__uses_division = True
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        if isinstance(node.operand, (ast.BinOp, ast.UnaryOp)):
+            self.visit(node.operand)
         else:
-            compile_error(node, f'Unsupported binary operator: {type(node.op).__name__}')
+            self._access_memory(node.operand, 'LDWA')
+        op_typ = type(node.op)
+        if op_typ in self.__unary_instructions:
+            self._record_instruction(self.__unary_instructions[op_typ])
+        elif op_typ is not ast.UAdd:
+            compile_error(node, f'Unsupported unary operator: {op_typ.__name__}')
 
     def visit_Call(self, node: ast.Call):
         assert isinstance(node.func, ast.Name)
         # TODO: Implement unnamed expressions as arguments
         match node.func.id:
             case 'exit':
+                self._record_counters()
                 self._record_instruction('STOP')
 
             case 'int':
@@ -90,6 +189,8 @@ class ProceduralInstructions(ABC, ast.NodeVisitor):
                     compile_error(node, f'Unsupported function call: {node.func.id}')
                 num_args = self._function_definitions[func_name]
                 ensure_args(node, num_args)
+                if self.__profiling:
+                    self._record_increment(call_key(node.lineno))
 
                 # Push arguments onto the stack before calling
                 for idx, argument in enumerate(node.args):
@@ -112,70 +213,230 @@ class ProceduralInstructions(ABC, ast.NodeVisitor):
         ast.NotEq: 'BREQ',
     }
 
+    # Map from node types to the mnemonic branching when the comparison holds
+    __comparisons = {
+        ast.Lt:    'BRLT',
+        ast.LtE:   'BRLE',
+        ast.Gt:    'BRGT',
+        ast.GtE:   'BRGE',
+        ast.Eq:    'BREQ',
+        ast.NotEq: 'BRNE',
+    }
+
     def __branch_compare(self, node: ast.If | ast.While, entry_label: str | None, exit_label: str):
         '''Common logic shared between if and while statements'''
         ensure_condition(node.test)
-        assert isinstance(node.test, ast.Compare)
-        cmp: ast.Compare = node.test
-
-        lhs, rhs = cmp.left, cmp.comparators[0]
-        self._access_memory(lhs, 'LDWA', label=entry_label)
-        self._access_memory(rhs, 'CPWA')
+        if entry_label is not None:
+            # The first comparison may not start with an instruction that can hold the label
+            self._record_instruction('NOP1', label=entry_label)
+        self.__branch_if(node.test, False, exit_label)
+
+    def __branch_if(self, test: ast.expr, outcome: bool, target_label: str):
+        '''Branch to target_label when test evaluates to outcome, fall through otherwise'''
+        known = self._constant_propagator.try_propagate_condition(test)
+        if known is not None:
+            if known == outcome:
+                self._record_instruction(f'BR {target_label}')
+            return
+
+        if isinstance(test, ast.UnaryOp):
+            assert isinstance(test.op, ast.Not)
+            self.__branch_if(test.operand, not outcome, target_label)
+
+        elif isinstance(test, ast.BoolOp):
+            # Short-circuit: with 'and' any false operand decides, with 'or' any true operand
+            decides = isinstance(test.op, ast.Or)
+            if decides == outcome:
+                for value in test.values:
+                    self.__branch_if(value, outcome, target_label)
+            else:
+                skip_label = self._new_label()
+                for value in test.values[:-1]:
+                    self.__branch_if(value, decides, skip_label)
+                self.__branch_if(test.values[-1], outcome, target_label)
+                self._record_instruction('NOP1', label=skip_label)
+
+        elif isinstance(test, ast.Compare) and len(test.ops) > 1:
+            # a < b < c is the same as a < b and b < c
+            operands = [test.left, *test.comparators]
+            pairs: list[ast.expr] = [
+                ast.copy_location(ast.Compare(left=lhs, ops=[op], comparators=[rhs]), test)
+                for lhs, op, rhs in zip(operands, test.ops, operands[1:])]
+            self.__branch_if(ast.copy_location(ast.BoolOp(op=ast.And(), values=pairs), test),
+                             outcome, target_label)
 
-        cmp_typ = type(cmp.ops[0])
-        if cmp_typ not in self.__inv_comparisons:
-            compile_error(node, f"Unsuppored comparison '{cmp_typ.__name__}'")
+        else:
+            assert isinstance(test, ast.Compare)
+            cmp_typ = type(test.ops[0])
+            if cmp_typ not in self.__inv_comparisons:
+                compile_error(test, f"Unsuppored comparison '{cmp_typ.__name__}'")
 
-        self._record_instruction(f'{self.__inv_comparisons[cmp_typ]} {exit_label}')
+            self._access_memory(test.left, 'LDWA')
+            self._access_memory(test.comparators[0], 'CPWA')
+            branches = self.__comparisons if outcome else self.__inv_comparisons
+            self._record_instruction(f'{branches[cmp_typ]} {target_label}')
 
     def visit_If(self, node: ast.If):
+        outcome = self._constant_propagator.try_propagate_condition(node.test)
+        if outcome is not None:
+            # Only the branch that is taken is emitted, without testing anything
+            self._scope_depth += 1
+            self.__skip(node.orelse if outcome else node.body)
+            for contents in node.body if outcome else node.orelse:
+                self.visit(contents)
+            self._scope_depth -= 1
+            return
+
         self._scope_depth += 1
-        else_label = self.__label_generator.lookup_or_create(self.__label_id)
-        self.__label_id += 1
-        fi_label = self.__label_generator.lookup_or_create(self.__label_id)
-        self.__label_id += 1
+        else_label = self._new_label()
+        fi_label = self._new_label()
 
         has_else = len(node.orelse) > 0
-        self.__branch_compare(node, None, else_label if has_else else fi_label)
-
-        # Body of true (if) branch
-        for contents in node.body:
-            self.visit(contents)
+        # The arm laid out first branches over the other when done, so the hot one goes second
+        swapped = has_else and self.__profile is not None \
+            and self.__profile.is_hot(then_key(node.lineno), else_key(node.lineno)) \
+            and not self.__reloads_test(node.test, node.body)
+        if swapped:
+            ensure_condition(node.test)
+            self.__branch_if(node.test, True, else_label)
+        else:
+            self.__branch_compare(node, None, else_label if has_else else fi_label)
+        before = self._constant_propagator.snapshot()
+
+        # The arms are visited in source order (names must be declared before they're used),
+        # a hot then-arm is moved after the else-arm once generated
+        start = len(self._instructions)
+        self.__visit_arm(node, node.body)
+        after_body = self._constant_propagator.snapshot()
+        self._constant_propagator.restore(before)
+        then_arm = self._instructions[start:]
+        if swapped:
+            del self._instructions[start:]
+            self.__visit_arm(node, node.orelse)
 
         if has_else:
             self._record_instruction(f'BR {fi_label}')
             self._record_instruction('NOP1', label=else_label)
+            if swapped:
+                self._instructions.extend(then_arm)
+            else:
+                self.__visit_arm(node, node.orelse)
 
-            # Body of false (else) branch
-            for contents in node.orelse:
-                self.visit(contents)
+        # Only values that are the same along both paths are still known
+        self._constant_propagator.merge(after_body)
 
         # Sentinel marker for the end of the loop
         self._record_instruction('NOP1', label=fi_label)
         self._scope_depth -= 1
 
+    def __visit_arm(self, node: ast.If, statements: list[ast.stmt]):
+        if self.__profiling and len(node.orelse) > 0:
+            key = then_key if statements is node.body else else_key
+            self._record_increment(key(node.lineno))
+        for contents in statements:
+            self.visit(contents)
+
+    @property
+    def __profiling(self) -> bool:
+        return self._instrumentation is not None and self._instrumentation.profiling
+
     ####
     # Handling While loops (only variable OP variable)
     ####
 
     def visit_While(self, node: ast.While):
+        if self._constant_propagator.try_propagate_condition(node.test) is False:
+            # The loop is never entered
+            self.__skip(node.body)
+            return
+
+        trip_count = self._constant_propagator.try_propagate_trip_count(node)
+        # Anything assigned in the loop may have any value by the time the condition is tested
+        self._constant_propagator.forget(self._constant_propagator.assigned_names(node.body))
+        always_true = self._constant_propagator.try_propagate_condition(node.test)
+        # The loop may not run at all, so what it assigns is still unknown after it
+        before = self._constant_propagator.snapshot()
+
         self._scope_depth += 1
-        test_label = self.__label_generator.lookup_or_create(self.__label_id)
-        self.__label_id += 1
-        end_label = self.__label_generator.lookup_or_create(self.__label_id)
-        self.__label_id += 1
+        test_label = self._new_label()
+        end_label = self._new_label()
+        if self.__profiling:
+            self._record_increment(loop_entry_key(node.lineno))
+
+        if not always_true and self.__profile is not None \
+                and self.__profile.is_hot(loop_key(node.lineno), loop_entry_key(node.lineno)) \
+                and not self.__reloads_test(node.test, node.body):
+            self.__rotated_while(node, test_label, end_label, trip_count)
+            self._scope_depth -= 1
+            return
+
+        self.__loops[test_label] = LoopInfo(node.lineno, trip_count)
+        if always_true:
+            self._record_instruction('NOP1', label=test_label)
+        else:
+            self.__branch_compare(node, test_label, end_label)
 
-        self.__branch_compare(node, test_label, end_label)
+        if self._instrumentation is not None:
+            self._record_increment(loop_key(node.lineno))
 
         # Body of the loop
         for contents in node.body:
             self.visit(contents)
         self._record_instruction(f'BR {test_label}')
+        self._constant_propagator.restore(before)
 
         # Sentinel marker for the end of the loop
         self._record_instruction('NOP1', label=end_label)
         self._scope_depth -= 1
 
+    @staticmethod
+    def __reloads_test(test: ast.expr, statements: list[ast.stmt]) -> bool:
+        '''
+        Whether the statements start by loading a variable the test compared, which is still in
+        the accumulator when they fall through the test (but not when branched to)
+        '''
+        compared = {comparison.left.id for comparison in ast.walk(test)
+                    if isinstance(comparison, ast.Compare)
+                    and isinstance(comparison.left, ast.Name)}
+        match statements[0]:
+            case ast.AugAssign(target=ast.Name(id=ident)):
+                return ident in compared
+            case ast.Assign(value=value) | ast.Expr(value=value) | ast.If(test=value) \
+                    | ast.While(test=value):
+                # The leftmost operand is loaded first
+                while isinstance(value, (ast.BinOp, ast.Compare, ast.BoolOp, ast.UnaryOp)):
+                    value = value.values[0] if isinstance(value, ast.BoolOp) else \
+                        value.operand if isinstance(value, ast.UnaryOp) else value.left
+                return isinstance(value, ast.Name) and value.id in compared
+        return False
+
+    def __rotated_while(self, node: ast.While, test_label: str, body_label: str,
+                        trip_count: int | None):
+        '''
+        A loop iterating more often than it is entered tests its condition at the bottom, so
+        iterations branch back only while the condition holds (rather than always branching back
+        to the test, and out of the loop once)
+        '''
+        ensure_condition(node.test)
+        self.__loops[body_label] = LoopInfo(node.lineno, trip_count)
+        self._record_instruction(f'BR {test_label}')
+        self._record_instruction('NOP1', label=body_label)
+        if self._instrumentation is not None:
+            self._record_increment(loop_key(node.lineno))
+
+        # Known values at the test are those on entry, whichever way it is reached
+        before = self._constant_propagator.snapshot()
+        for contents in node.body:
+            self.visit(contents)
+        self._constant_propagator.restore(before)
+
+        self._record_instruction('NOP1', label=test_label)
+        self.__branch_if(node.test, True, body_label)
+
+    def __skip(self, statements: list[ast.stmt]):
+        '''Statements that are never executed are not emitted, but still declare their names'''
+        self._variable_names.update(assigned_names(statements))
+
     def visit_FunctionDef(self, node: ast.FunctionDef):
         # Save the function identifier, so we can error on usage of undefined functions
         # TODO: Error checking for function args
@@ -213,6 +474,9 @@ class ProceduralInstructions(ABC, ast.NodeVisitor):
                       subscript: ast.expr | None):
         self.visit(node.value)
         self._variable_names.add(ident)
+        if subscript is None:
+            # Only known once the value is computed, which may read the previous one
+            self._constant_propagator.add_assign(ident, node.value)
 
         if self._should_save:
             self._access_memory(target, 'STWA')
@@ -221,17 +485,72 @@ class ProceduralInstructions(ABC, ast.NodeVisitor):
 
         self._current_variable = None
 
+    def _is_declared(self, ident: str) -> bool:
+        return ident in self._variable_names or ident in self._outer_names
+
+    def _reset_constant_propagation(self):
+        self._constant_propagator = ConstantPropagator(self.__evaluator, self.__constants)
+
+    def _new_label(self) -> str:
+        # Functions and the top level share the label table, so keep their branch labels apart
+        label = self.__label_generator.lookup_or_create((type(self).__name__, self.__label_id))
+        self.__label_id += 1
+        return label
+
     def _record_instruction(self, instruction: str, label: str | None = None):
         self._instructions.append((label, instruction))
 
+    def _record_increment(self, description: str):
+        assert self._instrumentation is not None
+        counter = self._instrumentation.counter(description)
+        for instruction in self._instrumentation.increment(counter):
+            self._record_instruction(instruction)
+
+    def _record_counters(self):
+        '''Print the counters before stopping, if instrumented'''
+        if self._instrumentation is not None:
+            for instruction in self._instrumentation.dump():
+                self._record_instruction(instruction)
+
+    # Map from word instructions to those accessing a single byte
+    __byte_instructions = {
+        'LDWA': 'LDBA',
+        'LDWX': 'LDBX',
+        'STWA': 'STBA',
+    }
+
+    def _access_byte(self, node: ast.Subscript, instruction: str, operand: str, label=None):
+        '''
+        Elements of byte arrays are indexed without scaling and loaded or stored a byte at a time,
+        other instructions use the element through a word below the stack pointer
+        '''
+        if instruction in self.__byte_instructions:
+            self._access_memory(node.slice, 'LDWX')
+            self._record_instruction(f'{self.__byte_instructions[instruction]} {operand}', label)
+            return
+        if instruction == 'DECI':
+            compile_error(node, "Cannot read input into a byte array element")
+        self._record_instruction('STWA -2,s')
+        self._access_memory(node.slice, 'LDWX')
+        self._record_instruction(f'LDBA {operand}')
+        self._record_instruction('STWA -4,s')
+        self._record_instruction('LDWA -2,s')
+        self._record_instruction(f'{instruction} -4,s', label)
+
     @abstractmethod
     def _access_memory(self, node: ast.expr, instruction: str, label=None):
         '''Depending on the context (global or local), memory should be accessed differently'''
         if isinstance(node, ast.Name):
-            if node.id not in self._variable_names:
+            if not self._is_declared(node.id):
                 compile_error(node, f'Use of undeclared identifier "{node.id}"')
 
     @property
     def function_labels(self): return self.__label_generator
 
+    @property
+    def loops(self): return self.__loops
+
+    @property
+    def uses_division(self): return self.__uses_division
+
     def finalize(self): return self._instructions
@@ -0,0 +1,259 @@
+import ast
+from typing import TypeAlias
+from ..common.Utils import is_constant_ident, is_byte_array_ident, to_word, assigned_names
+from .ConstantPropagator import ConstantPropagator, binary_operators, comparison_operators, \
+    unary_operators, is_defined
+
+
+# Values of the variables (and arrays) of a function being evaluated
+_Environment: TypeAlias = dict[str, int | list[int]]
+
+
+class _EvaluationFailed(Exception):
+    """Raised when a call can't be evaluated at compile time (step limit, invalid index, ...)"""
+
+
+class PureFunctionEvaluator:
+    """
+    A bounded interpreter for user functions that only depend on their arguments (no input, output,
+    non-constant globals or global arrays), used to evaluate calls with constant arguments
+    """
+
+    def __init__(self, root: ast.Module, max_steps: int = 10000) -> None:
+        self.__max_steps = max_steps
+        self.__steps = 0
+        self.__functions = {node.name: node for node in root.body
+                            if isinstance(node, ast.FunctionDef)}
+        self.__constants = ConstantPropagator()
+        for node in root.body:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 \
+                    and isinstance(node.targets[0], ast.Name) \
+                    and is_constant_ident(node.targets[0].id):
+                self.__constants.add_assign(node.targets[0].id, node.value)
+        self.__pure = self.__find_pure_functions()
+
+    def __find_pure_functions(self) -> set[str]:
+        # Start by assuming every function is pure, and remove those calling impure ones until
+        # nothing changes (so recursive functions can still be pure)
+        pure = {name for name, func in self.__functions.items() if self.__is_self_contained(func)}
+        changed = True
+        while changed:
+            changed = False
+            for name in list(pure):
+                calls = (node.func.id for node in ast.walk(self.__functions[name])  # type: ignore
+                         if isinstance(node, ast.Call))
+                if any(callee != 'int' and callee not in pure for callee in calls):
+                    pure.remove(name)
+                    changed = True
+        return pure
+
+    def __is_self_contained(self, func: ast.FunctionDef) -> bool:
+        '''Does func only read its own variables and constants, using supported constructs'''
+        local_names = {arg.arg for arg in func.args.args} | assigned_names(func.body)
+
+        for node in ast.walk(func):
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or len(node.keywords) != 0 \
+                        or (node.func.id != 'int' and node.func.id not in self.__functions):
+                    return False
+            elif isinstance(node, ast.Name):
+                if node.id in local_names or node.id in self.__functions or node.id == 'int':
+                    continue
+                if node.id not in self.__constants.propagated_constants:
+                    return False
+            elif not isinstance(node, (ast.FunctionDef, ast.arguments, ast.arg, ast.Assign,
+                                       ast.AugAssign, ast.If, ast.While, ast.Return, ast.Expr,
+                                       ast.Pass, ast.Constant, ast.BinOp, ast.UnaryOp,
+                                       ast.BoolOp, ast.Compare, ast.Subscript, ast.List,
+                                       ast.expr_context, ast.operator, ast.unaryop, ast.boolop,
+                                       ast.cmpop)):
+                return False
+        return True
+
+    def is_pure(self, name: str) -> bool:
+        return name in self.__pure
+
+    def evaluate(self, name: str, args: list[int]) -> int | None:
+        '''The result of calling the pure function name with args, None if it can't be known'''
+        if name not in self.__pure or len(args) != len(self.__functions[name].args.args):
+            return None
+        self.__steps = 0
+        try:
+            return self.__call(name, args, depth=0)
+        except (_EvaluationFailed, RecursionError):
+            return None
+
+    def __step(self):
+        self.__steps += 1
+        if self.__steps > self.__max_steps:
+            raise _EvaluationFailed()
+
+    def __call(self, name: str, args: list[int], depth: int) -> int:
+        if depth > 100:
+            raise _EvaluationFailed()
+        func = self.__functions[name]
+        if len(args) != len(func.args.args):
+            raise _EvaluationFailed()
+        env: _Environment = {arg.arg: value for arg, value in zip(func.args.args, args)}
+        result = self.__run(func.body, env, depth)
+        if result is None:
+            # Using the result of a function that returns nothing
+            raise _EvaluationFailed()
+        return result
+
+    def __run(self, body: list[ast.stmt], env: _Environment, depth: int) -> int | None:
+        for stmt in body:
+            self.__step()
+            if isinstance(stmt, ast.Return):
+                return None if stmt.value is None else self.__scalar(stmt.value, env, depth)
+            elif isinstance(stmt, (ast.Assign, ast.AugAssign)):
+                target: ast.expr
+                if isinstance(stmt, ast.AugAssign):
+                    target = stmt.target
+                    value: int | list[int] = self.__scalar(
+                        ast.BinOp(left=stmt.target, op=stmt.op, right=stmt.value), env, depth)
+                else:
+                    target = stmt.targets[0]
+                    value = self.__value(stmt.value, env, depth)
+                if isinstance(target, ast.Name):
+                    env[target.id] = value
+                elif isinstance(target, ast.Subscript) and isinstance(value, int):
+                    array = self.__array(target.value, env)
+                    index = self.__index(target.slice, array, env, depth)
+                    # Only the low byte is stored in byte arrays
+                    is_bytes = isinstance(target.value, ast.Name) \
+                        and is_byte_array_ident(target.value.id)
+                    array[index] = value & 0xFF if is_bytes else value
+                else:
+                    raise _EvaluationFailed()
+            elif isinstance(stmt, ast.If):
+                branch = stmt.body if self.__test(stmt.test, env, depth) else stmt.orelse
+                result = self.__run(branch, env, depth)
+                if result is not None:
+                    return result
+            elif isinstance(stmt, ast.While):
+                while self.__test(stmt.test, env, depth):
+                    self.__step()
+                    result = self.__run(stmt.body, env, depth)
+                    if result is not None:
+                        return result
+            elif isinstance(stmt, ast.Expr):
+                self.__value(stmt.value, env, depth)
+            elif not isinstance(stmt, ast.Pass):
+                raise _EvaluationFailed()
+        return None
+
+    def __test(self, node: ast.expr, env: _Environment, depth: int) -> bool:
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return not self.__test(node.operand, env, depth)
+        if isinstance(node, ast.BoolOp):
+            # Short-circuits like Python does
+            if isinstance(node.op, ast.And):
+                return all(self.__test(value, env, depth) for value in node.values)
+            return any(self.__test(value, env, depth) for value in node.values)
+        if not isinstance(node, ast.Compare) \
+                or any(type(op) not in comparison_operators for op in node.ops):
+            raise _EvaluationFailed()
+        lhs = self.__scalar(node.left, env, depth)
+        for op, comparator in zip(node.ops, node.comparators):
+            rhs = self.__scalar(comparator, env, depth)
+            if not comparison_operators[type(op)](lhs, rhs):
+                return False
+            lhs = rhs
+        return True
+
+    def __value(self, node: ast.expr, env: _Environment,
+                depth: int) -> int | list[int]:
+        # Arrays are only ever statically initialized, ex. [0] * 25 or [1, 4, 9]
+        if isinstance(node, ast.List):
+            return [self.__scalar(elt, env, depth) for elt in node.elts]
+        if isinstance(node, ast.BinOp) and isinstance(node.left, ast.List):
+            if len(node.left.elts) != 1:
+                raise _EvaluationFailed()
+            size = self.__scalar(node.right, env, depth)
+            return [self.__scalar(node.left.elts[0], env, depth)] * size
+        return self.__scalar(node, env, depth)
+
+    def __scalar(self, node: ast.expr, env: _Environment, depth: int) -> int:
+        self.__step()
+        if isinstance(node, ast.Constant) and isinstance(node.value, int):
+            return node.value
+        elif isinstance(node, ast.Name):
+            value = env.get(node.id, self.__constants.propagated_constants.get(node.id))
+            if not isinstance(value, int):
+                raise _EvaluationFailed()
+            return value
+        elif isinstance(node, ast.BinOp) and type(node.op) in binary_operators:
+            lhs = self.__scalar(node.left, env, depth)
+            rhs = self.__scalar(node.right, env, depth)
+            if not is_defined(node.op, rhs):
+                raise _EvaluationFailed()
+            return to_word(binary_operators[type(node.op)](lhs, rhs))
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in unary_operators:
+            return to_word(unary_operators[type(node.op)](self.__scalar(node.operand, env, depth)))
+        elif isinstance(node, ast.Subscript):
+            array = self.__array(node.value, env)
+            return array[self.__index(node.slice, array, env, depth)]
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            args = [self.__scalar(arg, env, depth) for arg in node.args]
+            if node.func.id == 'int' and len(args) == 1:
+                return args[0]
+            return self.__call(node.func.id, args, depth + 1)
+        raise _EvaluationFailed()
+
+    def __array(self, node: ast.expr, env: _Environment) -> list[int]:
+        array = env.get(node.id) if isinstance(node, ast.Name) else None
+        if not isinstance(array, list):
+            raise _EvaluationFailed()
+        return array
+
+    def __index(self, node: ast.expr, array: list[int], env: _Environment,
+                depth: int) -> int:
+        index = self.__scalar(node, env, depth)
+        if not 0 <= index < len(array):
+            raise _EvaluationFailed()
+        return index
+
+
+class PureCallFolding(ast.NodeTransformer):
+    """Replaces calls to pure functions with constant arguments by their result"""
+
+    def __init__(self, evaluator: PureFunctionEvaluator) -> None:
+        super().__init__()
+        self.__evaluator = evaluator
+        self.__constants = ConstantPropagator()
+
+    def visit_Assign(self, node: ast.Assign):
+        self.generic_visit(node)
+        target = node.targets[0]
+        if isinstance(target, ast.Name) and is_constant_ident(target.id):
+            self.__constants.add_assign(target.id, node.value)
+        return node
+
+    def visit_Expr(self, node: ast.Expr):
+        was_call = isinstance(node.value, ast.Call)
+        self.generic_visit(node)
+        if was_call and isinstance(node.value, ast.Constant):
+            # The call was evaluated, and has no effects
+            return None
+        return node
+
+    def visit_Call(self, node: ast.Call):
+        self.generic_visit(node)
+        if not isinstance(node.func, ast.Name) or not self.__evaluator.is_pure(node.func.id):
+            return node
+
+        args = []
+        for arg in node.args:
+            if isinstance(arg, ast.Constant) and isinstance(arg.value, int):
+                args.append(arg.value)
+            elif isinstance(arg, ast.Name) and arg.id in self.__constants.propagated_constants \
+                    and is_constant_ident(arg.id):
+                args.append(self.__constants.propagated_constants[arg.id])
+            else:
+                return node
+
+        result = self.__evaluator.evaluate(node.func.id, args)
+        if result is None:
+            return node
+        return ast.copy_location(ast.Constant(value=result), node)
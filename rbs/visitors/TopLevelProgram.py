@@ -1,20 +1,35 @@
 import ast
-from ..common.Utils import is_constant_ident, is_array_ident
+from ..common.Utils import is_constant_ident, is_array_ident, is_byte_array_ident
 from ..common.Errors import compile_error
 from ..common.SymbolTable import SymbolTable
 from .ProceduralInstructions import ProceduralInstructions
-from .ConstantPropagator import ConstantPropagator
+from .ConstantPropagator import CallEvaluator
+from ..generators.Instrumentation import Instrumentation
+from ..common.Profile import Profile, run_key
 
 
 class TopLevelProgram(ProceduralInstructions):
     """We supports assignments and input/print calls"""
 
-    def __init__(self, symbol_table: SymbolTable, entry_point: str) -> None:
-        super().__init__(symbol_table)
+    def __init__(self,
+                 symbol_table: SymbolTable,
+                 entry_point: str,
+                 evaluator: CallEvaluator | None = None,
+                 initial_values: dict[str, int] | None = None,
+                 instrumentation: Instrumentation | None = None,
+                 profile: Profile | None = None) -> None:
+        super().__init__(symbol_table, evaluator=evaluator, instrumentation=instrumentation,
+                         profile=profile)
         self._record_instruction('NOP1', label=entry_point)
-        self.__constant_propagator = ConstantPropagator()
+        if instrumentation is not None and instrumentation.profiling:
+            self._record_increment(run_key())
+        # The values global variables are statically initialized with (if known)
+        self.__initial_values = initial_values
 
     def finalize(self):
+        if self._instrumentation is not None:
+            self._record_counters()
+            self._record_instruction('STOP')
         self._instructions.append((None, '.END'))
         return self._instructions
 
@@ -24,6 +39,7 @@ class TopLevelProgram(ProceduralInstructions):
         if is_constant_ident(ident):
             # This variable will be defined with .EQUATE, don't load and store
             self._variable_names.add(ident)
+            self._constant_propagator.add_assign(ident, node.value)
             return
 
         if is_array_ident(ident):
@@ -36,12 +52,14 @@ class TopLevelProgram(ProceduralInstructions):
                 return
         else:
             # Try to propagate constants, it may or may not be possible
-            first_seen_now = ident not in self.__constant_propagator.seen_idents
-            is_constexpr, _, _ = self.__constant_propagator.add_assign(ident, node.value)
+            first_seen_now = ident not in self._constant_propagator.seen_idents
+            is_constexpr, _, value = self._constant_propagator.try_propagate_constant(node.value)
+            is_initial = self.__initial_values is None or self.__initial_values.get(ident) == value
 
-            if first_seen_now and is_constexpr and self._scope_depth == 0:
+            if first_seen_now and is_constexpr and self._scope_depth == 0 and is_initial:
                 # Don't load and store if the value can be statically initialized
                 self._variable_names.add(ident)
+                self._constant_propagator.add_assign(ident, node.value)
                 return
 
         self._assign_store(node, ident, target, subscript)
@@ -51,6 +69,12 @@ class TopLevelProgram(ProceduralInstructions):
         if isinstance(node, ast.Constant):
             self._record_instruction(f'{instruction} {node.value},i', label)
         elif isinstance(node, (ast.Name, ast.Subscript)):
+            if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) \
+                    and is_byte_array_ident(node.value.id):
+                assert self._ident_labels is not None
+                ident_label = self._ident_labels[node.value.id]
+                self._access_byte(node, instruction, f'{ident_label},x', label)
+                return
             if isinstance(node, ast.Subscript):
                 addr_mode = 'x'
                 self._access_memory(node.slice, 'LDWX')
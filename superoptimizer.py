@@ -0,0 +1,92 @@
+import argparse
+import ast
+import json
+from io import StringIO
+from pathlib import Path
+from rbs.Compiler import compile
+from rbs.common.Types import LabeledInstruction
+from rbs.optimizers.Superoptimizer import Superoptimizer, extract_sequences, rewrite_entry
+from rbs.optimizers.passes.Rules import rewrite_table, default_rules
+
+
+def process_cli():
+    """Process Command Line Interface options"""
+    parser = argparse.ArgumentParser(
+        description='Search for cheaper equivalents of frequent instruction sequences')
+    parser.add_argument('paths', nargs='+',
+                        help='programs (.py) or compiled output (.pep), directories are searched')
+    parser.add_argument('-o', default=str(rewrite_table), help='rewrite table to update (.json)')
+    parser.add_argument('--top', type=int, default=50, help='number of sequences to search for')
+    parser.add_argument('--max-length', type=int, default=2,
+                        help='longest replacement to consider')
+    return parser.parse_args()
+
+
+def parse_assembly(text: str) -> list[LabeledInstruction]:
+    instructions: list[LabeledInstruction] = []
+    for line in text.splitlines():
+        if line.strip() == '' or line.lstrip().startswith(';'):
+            continue
+        label, _, instr = line.rpartition(':\t') if not line.startswith('\t') else ('', '', line)
+        instructions.append((label.strip() or None, instr.strip()))
+    return instructions
+
+
+def compiled_instructions(path: Path) -> list[LabeledInstruction]:
+    if path.suffix == '.pep':
+        return parse_assembly(path.read_text())
+    output = StringIO()
+    compile(ast.parse(path.read_text()), str(path), output)
+    return parse_assembly(output.getvalue())
+
+
+def is_covered(sequence: tuple[str, ...], preserves_flags: bool) -> bool:
+    '''
+    Whether a default rule already rewrites part of the sequence, leaving the status bits as they
+    were if need be (rules changing them only apply where they are dead)
+    '''
+    instructions: list[LabeledInstruction] = [(None, instr) for instr in sequence]
+    return any(rule.match(instructions, start) is not None
+               for rule in default_rules if rule.preserves_flags or not preserves_flags
+               for start in range(len(instructions)))
+
+
+def main():
+    args = process_cli()
+    files = []
+    for path in map(Path, args.paths):
+        files += sorted(path.rglob('*.py')) + sorted(path.rglob('*.pep')) if path.is_dir() \
+            else [path]
+
+    instructions: list[LabeledInstruction] = []
+    for f in files:
+        try:
+            instructions += compiled_instructions(f)
+        except SystemExit:
+            # The compile error was already reported, keep going with the other programs
+            continue
+    counts = extract_sequences(instructions)
+
+    table = Path(args.o)
+    entries = json.loads(table.read_text()) if table.exists() else []
+    known = {tuple(entry['pattern']) for entry in entries}
+
+    search = Superoptimizer(max_length=args.max_length)
+    for sequence, count in counts.most_common(args.top):
+        if sequence in known or is_covered(sequence, preserves_flags=True):
+            continue
+        found = search.optimize(sequence)
+        if found is None:
+            continue
+        replacement, preserves_flags = found
+        if is_covered(sequence, preserves_flags):
+            continue
+        print(f'{count:>4}x  {" ; ".join(sequence)}  =>  {" ; ".join(replacement) or "(nothing)"}'
+              f'{"" if preserves_flags else "  (if the status bits are unused)"}')
+        entries.append(rewrite_entry(sequence, replacement, preserves_flags, count))
+
+    table.write_text(json.dumps(entries, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
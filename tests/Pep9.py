@@ -0,0 +1,209 @@
+import ast
+import io
+from rbs.Compiler import compile
+from rbs.common.Types import OptimizationLevel
+
+
+class Pep9():
+    """
+    Runs Pep/9 object code (as --object writes it, or ObjectCode.assemble() returns it), enough of
+    the machine for what the compiler generates. The traps (DECI, DECO, STRO...) are carried out
+    directly rather than through the operating system, reading whole numbers from the inputs given
+    and appending what they print to the output
+    """
+
+    stack_top = 0xFB8F
+
+    def __init__(self, code: bytes, inputs: list[int] | None = None) -> None:
+        self.__memory = bytearray(0x10000)
+        self.__memory[:len(code)] = code
+        self.__inputs = list(inputs or [])
+        self.__a = self.__x = self.__pc = 0
+        self.__sp = self.stack_top
+        self.__n = self.__z = self.__v = self.__c = False
+        self.output = ''
+
+    @classmethod
+    def from_object_file(cls, text: str, inputs: list[int] | None = None) -> 'Pep9':
+        tokens = text.split()
+        assert tokens[-1] == 'zz', 'Object code must end with zz'
+        return cls(bytes(int(token, 16) for token in tokens[:-1]), inputs)
+
+    def run(self, max_steps: int = 10_000_000) -> str:
+        '''Runs until STOP, returning what was printed'''
+        for _ in range(max_steps):
+            if not self.__step():
+                return self.output
+        raise RuntimeError(f'Still running after {max_steps} instructions')
+
+    def __word(self, address: int) -> int:
+        address &= 0xFFFF
+        return self.__memory[address] << 8 | self.__memory[(address + 1) & 0xFFFF]
+
+    def __store_word(self, address: int, value: int):
+        address &= 0xFFFF
+        self.__memory[address] = value >> 8 & 0xFF
+        self.__memory[(address + 1) & 0xFFFF] = value & 0xFF
+
+    def __set_nz(self, value: int):
+        self.__n = value & 0x8000 != 0
+        self.__z = value & 0xFFFF == 0
+
+    def __add(self, left: int, right: int, carry: int = 0) -> int:
+        total = left + right + carry
+        result = total & 0xFFFF
+        self.__c = total > 0xFFFF
+        self.__v = (left ^ result) & (right ^ result) & 0x8000 != 0
+        self.__set_nz(result)
+        return result
+
+    def __address(self, mode: int, operand: int) -> int:
+        '''The address of the operand, for every addressing mode but immediate'''
+        return [0, operand, self.__word(operand), self.__sp + operand,
+                self.__word(self.__sp + operand), operand + self.__x,
+                self.__sp + operand + self.__x,
+                self.__word(self.__sp + operand) + self.__x][mode] & 0xFFFF
+
+    def __step(self) -> bool:
+        spec = self.__memory[self.__pc]
+        self.__pc = (self.__pc + 1) & 0xFFFF
+        if spec == 0x00:
+            return False
+        if spec == 0x01:
+            self.__pc = self.__word(self.__sp)
+            self.__sp = (self.__sp + 2) & 0xFFFF
+        elif 0x06 <= spec < 0x12:
+            self.__unary(spec)
+        elif spec in (0x26, 0x27):
+            # The operating system does nothing for NOP0 and NOP1
+            pass
+        elif spec < 0x12:
+            raise RuntimeError(f'Unsupported instruction {spec:#04x}')
+        else:
+            operand = self.__word(self.__pc)
+            self.__pc = (self.__pc + 2) & 0xFFFF
+            if spec < 0x26:
+                self.__branch(spec, operand)
+            else:
+                self.__general(spec, operand)
+        return True
+
+    def __unary(self, spec: int):
+        value = self.__a if spec % 2 == 0 else self.__x
+        kind = spec & 0xFE
+        if kind == 0x06:  # NOT
+            value = ~value & 0xFFFF
+            self.__set_nz(value)
+        elif kind == 0x08:  # NEG
+            self.__v = value == 0x8000
+            value = -value & 0xFFFF
+            self.__set_nz(value)
+        elif kind == 0x0A:  # ASL
+            self.__c = value & 0x8000 != 0
+            shifted = value << 1 & 0xFFFF
+            self.__v = (value ^ shifted) & 0x8000 != 0
+            value = shifted
+            self.__set_nz(value)
+        elif kind == 0x0C:  # ASR
+            self.__c = value & 1 != 0
+            value = value >> 1 | value & 0x8000
+            self.__set_nz(value)
+        elif kind == 0x0E:  # ROL
+            value, self.__c = (value << 1 & 0xFFFF) | self.__c, value & 0x8000 != 0
+        else:  # ROR
+            value, self.__c = value >> 1 | self.__c << 15, value & 1 != 0
+        if spec % 2 == 0:
+            self.__a = value
+        else:
+            self.__x = value
+
+    def __branch(self, spec: int, operand: int):
+        target = operand if spec % 2 == 0 else self.__word(operand + self.__x)
+        kind = spec & 0xFE
+        if kind == 0x24:  # CALL
+            self.__sp = (self.__sp - 2) & 0xFFFF
+            self.__store_word(self.__sp, self.__pc)
+            self.__pc = target
+            return
+        taken = {0x12: True, 0x14: self.__n or self.__z, 0x16: self.__n, 0x18: self.__z,
+                 0x1A: not self.__z, 0x1C: not self.__n, 0x1E: not (self.__n or self.__z),
+                 0x20: self.__v, 0x22: self.__c}[kind]
+        if taken:
+            self.__pc = target
+
+    def __general(self, spec: int, operand: int):
+        mode = spec & 0x07
+        address = self.__address(mode, operand)
+        word = operand if mode == 0 else self.__word(address)
+        byte = operand & 0xFF if mode == 0 else self.__memory[address]
+        kind = spec & 0xF8
+        if kind == 0x28:  # NOP
+            pass
+        elif kind == 0x30:  # DECI
+            value = self.__inputs.pop(0) & 0xFFFF
+            self.__store_word(address, value)
+            self.__set_nz(value)
+        elif kind == 0x38:  # DECO
+            self.output += str(word - 0x10000 if word & 0x8000 else word)
+        elif kind == 0x40:  # HEXO
+            self.output += f'{word:04X}'
+        elif kind == 0x48:  # STRO
+            while self.__memory[address] != 0:
+                self.output += chr(self.__memory[address])
+                address = (address + 1) & 0xFFFF
+        elif kind == 0x50:  # ADDSP
+            self.__sp = (self.__sp + word) & 0xFFFF
+        elif kind == 0x58:  # SUBSP
+            self.__sp = (self.__sp - word) & 0xFFFF
+        else:
+            self.__register(spec, kind, address, word, byte)
+
+    def __register(self, spec: int, kind: int, address: int, word: int, byte: int):
+        '''Instructions on A (or X, if the fourth bit is set)'''
+        value = self.__x if spec & 0x08 else self.__a
+        kind &= 0xF0
+        if kind == 0x60:  # ADD
+            value = self.__add(value, word)
+        elif kind == 0x70:  # SUB
+            value = self.__add(value, ~word & 0xFFFF, 1)
+        elif kind == 0x80:  # AND
+            value &= word
+            self.__set_nz(value)
+        elif kind == 0x90:  # OR
+            value |= word
+            self.__set_nz(value)
+        elif kind == 0xA0:  # CPW
+            self.__add(value, ~word & 0xFFFF, 1)
+            self.__n ^= self.__v
+            return
+        elif kind == 0xB0:  # CPB
+            difference = (value & 0xFF) - byte
+            self.__n, self.__z, self.__v, self.__c = difference < 0, difference == 0, False, False
+            return
+        elif kind == 0xC0:  # LDW
+            value = word
+            self.__set_nz(value)
+        elif kind == 0xD0:  # LDB
+            value = value & 0xFF00 | byte
+            self.__n, self.__z = False, byte == 0
+        elif kind == 0xE0:  # STW
+            self.__store_word(address, value)
+            return
+        else:  # STB
+            self.__memory[address] = value & 0xFF
+            return
+        if spec & 0x08:
+            self.__x = value
+        else:
+            self.__a = value
+
+
+def run_source(source: str, inputs: list[int], level: OptimizationLevel, **options) -> str:
+    '''
+    Compiles the program into object code (with any other options of compile()) and runs it,
+    returning what it printed
+    '''
+    assembly, object_code = io.StringIO(), io.StringIO()
+    compile(ast.parse(source), 'test.py', assembly, level=level, object_file=object_code,
+            **options)
+    return Pep9.from_object_file(object_code.getvalue(), inputs).run()
@@ -0,0 +1,61 @@
+import pytest
+from rbs.common.Types import OptimizationLevel
+from Pep9 import run_source
+
+levels = list(OptimizationLevel)
+
+
+@pytest.mark.parametrize('level', levels)
+@pytest.mark.parametrize('shift, n, output', [
+    ('k = 12 >> k', 1, '1'), ('k = 12 >> k', 0, '3'), ('k = 1 << k', 1, '8'),
+    ('k = k << k', 1, '24'), ('k >>= k', 1, '0'),
+])
+def test_shift_by_target(level, shift: str, n: int, output: str):
+    # The count is the value from before the assignment
+    source = f'n = int(input())\nk = 3\nif n > 0:\n    {shift}\nprint(k)\n'
+    assert run_source(source, [n], level) == output
+
+
+@pytest.mark.parametrize('level', levels)
+def test_shift_by_target_in_function(level):
+    source = '\n'.join([
+        'def f(a):',
+        '    s = 2',
+        '    if a > 0:',
+        '        s = 1 << s',
+        '    return s',
+        'n = int(input())',
+        'r = f(n)',
+        'print(r)',
+    ]) + '\n'
+    assert run_source(source, [1], level) == '4'
+
+
+zero_trip_loop = [
+    'x = 5',
+    'i = 0',
+    'while i < n:',
+    '    x = 3',
+    '    i = i + 1',
+    'if x == 5:',
+    '    r = 1',
+    'else:',
+    '    r = 2',
+]
+
+
+@pytest.mark.parametrize('level', levels)
+@pytest.mark.parametrize('n, output', [(0, '1'), (2, '2')])
+def test_loop_running_zero_times(level, n: int, output: str):
+    # Values assigned in the loop are unknown after it, since it may not run
+    source = '\n'.join(['n = int(input())', *zero_trip_loop, 'print(r)']) + '\n'
+    assert run_source(source, [n], level) == output
+
+
+@pytest.mark.parametrize('level', levels)
+@pytest.mark.parametrize('n, output', [(0, '1'), (2, '2')])
+def test_loop_running_zero_times_in_function(level, n: int, output: str):
+    body = [f'    {line}' for line in zero_trip_loop]
+    source = '\n'.join(['def f(n):', *body, '    return r',
+                        'n = int(input())', 'v = f(n)', 'print(v)']) + '\n'
+    assert run_source(source, [n], level) == output
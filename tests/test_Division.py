@@ -0,0 +1,82 @@
+import pytest
+from rbs.common.Types import OptimizationLevel
+from rbs.common.Utils import to_word
+from Pep9 import run_source
+
+levels = list(OptimizationLevel)
+
+# Every combination of signs, exact divisions, and the most negative word on either side
+operands = [
+    (7, 2), (-7, 2), (7, -2), (-7, -2), (6, 3), (-6, 3), (6, -3), (0, 5), (0, -5), (1, 7),
+    (-1, 7), (1, -7), (32767, 2), (32767, -1), (-32767, 2), (-32768, 1), (-32768, -1),
+    (-32768, 2), (-32768, -2), (-32768, 3), (-32768, -3), (-32768, 32767), (32767, -32768),
+    (-32768, -32768), (5, -32768), (-5, -32768), (-1, -32768),
+]
+
+
+def printed(a: int, b: int) -> str:
+    '''What the program prints for the quotient and remainder, as Python computes them'''
+    return str(to_word(a // b)) + str(to_word(a % b))
+
+
+@pytest.mark.parametrize('level', levels)
+@pytest.mark.parametrize('a, b', operands)
+def test_floor_division_and_remainder(level, a, b):
+    source = 'a = int(input())\nb = int(input())\nq = a // b\nr = a % b\nprint(q)\nprint(r)\n'
+    assert run_source(source, [a, b], level) == printed(a, b)
+
+
+@pytest.mark.parametrize('level', levels)
+def test_division_in_functions(level):
+    # Locals are divided through the same routine, which must leave the stack as it found it
+    source = '\n'.join([
+        'def mod(a, b):',
+        '    r = a % b',
+        '    return r',
+        'def div(a, b):',
+        '    q = a // b',
+        '    return q',
+        'x = int(input())',
+        'y = int(input())',
+        'q = div(x, y)',
+        'r = mod(x, y)',
+        'h = div(r, 2)',
+        'print(q)',
+        'print(r)',
+        'print(h)',
+    ]) + '\n'
+    assert run_source(source, [-23, 5], level) == '-521'
+
+
+@pytest.mark.parametrize('level', levels)
+@pytest.mark.parametrize('a, b', [(7, 2), (-7, 2), (7, -2), (-7, -2), (-32767, 3)])
+def test_folded_division_matches_routine(level, a, b):
+    # Constants are divided at compile time, rounding the same way as the routine
+    source = f'q = ({a}) // ({b})\nr = ({a}) % ({b})\nprint(q)\nprint(r)\n'
+    assert run_source(source, [], level) == printed(a, b)
+
+
+@pytest.mark.parametrize('level', levels)
+@pytest.mark.parametrize('division, n, output', [
+    ('c = 64 // c', 1, '32'), ('c = 64 // c', 0, '2'), ('c = 65 % c', 1, '1'),
+    ('c = 0 // c', 1, '0'), ('c //= c', 1, '1'),
+])
+def test_divide_by_target(level, division: str, n: int, output: str):
+    # The divisor is the value from before the assignment
+    source = '\n'.join([
+        'def f(a):',
+        '    c = 2',
+        '    if a > 0:',
+        f'        {division}',
+        '    return c',
+        'n = int(input())',
+        'r = f(n)',
+        'print(r)',
+    ]) + '\n'
+    assert run_source(source, [n], level) == output
+
+
+@pytest.mark.parametrize('level', levels)
+def test_divide_zero_by_target(level):
+    # Dividing by the old value (7), not the new one (0)
+    assert run_source('b = 7\nb = 0 // b\nprint(b)\n', [], level) == '0'
@@ -0,0 +1,90 @@
+import io
+import re
+from pathlib import Path
+import pytest
+from rbs.common.Types import LabeledInstruction, OptimizationLevel
+from rbs.generators.ObjectCode import ObjectCode
+from Pep9 import run_source
+
+# Assembly listings of a few samples, next to the object files the Pep/9 assembler makes of them
+listings = sorted(Path(__file__).parent.joinpath('object_code').glob('*.pep'))
+
+
+def parse_listing(text: str) -> list[LabeledInstruction]:
+    '''The labeled instructions of a .pep file, as the compiler writes them'''
+    instructions: list[LabeledInstruction] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line == '' or line.startswith(';'):
+            continue
+        labeled = re.match(r'([A-Za-z_][A-Za-z0-9_]*):\s*(.*)', line)
+        if labeled is not None:
+            instructions.append((labeled.group(1), labeled.group(2)))
+        else:
+            instructions.append((None, line))
+    return instructions
+
+
+def object_file(instructions: list[LabeledInstruction]) -> str:
+    object_code = ObjectCode()
+    object_code.add(instructions)
+    output = io.StringIO()
+    object_code.generate(output)
+    return output.getvalue()
+
+
+def test_encodings():
+    # Assembled by hand from the Pep/9 instruction set
+    instructions: list[LabeledInstruction] = [
+        ('start', 'LDWA 0x1234,i'),          # C0 12 34
+        (None, 'LDWX size,d ; comment'),     # C9 00 1A
+        (None, 'STWA -2,s'),                 # E3 FF FE
+        (None, 'LDBA table,x'),              # D5 00 2E
+        (None, 'ADDA 4,sx'),                 # 66 00 04
+        (None, 'SUBA 6,sf'),                 # 74 00 06
+        (None, 'CPWA 8,sfx'),                # A7 00 08
+        (None, 'DECO data,n'),               # 3A 00 25
+        (None, 'ASLA'),                      # 0A
+        (None, 'NEGX'),                      # 09
+        (None, 'BRLT start'),                # 16 00 00
+        (None, 'BR table,x'),                # 13 00 2E
+        (None, 'CALL start'),                # 24 00 00
+        (None, 'RET'),                       # 01
+        (None, 'STOP'),                      # 00
+        ('size', '.EQUATE 26'),
+        ('data', '.WORD -1'),                # FF FF
+        (None, '.BYTE 0x41'),                # 41
+        (None, ".BYTE 'B'"),                 # 42
+        (None, '.ASCII "a;b\\n\\x00"'),      # 61 3B 62 0A 00
+        ('table', '.BLOCK 3'),               # 00 00 00
+        (None, '.END'),
+    ]
+    assert object_file(instructions) == (
+        'C0 12 34 C9 00 1A E3 FF FE D5 00 2E 66 00 04 74\n'
+        '00 06 A7 00 08 3A 00 25 0A 09 16 00 00 13 00 2E\n'
+        '24 00 00 01 00 FF FF 41 42 61 3B 62 0A 00 00 00\n'
+        '00 zz\n')
+
+
+def test_full_last_line():
+    # zz goes on a line of its own when the last one is full
+    assert object_file([(None, '.BLOCK 16')]) == '00 ' * 15 + '00\nzz\n'
+
+
+@pytest.mark.parametrize('listing', listings, ids=[listing.stem for listing in listings])
+def test_sample_listings(listing: Path):
+    expected = listing.with_suffix('.pepo').read_text()
+    assert object_file(parse_listing(listing.read_text())) == expected
+
+
+@pytest.mark.parametrize('level', list(OptimizationLevel))
+@pytest.mark.parametrize('sample, inputs, output', [
+    ('1_global/simple.py', [], '5'),
+    ('3_conditionals/gcd_mod.py', [84, 36], '12'),
+    ('4_function_calls/fib_rec.py', [12], '144'),
+    ('5_arrays/eratosthenes_bytes.py', [30], '2357111317192329'),
+    ('5_arrays/fibo_cached.py', [20], '6765'),
+])
+def test_samples_run(level, sample: str, inputs: list[int], output: str):
+    source = Path(__file__).parent.parent.joinpath('_samples', sample).read_text()
+    assert run_source(source, inputs, level) == output
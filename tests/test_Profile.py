@@ -0,0 +1,48 @@
+import pytest
+from rbs.common.Profile import Profile
+from rbs.common.Types import OptimizationLevel
+from Pep9 import run_source
+
+levels = list(OptimizationLevel)
+
+# Programs and their inputs, the profile comes from running them with the same inputs
+programs = [
+    # The then-arm is hot and laid out second, but declares what the else-arm prints
+    ('\n'.join([
+        'n = int(input())',
+        'i = 0',
+        'while i < 3:',
+        '    if i != 1:',
+        '        x = n',
+        '    else:',
+        '        print(x)',
+        '    i = i + 1',
+    ]), [7], '7'),
+    ('\n'.join([
+        'def f(a):',
+        '    r = 0',
+        '    if a > 2:',
+        '        r = a - 2',
+        '    else:',
+        '        r = a + 10',
+        '    return r',
+        'n = int(input())',
+        'i = 0',
+        's = 0',
+        'while i < n:',
+        '    v = f(i)',
+        '    s = s + v',
+        '    i = i + 1',
+        'print(s)',
+    ]), [8], '48'),
+]
+
+
+@pytest.mark.parametrize('level', levels)
+@pytest.mark.parametrize('source, inputs, output', programs,
+                         ids=['declared_in_hot_arm', 'hot_call'])
+def test_profile_round_trip(level, source: str, inputs: list[int], output: str):
+    printed = run_source(source + '\n', inputs, level, profile_generate=True)
+    assert printed.startswith(output + 'profile:\n')
+    profile = Profile.parse(printed)
+    assert run_source(source + '\n', inputs, level, profile=profile) == output
@@ -25,16 +25,16 @@ fi
 
 
 asm_fn=$(mktemp)
-obj_fn=$(mktemp)
+obj_fn="${src_fn%.py}.pepo"
 out_fn=$(mktemp)
 
 # Pipenv is so unbearably slow, run python itself
 # pipenv run python translator.py -f $src_fn > $asm_fn
-python3 translator.py -f $src_fn > $asm_fn
+# The object code is assembled along with the assembly, next to the source
+python3 translator.py --object -f $src_fn > $asm_fn
 # cat $asm_fn
 # exit 0
 
-pep9term asm -s $asm_fn -o $obj_fn
 pep9term run -s $obj_fn -i $inp_fn -o $out_fn
 
 cat $asm_fn
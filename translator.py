@@ -1,26 +1,331 @@
 import argparse
 import ast
+import json
+import os
+import socket
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from functools import lru_cache
+from io import StringIO
+from pathlib import Path
+from time import perf_counter, sleep
 from rbs.Compiler import compile
+from rbs.common.Types import OptimizationLevel
+from rbs.common.CompileCache import CompileCache, default_cache_directory
+from rbs.common.Profile import Profile
 
 
-def process_cli():
-    """"Process Command Line Interface options"""
+def default_socket() -> str:
+    '''Where the compile server listens, unless told otherwise (same as translator_client.py)'''
+    return os.environ.get('RBS_SOCKET') or \
+        os.path.join(tempfile.gettempdir(), f'rbs-{os.getuid()}.sock')
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument('-f', help='filename to compile (.py)')
+    parser.add_argument('paths', nargs='*',
+                        help='programs (.py) or directories to compile in batch, each into a .pep '
+                             'file next to it')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of processes compiling in batch (default: one per CPU)')
     parser.add_argument('--ast-only', default=False, action='store_true')
-    args = vars(parser.parse_args())
-    return args['f'], args['ast_only']
+    parser.add_argument('-O', dest='level', default='2',
+                        choices=[level.value for level in OptimizationLevel],
+                        help='optimization level: -O0 (constant folding only), -O1, -O2 (speed) or '
+                             '-Os (size)')
+    parser.add_argument('--pass-stats', default=False, action='store_true',
+                        help='print what each optimization pass achieved to stderr')
+    parser.add_argument('--memory-report', default=False, action='store_true',
+                        help='print code, data and worst case stack sizes to stderr')
+    parser.add_argument('--instrument', default=False, action='store_true',
+                        help='count function calls and loop iterations, printed before stopping')
+    parser.add_argument('--profile-generate', default=False, action='store_true',
+                        help='count how often each branch, loop and call runs, printed before '
+                             'stopping (save the output for --profile-use)')
+    parser.add_argument('--profile-use', metavar='FILE',
+                        help='lay out branches and loops, and inline calls, for the counts a '
+                             '--profile-generate build printed into FILE')
+    parser.add_argument('--cycle-estimate', default=False, action='store_true',
+                        help='print the estimated cycles of every function and loop to stderr')
+    parser.add_argument('--object', default=False, action='store_true',
+                        help='also assemble each program into a Pep/9 object file (.pepo) next to '
+                             'it, ready to run without pep9term asm')
+    parser.add_argument('--cache-dir', default=str(default_cache_directory()),
+                        help='where compiled programs and functions are cached')
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help='megabytes the cache may use before evicting the least recently used')
+    parser.add_argument('--no-cache', default=False, action='store_true',
+                        help='always compile from scratch')
+    parser.add_argument('--serve', nargs='?', const=default_socket(), metavar='SOCKET',
+                        help='stay resident, compiling programs sent by translator_client.py')
+    parser.add_argument('--watch', default=False, action='store_true',
+                        help='recompile the programs in paths whenever they are saved')
+    parser.add_argument('--interval', type=float, default=0.25,
+                        help='seconds between checks for changed files when watching')
+    return parser
 
 
-def main():
-    input_file, print_ast = process_cli()
-    with open(input_file) as f:
+def process_cli():
+    """Process Command Line Interface options"""
+    parser = build_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    return parser, args
+
+
+def check_args(parser: argparse.ArgumentParser, args):
+    if args.f is None and len(args.paths) == 0 and args.serve is None:
+        parser.error('a file to compile (-f) or paths to compile in batch are required')
+
+
+def compile_options(args) -> dict:
+    '''Keyword arguments of compile() selected on the command line'''
+    return {'level': OptimizationLevel(args.level), 'pass_stats': args.pass_stats,
+            'memory_report': args.memory_report, 'instrument': args.instrument,
+            'cycle_estimate': args.cycle_estimate, 'profile_generate': args.profile_generate,
+            'profile': load_profile(args.profile_use) if args.profile_use is not None else None}
+
+
+def load_profile(path: str) -> Profile:
+    try:
+        return Profile.parse(Path(path).read_text())
+    except (OSError, ValueError) as error:
+        sys.exit(f'{path}: {error}')
+
+
+def cache_settings(args) -> tuple[str, int] | None:
+    '''Where and how large the cache is, None if it shouldn't be used'''
+    # Reports are printed while compiling, which cached programs aren't
+    if args.no_cache or args.pass_stats or args.memory_report or args.cycle_estimate:
+        return None
+    return args.cache_dir, args.cache_size * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def open_cache(directory: str, max_bytes: int) -> CompileCache:
+    '''One cache per process, so its size is only measured once'''
+    return CompileCache(Path(directory), max_bytes)
+
+
+def compile_source(source: str, input_file: str, output, options: dict,
+                   settings: tuple[str, int] | None, object_output=None) -> bool:
+    '''
+    Compiles source into output (and the object code into object_output, if any), returns whether
+    the cached result was used
+    '''
+    if settings is None:
+        compile(ast.parse(source, input_file), input_file, output, object_file=object_output,
+                **options)
+        return False
+    cache = open_cache(*settings)
+    key = cache.key('program', input_file, repr(sorted(options.items())), source)
+    object_key = cache.key('object', key)
+    cached = cache.get(key)
+    cached_object = cache.get(object_key) if object_output is not None and cached is not None \
+        else ''
+    if cached is not None and cached_object is not None:
+        output.write(cached)
+        if object_output is not None:
+            object_output.write(cached_object)
+        return True
+    compiled = StringIO()
+    compiled_object = StringIO() if object_output is not None else None
+    compile(ast.parse(source, input_file), input_file, compiled, cache=cache,
+            object_file=compiled_object, **options)
+    cache.put(key, compiled.getvalue())
+    output.write(compiled.getvalue())
+    if compiled_object is not None:
+        cache.put(object_key, compiled_object.getvalue())
+        object_output.write(compiled_object.getvalue())
+    return False
+
+
+def batch_files(paths: list[str]) -> list[Path]:
+    files: list[Path] = []
+    for path in map(Path, paths):
+        files += sorted(path.rglob('*.py')) if path.is_dir() else [path]
+    return files
+
+
+def compile_file(path: Path, options: dict, settings: tuple[str, int] | None,
+                 object_code: bool = False) -> tuple[str | None, float, str]:
+    '''
+    Compiles a program into a .pep file next to it (and a .pepo file, if assembling the object
+    code), left untouched if compilation fails. Returns how it went (None if it failed), the time
+    it took and whatever was reported to stderr
+    '''
+    start = perf_counter()
+    diagnostics = StringIO()
+    output = StringIO()
+    object_output = StringIO() if object_code else None
+    status: str | None = None
+    with redirect_stderr(diagnostics):
+        try:
+            cached = compile_source(path.read_text(), str(path), output, options, settings,
+                                    object_output)
+            status = 'cached' if cached else 'compiled'
+        except SystemExit:
+            # The compile error was already reported
+            pass
+        except (OSError, SyntaxError) as error:
+            print(error, file=diagnostics)
+    if status is not None:
+        path.with_suffix('.pep').write_text(output.getvalue())
+        if object_output is not None:
+            path.with_suffix('.pepo').write_text(object_output.getvalue())
+    return status, perf_counter() - start, diagnostics.getvalue()
+
+
+def compile_batch(files: list[Path], options: dict, settings: tuple[str, int] | None,
+                  jobs: int, object_code: bool = False) -> bool:
+    '''Compiles every file across a pool of processes, reporting timings as they finish'''
+    start = perf_counter()
+    if jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(compile_file, files, [options] * len(files),
+                                   [settings] * len(files), [object_code] * len(files),
+                                   chunksize=max(1, len(files) // (4 * jobs)))
+            failed, busy = report_batch(files, results)
+    else:
+        failed, busy = report_batch(files, (compile_file(f, options, settings, object_code)
+                                            for f in files))
+
+    print(f'Compiled {len(files) - failed} of {len(files)} files in '
+          f'{perf_counter() - start:.2f}s ({busy:.2f}s compiling, {jobs} processes)',
+          file=sys.stderr)
+    return failed == 0
+
+
+def report_batch(files: list[Path], results) -> tuple[int, float]:
+    '''Prints the timing of every file, returns how many failed and the total time compiling'''
+    failed = 0
+    busy = 0.0
+    for path, (status, seconds, diagnostics) in zip(files, results):
+        busy += seconds
+        outcome = f'-> {path.with_suffix(".pep")} ({status})' if status is not None else 'FAILED'
+        print(f'{seconds * 1000:>8.1f}ms  {path} {outcome}', file=sys.stderr)
+        for line in diagnostics.splitlines():
+            print(f'{"":<12}{line}', file=sys.stderr)
+        failed += status is None
+    return failed, busy
+
+
+def watch(paths: list[str], options: dict, settings: tuple[str, int] | None, interval: float,
+          object_code: bool = False):
+    '''Recompiles programs (and new ones in the directories) whenever they are saved'''
+    print(f'Watching {", ".join(paths)}, interrupt to stop', file=sys.stderr)
+    modified: dict[Path, int] = {}
+    try:
+        while True:
+            changed = []
+            for path in batch_files(paths):
+                try:
+                    mtime = path.stat().st_mtime_ns
+                except OSError:
+                    # Deleted (or being replaced by an editor) in the meantime
+                    continue
+                if modified.get(path) != mtime:
+                    modified[path] = mtime
+                    changed.append(path)
+            if changed:
+                report_batch(changed, (compile_file(path, options, settings, object_code)
+                                       for path in changed))
+            sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(socket_path: str, parser: argparse.ArgumentParser):
+    '''
+    Compiles the programs requested over a Unix socket, so the interpreter starts and the compiler
+    is imported (and warmed up) only once. Each request is a JSON line with the client's command
+    line arguments and working directory, the reply holds what it printed and its exit status
+    '''
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        print(f'Serving on {socket_path}, interrupt to stop', file=sys.stderr)
+        try:
+            while True:
+                connection, _ = server.accept()
+                with connection:
+                    handle_request(connection, parser)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+def handle_request(connection: socket.socket, parser: argparse.ArgumentParser):
+    start = perf_counter()
+    argv: list[str] = []
+    stdout, stderr = StringIO(), StringIO()
+    status = 0
+    cwd = os.getcwd()
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            with connection.makefile('r') as stream:
+                request = json.loads(stream.readline())
+            argv = request['argv']
+            os.chdir(request['cwd'])
+            args = parser.parse_args(argv)
+            if args.serve is not None or args.watch:
+                parser.error('--serve and --watch are not available through the server')
+            check_args(parser, args)
+            run(args)
+        except SystemExit as error:
+            status = error.code if isinstance(error.code, int) else 1
+        except Exception as error:
+            # Keep serving other requests (including malformed ones)
+            print(f'{type(error).__name__}: {error}', file=stderr)
+            status = 1
+        finally:
+            os.chdir(cwd)
+    reply = json.dumps({'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(),
+                        'status': status})
+    try:
+        connection.sendall(reply.encode())
+    except OSError:
+        # The client is gone, there is nobody left to reply to
+        pass
+    print(f'{(perf_counter() - start) * 1000:>8.1f}ms  {" ".join(argv)}', file=sys.stderr)
+
+
+def run(args):
+    options = compile_options(args)
+    settings = cache_settings(args)
+    if args.watch:
+        watch(args.paths + ([args.f] if args.f is not None else []), options, settings,
+              args.interval, args.object)
+        return
+    if len(args.paths) > 0:
+        files = batch_files(args.paths + ([args.f] if args.f is not None else []))
+        jobs = max(1, args.jobs or 1)
+        sys.exit(0 if compile_batch(files, options, settings, jobs, args.object) else 1)
+
+    with open(args.f) as f:
         source = f.read()
-    node = ast.parse(source)
-    if print_ast:
-        print(ast.dump(node, indent=2))
+    if args.ast_only:
+        print(ast.dump(ast.parse(source), indent=2))
+    elif args.object:
+        object_output = StringIO()
+        compile_source(source, args.f, sys.stdout, options, settings, object_output)
+        Path(args.f).with_suffix('.pepo').write_text(object_output.getvalue())
+    else:
+        compile_source(source, args.f, sys.stdout, options, settings)
+
+
+def main():
+    parser, args = process_cli()
+    if args.serve is not None:
+        serve(args.serve, parser)
     else:
-        compile(node, input_file)
+        run(args)
 
 
 if __name__ == '__main__':
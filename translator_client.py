@@ -0,0 +1,45 @@
+import json
+import os
+import socket
+import sys
+import tempfile
+
+
+# Only the standard library is imported, so starting the client is as fast as starting Python
+
+
+def default_socket() -> str:
+    '''Where the compile server listens, unless told otherwise (same as translator.py)'''
+    return os.environ.get('RBS_SOCKET') or \
+        os.path.join(tempfile.gettempdir(), f'rbs-{os.getuid()}.sock')
+
+
+def main():
+    """Sends the command line to a compile server (translator.py --serve), printing its reply"""
+    argv = sys.argv[1:]
+    if len(argv) == 0 or argv[0] in ('-h', '--help'):
+        print(f'Usage: {sys.argv[0]} [translator.py options], with the server started by '
+              'translator.py --serve [SOCKET] (RBS_SOCKET overrides where both connect)',
+              file=sys.stderr)
+        sys.exit(2)
+
+    request = json.dumps({'argv': argv, 'cwd': os.getcwd()}) + '\n'
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(default_socket())
+            client.sendall(request.encode())
+            client.shutdown(socket.SHUT_WR)
+            with client.makefile() as stream:
+                reply = json.loads(stream.read())
+    except OSError as error:
+        print(f'Cannot reach the compile server at {default_socket()} ({error}), '
+              'start it with translator.py --serve', file=sys.stderr)
+        sys.exit(2)
+
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    sys.exit(reply['status'])
+
+
+if __name__ == '__main__':
+    main()